@@ -4,16 +4,22 @@ from loguru import logger
 from mangrove import (
     VADStage,
     STTStage,
+    KeywordSpottingStage,
+    WakeWordStage,
     BotStage,
     TTSStage,
 )
 from storage_manager import StorageManager
 from core import AudioBuffer
+from core.utils import ModelRegistry
 from core.stage import PipelineSequence
 
 # TODO check on this later
 warnings.filterwarnings("ignore", category=UserWarning)
 
+# short commands decoded by smaller models, up to 2 s and 5 s of speech
+STT_CASCADE = [("tiny.en", 2000), ("base.en", 5000)]
+
 class BasicConversationalAgent(PipelineSequence):
     """Agent controller for the conversational AI server."""
 
@@ -22,27 +28,110 @@ class BasicConversationalAgent(PipelineSequence):
         device=None,
         bot_endpoint="openai",
         tts_endpoint="gtts",
+        stt_batch_window_ms=None,
+        stt_streaming=False,
+        stt_chunking=False,
+        stt_cache=False,
+        stt_cascade=False,
+        vad_endpoint="silero",
+        vad_backend="torch",
+        adaptive_endpointing=False,
+        utterance_compaction=False,
+        keyword_spotting=False,
+        wake_word=None,
         welcome_msg: str="Welcome, AI server connection is succesful.",
         verbose=False,
     ):
         super().__init__(verbose=verbose)
 
-        vad = VADStage(device=device)
-        stt = STTStage(device=device)
+        wake = None
+        if wake_word is not None:
+            # nothing reaches VAD, STT or the bot until the wake word is spoken
+            wake = WakeWordStage(wake_word=wake_word, device=device)
+        vad = VADStage(
+            device=device,
+            endpoint=vad_endpoint,
+            # webrtc alone has no model backend
+            endpoint_kwargs={"backend": vad_backend} if vad_endpoint != "webrtc" else {},
+            adaptive_endpointing=adaptive_endpointing,
+            compaction=utterance_compaction,
+            # partial chunks of the utterance being spoken, transcribed incrementally or split at its pauses
+            stream_interval_ms=500 if stt_streaming or stt_chunking else None,
+        )
+        stt = STTStage(
+            device=device,
+            endpoint_kwargs={
+                "batch_window_ms": stt_batch_window_ms,
+                "streaming": stt_streaming,
+                "chunking": stt_chunking,
+                "cache": stt_cache,
+                "cascade": STT_CASCADE if stt_cascade else None,
+            },
+        )
         bot = BotStage(endpoint=bot_endpoint)
+        kws = None
+        if keyword_spotting:
+            # the persona's actions spoken as single keywords skip STT decoding and the LLM
+            kws = KeywordSpottingStage(commands=bot.persona.spoken_commands, device=device)
         tts = TTSStage(endpoint=tts_endpoint)
         self.startup_audiopacket = None
         if welcome_msg:
-            self.startup_audiopacket = tts.read(
-                welcome_msg,
-                as_generator=False
+            # synthesized once per process, every session plays a copy of it
+            self.startup_audiopacket = ModelRegistry.get(
+                ("welcome_audio", tts_endpoint, welcome_msg),
+                lambda: tts.read(welcome_msg, as_generator=False),
             )
 
+        if wake is not None:
+            self.add_stage(wake)
         self.add_stage(vad)
+        if kws is not None:
+            self.add_stage(kws)
         self.add_stage(stt)
         self.add_stage(bot)
         self.add_stage(tts)
 
+    @staticmethod
+    def preload_models(
+        device=None,
+        bot_endpoint="openai",
+        tts_endpoint="gtts",
+        stt_cascade=False,
+        vad_endpoint="silero",
+        vad_backend="torch",
+        keyword_spotting=False,
+        wake_word=None,
+        **kwargs,
+    ) -> None:
+        """Load the models shared by the agents built with the same arguments, without building a pipeline
+
+        Every call hits the ModelRegistry with the key the stage's endpoint uses, so the sessions find them loaded.
+        """
+        import torch
+        stage_device = device if device is not None else ("cuda" if torch.cuda.is_available() else "cpu")
+
+        if wake_word is not None or keyword_spotting:
+            from mangrove.stt.wakeup_word.audio_classification_endpoint import HFAudioClassificationEndpoint
+            HFAudioClassificationEndpoint.load_classifier(device=stage_device)
+        if vad_endpoint != "webrtc":
+            from mangrove.vad.endpoints.silero import SileroVAD
+            SileroVAD.load_service(backend=vad_backend, device=device)
+
+        from mangrove.stt.endpoints.faster_whisper import FasterWhisperEndpoint
+        FasterWhisperEndpoint.load_model(device=stage_device)
+        for model_name, _ in STT_CASCADE if stt_cascade else []:
+            FasterWhisperEndpoint.load_model(model_name, device=stage_device)
+
+        if bot_endpoint == "openai":
+            from mangrove.bot.persona.protector_of_mangrove import ProtectorOfMangrove
+            ProtectorOfMangrove.load_vectorstore()
+        elif bot_endpoint == "ollama":
+            from mangrove.bot.persona.protector_of_mangrove_nemotron import ProtectorOfMangroveNemotron
+            ProtectorOfMangroveNemotron.load_vectorstore()
+        if tts_endpoint == "xtts":
+            from mangrove.tts.endpoints.xtts import TTSLibraryEndpoint
+            TTSLibraryEndpoint.load_model()
+
     def on_start(self):
         super().on_start()
         self.session_audio_buffer = AudioBuffer()
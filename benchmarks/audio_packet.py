@@ -0,0 +1,35 @@
+import numpy as np
+from core import AudioPacket
+from .harness import average_ms
+
+
+def bench_ingest(num_channels, sample_width, as_list=False, frames_per_buffer=1024, sample_rate=48000, repeat=200):
+    """Return the average time in ms to build an AudioPacket from one interleaved buffer"""
+    samples = np.random.uniform(-0.5, 0.5, frames_per_buffer * num_channels).astype(np.float32)
+    if sample_width == 2:
+        samples = (samples * (1 << 15)).astype(np.int16)
+    buffer = samples.tolist() if as_list else samples.tobytes()
+
+    return average_ms(
+        lambda i: AudioPacket(
+            {
+                "bytes": buffer,
+                "sampleRate": sample_rate,
+                "numChannels": num_channels,
+                "sampleWidth": sample_width,
+                "timestamp": i,
+            },
+            resample=False,
+        ),
+        repeat,
+    )
+
+
+print("Benchmarking AudioPacket ingest (1024 frames per packet, no resampling) ...")
+for num_channels in [1, 2, 8]:
+    for sample_width, name in [(2, "int16"), (4, "float32")]:
+        for as_list in [False, True]:
+            cost = bench_ingest(num_channels, sample_width, as_list=as_list)
+            source = "list " if as_list else "bytes"
+            print(f"{num_channels} ch {name:7s} {source}: {cost:.4f} ms/packet")
+print("Benchmarking AudioPacket ingest Done!")
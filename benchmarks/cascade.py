@@ -0,0 +1,60 @@
+import argparse
+import collections
+import numpy as np
+from mangrove.stt.endpoints.faster_whisper import FasterWhisperEndpoint
+from .harness import bucket_of, find_recordings, segment_utterances, sorted_buckets, transcribe_ms
+
+parser = argparse.ArgumentParser(
+    description="Transcription time of VAD segmented utterances with one whisper model and with a cascade of models"
+)
+parser.add_argument("wavs", nargs="*", help="Recorded turns (wav), defaults to the recordings in the commands cache")
+parser.add_argument("--model_name", default="distil-medium.en", help="Model of the baseline and last tier")
+parser.add_argument("--tiers", nargs="+", default=["tiny.en:2000", "base.en:5000"], help="Smaller tiers, model:max_ms")
+parser.add_argument("--min_avg_logprob", type=float, default=-0.6)
+parser.add_argument("--max_no_speech_prob", type=float, default=0.5)
+parser.add_argument("--device", default="cpu")
+parser.add_argument("--buckets", nargs="+", type=float, default=[2, 5, 10], help="Utterance length bucket edges (s)")
+args = parser.parse_args()
+
+wav_paths = find_recordings(args.wavs)
+utterances = segment_utterances(wav_paths)
+print(f"Segmented {len(wav_paths)} recordings into {len(utterances)} utterances")
+
+tiers = [(tier.split(":")[0], float(tier.split(":")[1])) for tier in args.tiers]
+endpoints = {
+    "single": FasterWhisperEndpoint(args.model_name, device=args.device),
+    "cascade": FasterWhisperEndpoint(
+        args.model_name,
+        device=args.device,
+        cascade=tiers,
+        cascade_kwargs={"min_avg_logprob": args.min_avg_logprob, "max_no_speech_prob": args.max_no_speech_prob},
+    ),
+}
+# warm up every model, the last tier is the single model
+for _, model, _ in endpoints["cascade"].cascade.tiers:
+    list(model.transcribe(np.zeros(16000, dtype=np.float32), language="en")[0])
+
+times = collections.defaultdict(lambda: collections.defaultdict(list))
+mismatches = 0
+for utterance in utterances:
+    bucket = bucket_of(utterance.duration / 1000, args.buckets)
+    texts = {}
+    for mode, endpoint in endpoints.items():
+        texts[mode], elapsed = transcribe_ms(endpoint, utterance)
+        times[bucket][mode].append(elapsed)
+    mismatches += len(set(str(text).strip().lower() for text in texts.values())) > 1
+
+for bucket in sorted_buckets(times):
+    single, cascade = np.mean(times[bucket]["single"]), np.mean(times[bucket]["cascade"])
+    print(
+        f"{bucket:>10s} ({len(times[bucket]['single'])} utterances): "
+        f"single {single:.0f} ms | cascade {cascade:.0f} ms | cascade saves {1 - cascade / single:.0%}"
+    )
+
+cascade = endpoints["cascade"].cascade
+for name, metrics in cascade.metrics().items():
+    escalated = f", {metrics['escalated']} escalated" if metrics["routed"] and name != args.model_name else ""
+    print(f"{name:>18s}: {metrics['routed']} routed{escalated}, {metrics['decodes']} decodes of {metrics['avg_decode_ms']:.0f} ms")
+print(f"Escalation rate: {cascade.escalation_rate:.0%}")
+print(f"Transcriptions differing from the single model: {mismatches}/{len(utterances)}")
+print("Benchmarking Whisper cascade Done!")
@@ -0,0 +1,57 @@
+import time
+import argparse
+import collections
+import numpy as np
+from mangrove.vad.compaction import UtteranceCompactor
+from mangrove.stt.endpoints.faster_whisper import FasterWhisperEndpoint
+from .harness import bucket_of, find_recordings, segment_utterances, sorted_buckets, transcribe_ms
+
+parser = argparse.ArgumentParser(
+    description="Transcription time of VAD segmented utterances as they are and compacted, on a replayed corpus"
+)
+parser.add_argument("wavs", nargs="*", help="Recorded turns (wav), defaults to the recordings in the commands cache")
+parser.add_argument("--pad_ms", type=float, default=200)
+parser.add_argument("--max_pause_ms", type=float, default=300)
+parser.add_argument("--model_name", default="distil-medium.en")
+parser.add_argument("--device", default="cpu")
+parser.add_argument("--vad_filter", default="precomputed", choices=["whisper", "precomputed", "none"])
+parser.add_argument("--buckets", nargs="+", type=float, default=[2, 5, 10], help="Utterance length bucket edges (s)")
+parser.add_argument("--repeats", type=int, default=3, help="Transcriptions per utterance and mode, the fastest is kept")
+args = parser.parse_args()
+
+wav_paths = find_recordings(args.wavs)
+utterances = segment_utterances(wav_paths)
+
+compactor = UtteranceCompactor(pad_ms=args.pad_ms, max_pause_ms=args.max_pause_ms)
+start = time.perf_counter()
+compacted = [compactor.compact(utterance) for utterance in utterances]
+compaction_time = (time.perf_counter() - start) * 1000 / len(utterances)
+print(
+    f"Segmented {len(wav_paths)} recordings into {len(utterances)} utterances, compaction removed "
+    f"{compactor.removed_fraction:.0%} of their audio in {compaction_time:.2f} ms per utterance"
+)
+
+endpoint = FasterWhisperEndpoint(args.model_name, device=args.device, vad_filter=args.vad_filter)
+# warm up the model
+transcribe_ms(endpoint, utterances[0])
+
+times = collections.defaultdict(lambda: collections.defaultdict(list))
+mismatches = 0
+for utterance, compacted_utterance in zip(utterances, compacted):
+    bucket = bucket_of(utterance.duration / 1000, args.buckets)
+    texts = {}
+    for mode, audio_packet in [("original", utterance), ("compacted", compacted_utterance)]:
+        texts[mode], best = transcribe_ms(endpoint, audio_packet, repeat=args.repeats)
+        times[bucket][mode].append(best)
+    mismatches += str(texts["original"]).strip().lower() != str(texts["compacted"]).strip().lower()
+
+for bucket in sorted_buckets(times):
+    original, compacted_time = np.mean(times[bucket]["original"]), np.mean(times[bucket]["compacted"])
+    print(
+        f"{bucket:>10s} ({len(times[bucket]['original'])} utterances): "
+        f"original {original:.0f} ms | compacted {compacted_time:.0f} ms | compaction saves {1 - compacted_time / original:.0%}"
+    )
+original = sum(sum(bucket["original"]) for bucket in times.values())
+print(f"STT time reduction over the corpus ({args.vad_filter} VAD filter): {1 - sum(sum(bucket['compacted']) for bucket in times.values()) / original:.0%}")
+print(f"Transcriptions differing once compacted: {mismatches}/{len(utterances)}")
+print("Benchmarking utterance compaction Done!")
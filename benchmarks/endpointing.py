@@ -0,0 +1,54 @@
+import time
+import argparse
+import numpy as np
+from mangrove.vad.endpoints.silero import SileroVAD
+from mangrove.vad.endpointer import AdaptiveEndpointer
+from .harness import describe_ms, find_recordings, replay_frames
+
+parser = argparse.ArgumentParser(
+    description="End of speech to STT start latency of fixed and adaptive endpointing on a replayed corpus"
+)
+parser.add_argument("wavs", nargs="*", help="Recorded turns (wav), defaults to the recordings in the commands cache")
+parser.add_argument("--gap_ms", type=int, default=1500, help="Silence between replayed turns")
+parser.add_argument("--tail_silence_threshold", type=int, default=500, help="Fixed tail silence (as in VADStage)")
+parser.add_argument("--backend", default="onnx", choices=["torch", "onnx"])
+parser.add_argument("--frames_per_call", type=int, default=4, help="Frames per VAD call, as drained by the stage")
+args = parser.parse_args()
+
+wav_paths = find_recordings(args.wavs)
+frames = replay_frames(wav_paths, gap_ms=args.gap_ms)
+print(f"Replaying {len(wav_paths)} turns: {len(frames)} frames ({len(frames) * frames[0].duration / 1000:.1f} s)")
+
+for mode in ["fixed", "adaptive"]:
+    vad = SileroVAD(backend=args.backend, tail_silence_threshold=args.tail_silence_threshold, device="cpu")
+    if mode == "adaptive":
+        vad.endpointer = AdaptiveEndpointer(args.tail_silence_threshold)
+
+    latencies, durations, processing_times = [], [], []
+    speech_end = None
+    for i in range(0, len(frames), args.frames_per_call):
+        batch = frames[i:i + args.frames_per_call]
+        start = time.perf_counter()
+        is_speeches, speech_probs = vad.is_speech_with_probs(batch)
+        for frame, is_speech, speech_prob in zip(batch, is_speeches, speech_probs):
+            vad.feed(frame, is_speech=is_speech, speech_prob=speech_prob)
+            if is_speech:
+                speech_end = frame.timestamp + frame.duration
+            utterance = vad.get_utterance_if_any()
+            if utterance is not None:
+                # STT starts on the utterance right after the frame that ended it
+                latencies.append(frame.timestamp + frame.duration - speech_end)
+                durations.append(utterance.duration)
+        processing_times.append((time.perf_counter() - start) * 1000 / len(batch))
+
+    line = (
+        f"{mode:8s}: {len(latencies)} utterances (mean {np.mean(durations) / 1000 if durations else 0:.2f} s) | "
+        f"end of speech -> STT start: "
+    )
+    if latencies:
+        line += describe_ms(latencies, percentiles=(50, 90, 100), precision=0)
+    line += f" | VAD {np.mean(processing_times):.3f} ms/frame"
+    if vad.endpointer is not None:
+        line += f" | {vad.endpointer.metrics()}"
+    print(line)
+print("Benchmarking endpointing Done!")
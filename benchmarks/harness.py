@@ -0,0 +1,164 @@
+"""Shared harness of the benchmarks
+
+Run them from the repository root as modules, e.g. `python -m benchmarks.audio_packet`,
+so that `core` and `mangrove` are importable without touching `sys.path`.
+"""
+import os
+import glob
+import time
+import numpy as np
+from scipy.io import wavfile
+from typing import Callable, Iterable, List, Optional, Sequence, Tuple
+from core import AudioBuffer, AudioPacket
+from storage_manager import COMMANDS_CACHE_DIR
+
+
+def average_ms(fn: Callable[[int], object], repeat: int) -> float:
+    """Average wall time of `fn(i)` over `repeat` calls
+
+    Args:
+        fn (Callable[[int], object]): call timed, given the index of the repetition
+        repeat (int): number of calls
+
+    Returns:
+        float: average time in ms per call
+    """
+    start = time.perf_counter()
+    for i in range(repeat):
+        fn(i)
+    return (time.perf_counter() - start) / repeat * 1000
+
+
+def describe_ms(values: Sequence[float], percentiles: Sequence[float] = (50, 95), precision: int = 2) -> str:
+    """Summary of timings, e.g. "12.30 ms mean, 11.80 p50, 20.10 p95"
+
+    Args:
+        values (Sequence[float]): timings in ms
+        percentiles (Sequence[float], optional): percentiles reported, 100 as the max. Defaults to (50, 95).
+        precision (int, optional): decimals. Defaults to 2.
+
+    Returns:
+        str: the summary
+    """
+    line = f"{np.mean(values):.{precision}f} ms mean"
+    for percentile in percentiles:
+        name = "max" if percentile == 100 else f"p{percentile:g}"
+        line += f", {np.percentile(values, percentile):.{precision}f} {name}"
+    return line
+
+
+def find_recordings(wav_paths: Optional[List[str]] = None) -> List[str]:
+    """The wav files given, else the recordings of the commands cache from the oldest
+
+    Raises:
+        SystemExit: If there is no recording
+    """
+    wav_paths = wav_paths or sorted(glob.glob(os.path.join(COMMANDS_CACHE_DIR, "*.wav")), key=os.path.getmtime)
+    if not wav_paths:
+        raise SystemExit(f"No recording found in {COMMANDS_CACHE_DIR}, pass wav files")
+    return wav_paths
+
+
+def load_wav(wav_path: str, timestamp: float = 0) -> AudioPacket:
+    """Recording as one AudioPacket, resampled to 16 kHz like the packets streamed by the clients
+
+    Args:
+        wav_path (str): wav file, 16 bit or float
+        timestamp (float, optional): timestamp (ms) of the packet on the replayed timeline. Defaults to 0.
+
+    Returns:
+        AudioPacket: the recording
+    """
+    sample_rate, waveform = wavfile.read(wav_path)
+    if waveform.dtype != np.int16:
+        waveform = (np.clip(waveform.astype(np.float32), -1, 1) * 32767).astype(np.int16)
+    return AudioPacket({
+        "bytes": waveform.tobytes(),
+        "sampleRate": sample_rate,
+        "numChannels": 1 if waveform.ndim == 1 else waveform.shape[1],
+        "sampleWidth": 2,
+        "timestamp": timestamp,
+    })
+
+
+def replay_frames(wav_paths: List[str], gap_ms: float = 1000, frame_size: int = 512 * 4) -> List[AudioPacket]:
+    """Recordings replayed as one stream (one speaker), turns separated by silence, split into frames
+
+    Args:
+        wav_paths (List[str]): recorded turns
+        gap_ms (float, optional): silence after every turn. Defaults to 1000.
+        frame_size (int, optional): frame size in bytes, as in the VAD stage. Defaults to 512*4.
+
+    Returns:
+        List[AudioPacket]: the frames, timestamped on the replayed timeline
+    """
+    audio_buffer = AudioBuffer(frame_size=frame_size)
+    gap = np.zeros(int(16000 * gap_ms / 1000), dtype=np.int16)
+    position = 0  # ms on the replayed timeline
+    for wav_path in wav_paths:
+        audio_packet = load_wav(wav_path, timestamp=position)
+        audio_buffer.put(audio_packet)
+        position += audio_packet.duration
+        audio_packet = AudioPacket({
+            "bytes": gap.tobytes(),
+            "sampleRate": 16000,
+            "numChannels": 1,
+            "sampleWidth": 2,
+            "timestamp": position,
+        })
+        audio_buffer.put(audio_packet)
+        position += audio_packet.duration
+    return audio_buffer.get_frames_nowait()
+
+
+def segment_utterances(wav_paths: List[str]) -> List[AudioPacket]:
+    """Utterances of the recordings as the VAD stage cuts them, carrying their speech timestamps
+
+    Raises:
+        SystemExit: If there is no speech in the recordings
+    """
+    from mangrove.vad.endpoints.silero import SileroVAD
+    vad = SileroVAD(backend="onnx", device="cpu")
+    utterances = []
+    for frame in replay_frames(wav_paths):
+        vad.feed(frame)
+        utterance = vad.get_utterance_if_any()
+        if utterance is not None:
+            utterances.append(utterance)
+    if not utterances:
+        raise SystemExit("No utterance found in the recordings")
+    return utterances
+
+
+def bucket_of(duration_s: float, buckets: Sequence[float]) -> str:
+    """Label of the length bucket, e.g. "2-5 s", of an utterance given the inner bucket edges (s)"""
+    edges = [0, *buckets, float("inf")]
+    for low, high in zip(edges[:-1], edges[1:]):
+        if low <= duration_s < high:
+            return f"{low:g}-{high:g} s"
+    raise ValueError(f"Negative duration {duration_s}")
+
+
+def sorted_buckets(labels: Iterable[str]) -> List[str]:
+    """Bucket labels from the shortest utterances"""
+    return sorted(labels, key=lambda label: float(label.split("-")[0]))
+
+
+def transcribe_ms(endpoint, audio_packet: AudioPacket, repeat: int = 1) -> Tuple[Optional[str], float]:
+    """Transcription of an utterance by an STT endpoint and its fastest wall time over `repeat` runs
+
+    Args:
+        endpoint (STTEndpoint): endpoint, fed the whole utterance
+        audio_packet (AudioPacket): utterance
+        repeat (int, optional): number of runs. Defaults to 1.
+
+    Returns:
+        Tuple[Optional[str], float]: the transcription and the time in ms
+    """
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        endpoint.feed(audio_packet)
+        text = endpoint.get_transcription_if_any()
+        best = min(best, (time.perf_counter() - start) * 1000)
+    return text, best
@@ -0,0 +1,99 @@
+import os
+import sys
+import time
+import argparse
+import resource
+import tracemalloc
+import numpy as np
+import core.data
+from core import AudioBuffer, AudioPacket
+
+parser = argparse.ArgumentParser(description="Allocations and peak RSS per minute of streamed audio")
+parser.add_argument(
+    "--mode", default="slots", choices=["baseline", "slots"],
+    help="baseline: dict-backed packets as before __slots__, slots: slotted packets",
+)
+parser.add_argument("--minutes", type=float, default=1.0, help="Minutes of audio to stream")
+args = parser.parse_args()
+
+
+class DictBackedAudioPacket(AudioPacket):
+    """AudioPacket allocating a per-instance __dict__ holding its attributes, as packets did before __slots__"""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._mirror_attributes()
+
+    def _mirror_attributes(self):
+        self.__dict__.update({name: getattr(self, name) for name in AudioPacket.__slots__ if hasattr(self, name)})
+
+    def _derive(self, *args, **kwargs):
+        # frames read from the buffer and assembled utterances are dict-backed too
+        packet = AudioPacket._derive(self, *args, **kwargs)
+        derived = DictBackedAudioPacket.__new__(DictBackedAudioPacket)
+        for name in AudioPacket.__slots__ + ("_timestamp", "_start", "_partial", "_metadata"):
+            if hasattr(packet, name):
+                setattr(derived, name, getattr(packet, name))
+        derived._mirror_attributes()
+        return derived
+
+
+sample_rate = 16000
+frames_per_buffer = 1024
+num_packets = int(args.minutes * 60 * sample_rate / frames_per_buffer)
+mic_buffer = np.random.uniform(-0.3, 0.3, frames_per_buffer).astype(np.float32).tobytes()
+
+packet_class = DictBackedAudioPacket if args.mode == "baseline" else AudioPacket
+buffer = AudioBuffer(frame_size=512 * 4)
+utterance = None
+# only the allocations of the packet path (and of the dict-backed packets above), not those of tracemalloc
+# and numpy internals
+trace_filters = [
+    tracemalloc.Filter(True, os.path.join(os.path.dirname(os.path.abspath(core.data.__file__)), "*")),
+    tracemalloc.Filter(True, os.path.abspath(__file__)),
+]
+
+print(f"Streaming {num_packets} packets ({args.minutes} min), mode={args.mode} ...")
+tracemalloc.start()
+start = time.perf_counter()
+blocks_before = sys.getallocatedblocks()
+num_allocations = 0
+for i in range(num_packets):
+    before = tracemalloc.take_snapshot().filter_traces(trace_filters)
+    # same path as DigitalAssistant.on_stream_audio -> VADStage
+    audio_packet = packet_class(
+        {
+            "bytes": mic_buffer,
+            "sampleRate": sample_rate,
+            "numChannels": 1,
+            "sampleWidth": 4,
+            "timestamp": i * frames_per_buffer * 1000 / sample_rate,
+        }
+    )
+    buffer.put(audio_packet)
+    frames = list(buffer)
+    for frame in frames:
+        # utterances of ~3 s like VoiceActivityDetector builds them
+        utterance = frame if utterance is None else utterance + frame
+        if utterance.duration >= 3000:
+            utterance.float
+            utterance = None
+
+    # the packet and frames of this step are still referenced, so the blocks allocated for them are seen
+    # (other temporaries freed within the step are not)
+    after = tracemalloc.take_snapshot().filter_traces(trace_filters)
+    num_allocations += sum(max(stat.count_diff, 0) for stat in after.compare_to(before, "traceback"))
+    del audio_packet, frames, frame
+elapsed = time.perf_counter() - start
+_, peak_traced = tracemalloc.get_traced_memory()
+tracemalloc.stop()
+
+frame = packet_class({"bytes": b"\0" * 2048, "sampleRate": sample_rate, "numChannels": 1, "sampleWidth": 2}, is_processed=True)
+instance_size = sys.getsizeof(frame) + (sys.getsizeof(frame.__dict__) if hasattr(frame, "__dict__") else 0)
+print(f"AudioPacket instance size: {instance_size} bytes, has __dict__: {hasattr(frame, '__dict__')}")
+print(f"Allocations per minute of audio: {num_allocations / args.minutes:.0f} blocks")
+print(f"Live allocated blocks delta: {sys.getallocatedblocks() - blocks_before}")
+print(f"Peak traced Python memory: {peak_traced / 1024:.1f} KiB")
+print(f"Peak RSS: {resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024:.1f} MiB")
+print(f"Elapsed (with tracing): {elapsed * 1000:.1f} ms ({elapsed / num_packets * 1e6:.1f} us/packet)")
+print("Benchmarking packet memory Done!")
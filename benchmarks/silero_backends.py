@@ -0,0 +1,55 @@
+import time
+import argparse
+import numpy as np
+from core import AudioBuffer
+from mangrove.vad.endpoints.silero import SileroVAD
+from .harness import describe_ms, find_recordings, load_wav
+
+parser = argparse.ArgumentParser(description="Per-frame latency and CPU usage of the Silero VAD backends")
+parser.add_argument("wav", nargs="?", default=None, help="Recorded stream (wav), defaults to the latest recording in the commands cache")
+parser.add_argument("--backends", nargs="+", default=["torch", "onnx"], choices=["torch", "onnx"])
+parser.add_argument("--threads", type=int, default=1, help="ONNX Runtime intra-op threads")
+parser.add_argument("--frames_per_call", type=int, default=1, help="Frames per is_speech call (1 as in the VAD stage)")
+args = parser.parse_args()
+
+wav_path = args.wav or find_recordings()[-1]
+audio_packet = load_wav(wav_path)
+audio_buffer = AudioBuffer(frame_size=512 * 4)
+audio_buffer.put(audio_packet)
+frames = audio_buffer.get_frames_nowait()
+audio_duration = len(frames) * frames[0].duration / 1000
+print(f"Streaming {wav_path}: {len(frames)} frames ({audio_duration:.1f} s)")
+
+decisions = {}
+for backend in args.backends:
+    try:
+        vad = SileroVAD(backend=backend, device="cpu", intra_op_num_threads=args.threads)
+    except ImportError as e:
+        print(f"{backend:5s}: skipped ({e})")
+        continue
+
+    # warm up on the first frames, then restart the stream
+    vad.is_speech(frames[:4])
+    vad.reset_stream()
+
+    latencies, cpu_times, decisions[backend] = [], [], []
+    total_cpu_time = 0.0
+    for i in range(0, len(frames), args.frames_per_call):
+        batch = frames[i:i + args.frames_per_call]
+        start, cpu_start = time.perf_counter(), time.process_time()
+        decisions[backend] += vad.is_speech(batch)
+        cpu_time = time.process_time() - cpu_start
+        latencies.append((time.perf_counter() - start) * 1000 / len(batch))
+        cpu_times.append(cpu_time * 1000 / len(batch))
+        total_cpu_time += cpu_time
+
+    print(
+        f"{backend:5s}: {describe_ms(latencies, precision=3)} per frame | CPU {np.mean(cpu_times):.3f} ms/frame, "
+        f"{100 * total_cpu_time / audio_duration:.2f}% of one core in real time | "
+        f"{100 * np.mean(decisions[backend]):.1f}% speech frames"
+    )
+
+if len(decisions) == 2:
+    agreement = np.mean(np.array(decisions["torch"]) == np.array(decisions["onnx"]))
+    print(f"Backends agree on {100 * agreement:.2f}% of frames")
+print("Benchmarking Silero VAD backends Done!")
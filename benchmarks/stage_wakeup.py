@@ -0,0 +1,65 @@
+import time
+from threading import Event, Thread
+from core import TextPacket
+from core.stage import TextToTextStage
+from .harness import describe_ms
+
+
+class ThreadingHost:
+    """Minimal stand-in for DigitalAssistant running stages on plain threads"""
+
+    def sleep(self, seconds):
+        time.sleep(seconds)
+
+    def create_event(self):
+        return Event()
+
+    def start_background_task(self, target, *args, **kwargs):
+        thread = Thread(target=target, args=args, kwargs=kwargs, daemon=True)
+        thread.start()
+        return thread
+
+
+class PassThroughStage(TextToTextStage):
+    def _process(self, text_packet):
+        return text_packet
+
+
+class PollingPassThroughStage(PassThroughStage):
+    """Emulates the previous loop: input is only noticed on the next 50 ms poll"""
+
+    def __init__(self, **kwargs):
+        super().__init__(tick_interval=0.05, **kwargs)
+
+    def feed(self, data_packet):
+        self._input_buffer.put(data_packet)
+
+
+def replay(stage_cls, num_stages=4, num_utterances=20):
+    """Return the latencies in ms from feeding the first stage to the last stage emitting"""
+    host = ThreadingHost()
+    stages = [stage_cls() for _ in range(num_stages)]
+    done = Event()
+    for stage, next_stage in zip(stages, stages[1:]):
+        stage.on_ready_callback = next_stage.feed
+    stages[-1].on_ready_callback = lambda _: done.set()
+    for stage in stages:
+        stage.start(host)
+
+    latencies = []
+    for i in range(num_utterances):
+        # let the stages go idle as they would between utterances
+        time.sleep(0.13)
+        done.clear()
+        start = time.perf_counter()
+        stages[0].feed(TextPacket(f"utterance {i}", partial=False, start=True))
+        done.wait()
+        latencies.append((time.perf_counter() - start) * 1000)
+    return latencies
+
+
+print("Replaying utterances through 4 stages ...")
+for name, stage_cls in [("polling (50 ms sleep)", PollingPassThroughStage), ("event-driven", PassThroughStage)]:
+    latencies = replay(stage_cls)
+    print(f"{name:22s}: {describe_ms(latencies, percentiles=(50, 100))}")
+print("Replaying utterances Done!")
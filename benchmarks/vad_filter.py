@@ -0,0 +1,50 @@
+import argparse
+import collections
+import numpy as np
+from mangrove.stt.endpoints.faster_whisper import FasterWhisperEndpoint
+from .harness import bucket_of, find_recordings, segment_utterances, sorted_buckets, transcribe_ms
+
+parser = argparse.ArgumentParser(
+    description="Transcription time of VAD segmented utterances with whisper's VAD filter, the precomputed speech segments and no filter"
+)
+parser.add_argument("wavs", nargs="*", help="Recorded turns (wav), defaults to the recordings in the commands cache")
+parser.add_argument("--model_name", default="distil-medium.en")
+parser.add_argument("--device", default="cpu")
+parser.add_argument("--modes", nargs="+", default=["whisper", "precomputed", "none"], choices=["whisper", "precomputed", "none"])
+parser.add_argument("--buckets", nargs="+", type=float, default=[2, 5, 10], help="Utterance length bucket edges (s)")
+parser.add_argument("--repeats", type=int, default=3, help="Transcriptions per utterance and mode, the fastest is kept")
+args = parser.parse_args()
+
+wav_paths = find_recordings(args.wavs)
+utterances = segment_utterances(wav_paths)
+speech_fraction = np.mean([
+    sum(end - start for start, end in utterance.metadata["speech_timestamps"]) / utterance.duration
+    for utterance in utterances
+])
+print(f"Segmented {len(wav_paths)} recordings into {len(utterances)} utterances ({speech_fraction:.0%} speech)")
+
+endpoints = {mode: FasterWhisperEndpoint(args.model_name, device=args.device, vad_filter=mode) for mode in args.modes}
+# warm up the model
+transcribe_ms(endpoints[args.modes[0]], utterances[0])
+
+times = collections.defaultdict(lambda: collections.defaultdict(list))
+mismatches = 0
+for utterance in utterances:
+    bucket = bucket_of(utterance.duration / 1000, args.buckets)
+    texts = {}
+    for mode, endpoint in endpoints.items():
+        texts[mode], best = transcribe_ms(endpoint, utterance, repeat=args.repeats)
+        times[bucket][mode].append(best)
+    mismatches += len(set(str(text).strip() for text in texts.values())) > 1
+
+for bucket in sorted_buckets(times):
+    line = f"{bucket:>10s} ({len(times[bucket][args.modes[0]])} utterances):"
+    for mode in args.modes:
+        line += f" | {mode} {np.mean(times[bucket][mode]):.0f} ms"
+    if "whisper" in args.modes:
+        for mode in args.modes:
+            if mode != "whisper":
+                line += f" | {mode} saves {1 - np.mean(times[bucket][mode]) / np.mean(times[bucket]['whisper']):.0%}"
+    print(line)
+print(f"Transcriptions differing between modes: {mismatches}/{len(utterances)}")
+print("Benchmarking VAD filter Done!")
@@ -1,8 +1,10 @@
 import sys
 import argparse
 import socketio
+import numpy as np
 from misc import setup_terminate_signal_if_win
 from sound_manager import SoundManager
+from wire_format import SUPPORTED_WIRE_FORMATS, WIRE_FORMAT_BINARY, WIRE_FORMAT_DICT, pack_audio_frame
 from loguru import logger
 
 
@@ -18,19 +20,49 @@ class AssistantClient(socketio.ClientNamespace):
         super().__init__(namespace)
         self.sound_manager = SoundManager(self._emit_audio_packet)
         self.is_connected = False
+        # until the server acknowledges another format, audio is sent as legacy dicts
+        self.wire_format = WIRE_FORMAT_DICT
+        self._sequence = 0
 
     def _emit_audio_packet(self, audio_packet):
-        """Emits an audio packet to the server
+        """Emits an audio packet to the server in the negotiated wire format
 
         Args:
-            audio_packet (bytes): audio packet to be sent to the server
+            audio_packet (dict): raw audio bytes and their format to be sent to the server
         """
         if self.is_connected:
             print(".", end="", flush=True)
-            self.emit("stream_audio", audio_packet)
+            if self.wire_format == WIRE_FORMAT_BINARY:
+                data = pack_audio_frame(
+                    audio_packet["bytes"],
+                    sequence=self._sequence,
+                    timestamp=audio_packet["timestamp"],
+                    sample_rate=audio_packet["sampleRate"],
+                    sample_width=audio_packet["sampleWidth"],
+                    num_channels=audio_packet["numChannels"],
+                )
+            else:
+                data = dict(audio_packet)
+                data["audio"] = np.frombuffer(data.pop("bytes"), np.float32).tolist()
+            self._sequence += 1
+            self.emit("stream_audio", data)
+
+    def _on_audio_format_ack(self, data):
+        """Handles the wire format chosen by the server
+
+        Args:
+            data (dict): ack with the chosen `format`
+        """
+        wire_format = data.get("format") if isinstance(data, dict) else None
+        if wire_format in SUPPORTED_WIRE_FORMATS:
+            self.wire_format = wire_format
+        logger.info(f"Streaming audio as {self.wire_format}")
 
     def on_connect(self):
         sio.emit("trial", "test")
+        self.wire_format = WIRE_FORMAT_DICT
+        self._sequence = 0
+        self.emit("audio_format", {"formats": SUPPORTED_WIRE_FORMATS}, callback=self._on_audio_format_ack)
         self.is_connected = True
         self.sound_manager.open_mic()
         logger.success("I'm connected!")
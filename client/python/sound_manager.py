@@ -97,13 +97,10 @@ class SoundManager:
     def callback_pyaudio(self, audio_bytes, frame_count, time_info, flags):
         """This is called (from a separate thread) for each audio block."""
 
-        audio_float32 = np.fromstring(audio_bytes, np.float32).astype(float)
-        # audio_int16 = np.fromstring(audio_bytes, np.int16).astype(float)
-
         self.stream_callback(
             {
-                "audio": list(audio_float32),
-                "numChannels": 1,
+                "bytes": audio_bytes,  # raw float32 PCM, encoded for the wire by the stream_callback
+                "numChannels": self._channels,
                 "sampleRate": self._sample_rate,
                 "timestamp": int(time.time() * 1000),
                 "sampleWidth": 4,  # "format": "f32le", # float32
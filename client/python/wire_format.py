@@ -0,0 +1,33 @@
+import struct
+
+# Binary `stream_audio` frame, sent as a socket.io binary attachment:
+# magic (2s), version (B), numChannels (B), sampleWidth (B), pad, sampleRate (I), sequence (I), timestamp in ms (Q)
+# followed by raw interleaved PCM. Keep in sync with core/data/wire_format.py on the server
+WIRE_FORMAT_BINARY = "binary/v1"
+WIRE_FORMAT_DICT = "dict"
+SUPPORTED_WIRE_FORMATS = [WIRE_FORMAT_BINARY, WIRE_FORMAT_DICT]
+
+FRAME_MAGIC = b"MA"
+FRAME_VERSION = 1
+FRAME_HEADER = struct.Struct("<2sBBBxIIQ")
+
+
+def pack_audio_frame(pcm, sequence, timestamp, sample_rate, sample_width, num_channels):
+    """Pack raw PCM and its format into a binary audio frame
+
+    Args:
+        pcm (bytes): raw interleaved PCM
+        sequence (int): sequence number of the frame in its stream
+        timestamp (int): capture time in ms
+        sample_rate (int): sample rate of pcm
+        sample_width (int): sample width of pcm in bytes
+        num_channels (int): number of interleaved channels
+
+    Returns:
+        bytes: binary frame
+    """
+    header = FRAME_HEADER.pack(
+        FRAME_MAGIC, FRAME_VERSION, num_channels, sample_width,
+        sample_rate, sequence & 0xFFFFFFFF, int(timestamp),
+    )
+    return header + pcm
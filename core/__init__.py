@@ -1,4 +1,5 @@
 from .data.audio_packet import AudioPacket
 from .data.audio_buffer import AudioBuffer
 from .data.text_packet import TextPacket
-from .data.data_packet import DataPacket
\ No newline at end of file
+from .data.data_packet import DataPacket
+from .data.resampler import PolyphaseResampler, StreamResampler
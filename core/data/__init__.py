@@ -2,3 +2,4 @@ from .data_packet import DataPacket
 from .text_packet import TextPacket
 from .audio_packet import AudioPacket
 from .audio_buffer import AudioBuffer
+from .resampler import PolyphaseResampler, StreamResampler
@@ -20,6 +20,7 @@ for i in range(3):
         {
             "sampleRate": 16000,
             "numChannels": 1,
+            "sampleWidth": 2,
             "timestamp": time.time(),
             "bytes": b"0" * 320,
         },
@@ -28,24 +29,20 @@ for i in range(3):
     sleep(random.randint(0, 3) * 0.3)
     packets.append(audio_packet)
 
-# shuffle packets
-random.shuffle(packets)
-
+# packets are expected in stream order
 for packet in packets:
     buff.put(packet)
 
-for packet in reversed(packets):
-    buff.put(packet)
-
-# print all timestamps
-for packet in buff.queue.queue:
-    print(packet.timestamp)
+print(f"There are {buff.size_of_leftover()} bytes in the buffer: {buff}")
 
-print([x.timestamp for x in buff.queue.queue])
-print(f"There are {len(buff.queue.queue)} packets in the queue")
+# read all frames and print their timestamps
+frames = list(buff)
+print([x.timestamp for x in frames])
+print(f"Read {len(frames)} frames of {buff.default_frame_size} bytes")
 
 
-# sum up all packets
+# sum up all frames
 from functools import reduce
-sum_packet = reduce(lambda x, y: x + y, buff.queue.queue)
+sum_packet = reduce(lambda x, y: x + y, frames)
+assert len(sum_packet) == 3 * 320
 print("Testing AudioBuffer Done!")
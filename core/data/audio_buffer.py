@@ -1,17 +1,25 @@
 import numpy as np
 import sounddevice as sd
 
-from functools import reduce
-from queue import PriorityQueue, Queue
+from collections import deque
+from typing import List
 from queue import Empty as QueueEmpty
 from queue import Full as QueueFull
 from loguru import logger
-from threading import RLock
+from threading import Condition, RLock
 from .audio_packet import AudioPacket
 
 
 class AudioBuffer:
-    """Data buffer for audio packets"""
+    """Data buffer for audio packets
+
+    Audio bytes are written into a preallocated numpy ring buffer that wraps
+    around, and grows only when the unread bytes do not fit. Frames are copied
+    out of the ring (joining the two pieces of a frame across the seam), so no
+    frame ever refers to memory the ring overwrites later.
+
+    Packets are expected to be put in stream order (as they arrive over the socket).
+    """
 
     class Empty(QueueEmpty):
         """Exception raised when queue is empty"""
@@ -21,44 +29,107 @@ class AudioBuffer:
         """Exception raised when queue is full"""
         pass
 
-    def __init__(self, frame_size=320, max_queue_size=0):
+    def __init__(self, frame_size=320, max_queue_size=0, capacity=None):
         """Initialize data buffer
 
         Args:
             frame_size (int, optional): Number of bytes to read from queue. Defaults to 320.
-            max_queue_size (int, optional): Maximum number of audio packets to store in queue. Defaults to 100.
+            max_queue_size (int, optional): Maximum number of frames to store in buffer, 0 for unbounded. Defaults to 0.
+            capacity (int, optional): Initial ring capacity in bytes. Defaults to 16 frames.
         """
         self.max_queue_size = max_queue_size
-        self.queue = PriorityQueue(maxsize=self.max_queue_size)
-        self.leftover = None
         self.default_frame_size = frame_size
-        self.queue_before_reset = None
-        self._len = 0
+        self._max_capacity = max_queue_size * frame_size if max_queue_size > 0 else None
+        if capacity is None:
+            capacity = frame_size * 16
+        if self._max_capacity is not None:
+            capacity = min(capacity, self._max_capacity)
+        self._initial_capacity = max(capacity, frame_size)
+
         self._lock = RLock()
+        self._not_empty = Condition(self._lock)
+        self._not_full = Condition(self._lock)
+        self.reset()
 
     def reset(self) -> None:
         """Reset queue to empty state"""
-        with self.queue.mutex:
-            self.queue_before_reset = self.queue.queue
-        self.queue = PriorityQueue(maxsize=self.max_queue_size)
+        with self._lock:
+            self._ring = np.empty(self._initial_capacity, dtype=np.uint8)
+            self._head = 0  # read index in ring
+            self._size = 0  # unread bytes, from the head on (wrapping around)
+            self._read_offset = 0  # absolute number of bytes read since reset
+            # (absolute offset, empty AudioPacket) of every packet put, used for timestamps and format
+            self._packet_marks = deque()
+            self._not_full.notify_all()
 
     def __str__(self):
-        return " ".join([str(packet) for packet in self.queue.queue])
+        with self._lock:
+            return f"AudioBuffer({self._size} bytes, capacity={len(self._ring)})"
+
+    def __len__(self) -> int:
+        """Number of unread bytes"""
+        return self._size
+
+    def _make_room(self, num_bytes: int) -> bool:
+        """Ensure `num_bytes` fit in the ring, growing it if needed
+
+        Args:
+            num_bytes (int): number of bytes to be written
+
+        Returns:
+            bool: False if buffer is bounded and has no room
+        """
+        capacity = len(self._ring)
+        if self._size + num_bytes <= capacity:
+            return True
+        if self._max_capacity is not None and self._size + num_bytes > self._max_capacity:
+            return False
+        while self._size + num_bytes > capacity:
+            capacity *= 2
+        if self._max_capacity is not None:
+            capacity = min(capacity, self._max_capacity)
+
+        ring = np.empty(capacity, dtype=np.uint8)
+        self._copy_out(ring[:self._size])
+        self._ring = ring
+        self._head = 0
+        return True
 
     def put(self, audio_packet: AudioPacket, timeout=0.5) -> None:
         """Add audio packet to queue
 
         Args:
             audio_packet (AudioPacket): Audio packet to add to queue
+            timeout (float, optional): Seconds to wait for room if buffer is bounded. Defaults to 0.5.
         """
-        with self._lock:
-            try:
-                # self._len += len(audio_packet)/self.default_frame_size
-                self._len += len(audio_packet)
-                self.queue.put(audio_packet, timeout=timeout)
-            except QueueFull:
+        num_bytes = len(audio_packet)
+        with self._not_full:
+            if not self._not_full.wait_for(lambda: self._make_room(num_bytes), timeout=timeout):
                 raise AudioBuffer.Full
 
+            # NOTE: only the format and timestamp are kept, not the caller's packet and its segments
+            mark_packet = audio_packet._derive([], 0, audio_packet.timestamp)
+            self._packet_marks.append((self._read_offset + self._size, mark_packet))
+            self._write(audio_packet)
+            self._not_empty.notify()
+
+    def _write(self, audio_packet: AudioPacket) -> None:
+        """Copy the packet segments at the tail, wrapping around (lock must be held and room made)"""
+        capacity = len(self._ring)
+        for segment in audio_packet.segments:
+            data = np.frombuffer(segment, dtype=np.uint8)
+            tail = (self._head + self._size) % capacity
+            first = min(len(data), capacity - tail)
+            self._ring[tail:tail + first] = data[:first]
+            self._ring[:len(data) - first] = data[first:]
+            self._size += len(data)
+
+    def _copy_out(self, out: np.ndarray) -> None:
+        """Copy the first `len(out)` unread bytes into `out`, without reading them (lock must be held)"""
+        first = min(len(out), len(self._ring) - self._head)
+        out[:first] = self._ring[self._head:self._head + first]
+        out[first:] = self._ring[:len(out) - first]
+
     def get_nowait(self, frame_size=None) -> AudioPacket:
         """Get next frame of audio packets from queue given frame size
 
@@ -69,87 +140,69 @@ class AudioBuffer:
             AudioPacket: Audio packet of size frame_size
 
         Raises:
-            StopIteration: If queue is empty or if there is not enough data in queue to read frame_size bytes
+            AudioBuffer.Empty: If queue is empty
         """
-        with self._lock:
-            return self._get(frame_size, timeout=-1)
+        return self.get(frame_size, timeout=-1)
 
     def get(self, frame_size=None, timeout=0.5) -> AudioPacket:
         """Get next frame of audio packets from queue given frame size
 
+        Waits up to `timeout` seconds for a full frame; if it is not complete by
+        then, the partial frame available is returned.
+
         Args:
             frame_size (int, optional): Number of bytes to read from queue. Defaults to self.default_frame_size.
+            timeout (float, optional): Seconds to wait, -1 for no waiting. Defaults to 0.5.
 
         Returns:
-            AudioPacket: Audio packet of size frame_size
+            AudioPacket: Audio packet of size frame_size (or shorter if not enough data)
 
         Raises:
-            StopIteration: If queue is empty or if there is not enough data in queue to read frame_size bytes
+            AudioBuffer.Empty: If queue is empty
         """
-        with self._lock:
-            return self._get(frame_size, timeout)
-
-    def _get(self, frame_size=None, timeout=0.5) -> AudioPacket:
-        """Get next frame of audio packets from queue given frame size
+        frame_size = frame_size or self.default_frame_size
+        with self._not_empty:
+            if timeout != -1:
+                self._not_empty.wait_for(lambda: len(self) >= frame_size, timeout=timeout)
+            if len(self) == 0:
+                if timeout != -1:
+                    logger.warning("AudioBuffer Queue is empty")
+                raise AudioBuffer.Empty
+            return self._read(min(frame_size, len(self)))
+
+    def get_frames_nowait(self, frame_size=None, max_frames=None) -> List[AudioPacket]:
+        """Get all complete frames currently in the buffer, leaving any partial frame in place
 
         Args:
-            frame_size (int, optional): Number of bytes to read from queue. Defaults to self.default_frame_size.
+            frame_size (int, optional): Number of bytes per frame. Defaults to self.default_frame_size.
+            max_frames (int, optional): Maximum number of frames to read. Defaults to all.
 
         Returns:
-            AudioPacket: Audio packet of size frame_size
-
-        Raises:
-            StopIteration: If queue is empty or if there is not enough data in queue to read frame_size bytes
+            List[AudioPacket]: frames in stream order, possibly empty
         """
-
         frame_size = frame_size or self.default_frame_size
-        chunk_len = 0
-        data_packets = Queue()  # Maybe not necessary
-        if self.leftover is not None:
-            data_packets.put_nowait(self.leftover)
-            chunk_len += len(self.leftover)
-            self._len -= len(self.leftover)
-
-        while chunk_len < frame_size:
-            try:
-                if timeout == -1:
-                    new_packet = self.queue.get_nowait()
-                else:
-                    new_packet = self.queue.get(timeout=timeout)
-                # if resample is not None:
-                #     new_packet = new_packet.resample(resample)
-            except QueueEmpty:
-                # if len(data_packets) == 0:
-                if data_packets.qsize() == 0:
-                    if timeout != -1:
-                        logger.warning("AudioBuffer Queue is empty")
-                    raise AudioBuffer.Empty
-                else:
-                    break
-            data_packets.put_nowait(new_packet)
-            chunk_len += len(new_packet)
-            self._len -= len(new_packet)
-
-        _data_packet_list = []
-        while True:
-            try:
-                _data_packet_list.append(data_packets.get_nowait())
-            except QueueEmpty:
-                break
-
-        if len(_data_packet_list) == 0:
-            raise AudioBuffer.Empty
-
-        data = reduce(lambda x, y: x + y, _data_packet_list)
-        frame, leftover = data[:frame_size], data[frame_size:]
-
-        if len(leftover) > 0:
-            self.leftover = leftover
-            self._len += len(leftover)
-        else:
-            self.leftover = None
-
-        return frame
+        with self._lock:
+            num_frames = len(self) // frame_size
+            if max_frames is not None:
+                num_frames = min(num_frames, max_frames)
+            return [self._read(frame_size) for _ in range(num_frames)]
+
+    def _read(self, num_bytes: int) -> AudioPacket:
+        """Read `num_bytes` from the head as an AudioPacket owning a copy of them (lock must be held)"""
+        while len(self._packet_marks) > 1 and self._packet_marks[1][0] <= self._read_offset:
+            self._packet_marks.popleft()
+        mark_offset, mark_packet = self._packet_marks[0]
+
+        bytes_per_ms = mark_packet.sample_rate * mark_packet.num_channels * mark_packet.sample_width / 1000
+        timestamp = mark_packet.timestamp + (self._read_offset - mark_offset) / bytes_per_ms
+
+        frame = np.empty(num_bytes, dtype=np.uint8)
+        self._copy_out(frame)
+        self._head = (self._head + num_bytes) % len(self._ring)
+        self._size -= num_bytes
+        self._read_offset += num_bytes
+        self._not_full.notify()
+        return mark_packet._derive([memoryview(frame).toreadonly()], num_bytes, timestamp)
 
     def __next__(self) -> AudioPacket:
         """Get next frame of audio packets from queue given frame size
@@ -158,61 +211,35 @@ class AudioBuffer:
             AudioPacket: Audio packet of size frame_size
 
         Raises:
-            StopIteration: If queue is empty or if there is not enough data in queue to read frame_size bytes
+            StopIteration: If queue is empty
         """
         try:
-            ret = self.get(timeout=-1)
-            # if ret is None:
-            #     raise StopIteration
-        except:
+            return self.get(timeout=-1)
+        except AudioBuffer.Empty:
             raise StopIteration
-        return ret
 
     def __iter__(self) -> 'AudioBuffer':
         """Get iterator of audio packets from queue given frame size"""
         return self
 
     def size_of_leftover(self) -> int:
-        """Get length of queue"""
-        return self._len
-
-    def _debug_verify_order(self) -> None:
-        """Verify that queue is in order (For Debugging only)"""
-        with self.queue.mutex:
-            # noise_fstamps = []
-            # noise_estamps = []
-            for i in range(self.queue.qsize - 1):
-                try:
-                    assert self.queue.queue[i] > self.queue.queue[i + 1]
-                except:
-                    try:
-                        assert (
-                            self.queue.queue[i].timestamp
-                            == self.queue.queue[i + 1].timestamp
-                        )
-                        print(f"same {i} == {i+1}")
-                    except:
-                        print(f"error at {i}, and {i+1}")
+        """Get number of unread bytes"""
+        return len(self)
 
     def _debug_play_buffer(self) -> None:
         """Play audio buffer (For Debugging only)"""
-        with self.queue.mutex:
-            packet = reduce(lambda x, y: x + y, self.queue.queue)
-            sd.play(np.frombuffer(packet.bytes, dtype=np.int16), 16000)
+        with self._lock:
+            unread = np.empty(self._size, dtype=np.uint8)
+            self._copy_out(unread)
+            sd.play(unread.view(np.int16), 16000)
 
     def is_empty(self) -> bool:
         """Check if queue is empty"""
-        return self.queue.qsize() == 0 and self.leftover is None
+        return len(self) == 0
 
     def dump_to_packet(self) -> AudioPacket:
         """Dump audio buffer to audio packet"""
         with self._lock:
-            data_packets = Queue()
-            while not self.is_empty():
-                try:
-                    data_packets.put_nowait(self.get(frame_size=-1))
-                except AudioBuffer.Empty:
-                    break
-            data_packets = [data_packets.get_nowait() for _ in range(data_packets.qsize())]
-            data = reduce(lambda x, y: x + y, data_packets)
-            return AudioPacket(data)
\ No newline at end of file
+            if self.is_empty():
+                raise AudioBuffer.Empty
+            return self._read(len(self))
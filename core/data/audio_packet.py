@@ -1,20 +1,43 @@
 import json
 import numpy as np
 from decimal import *
-from typing import Type
+from threading import Lock
+from typing import List, Optional, Type
 from loguru import logger
 
 from .data_packet import DataPacket
+from .resampler import StreamResampler, resample as resample_waveform
 
 class AudioPacket(DataPacket):
-    """Represents a "Packet" of audio data."""
+    """Represents a "Packet" of audio data.
+
+    The audio bytes are kept as a list of segments (a rope) so that `+` only
+    appends references; they are joined into one contiguous buffer lazily, the
+    first time `bytes` is read.
+    """
+    __slots__ = (
+        "_src_sample_rate", "_src_num_channels", "_src_sample_width",
+        "_dst_sample_rate", "_dst_num_channels", "_dst_sample_width",
+        "_id", "_source", "_duration",
+        "_segments", "_num_segments", "_frame_size", "_float_cache",
+    )
     resampling = 0
+    _segments_lock = Lock()
 
-    def __init__(self, data_json, resample=True, is_processed=False, target_sample_rate=16000):
+    def __init__(
+        self, data_json, resample=True, is_processed=False, target_sample_rate=16000, channels=None,
+        resampler: Optional[StreamResampler]=None
+    ):
         """Initialize AudioPacket from json data or bytes
 
         Args:
             data_json (dict or bytes): json data or bytes
+            resample (bool, optional): whether to resample to target_sample_rate. Defaults to True.
+            is_processed (bool, optional): whether bytes are already 1ch int16. Defaults to False.
+            target_sample_rate (int, optional): sample rate to resample to. Defaults to 16000.
+            channels (Sequence[int], optional): indices of channels to keep before downmixing. Defaults to all.
+            resampler (StreamResampler, optional): resampler of the stream this packet belongs to, keeps
+                filter state across packets. Defaults to resampling this packet on its own.
         """
         if not isinstance(data_json, dict):
             data_json = json.loads(str(data_json))
@@ -38,13 +61,16 @@ class AudioPacket(DataPacket):
 
         # NOTE: we do not keep the src_bytes as they might not be even there
         if not is_processed:
-            self._dst_bytes = self._preprocess_audio_buffer(
+            _bytes = self._preprocess_audio_buffer(
                 data_json.get("bytes", data_json.get("audio")),
                 resample=resample,
-                target_sample_rate=target_sample_rate
+                target_sample_rate=target_sample_rate,
+                channels=channels,
+                resampler=resampler,
             )
         else:
-            self._dst_bytes = data_json["bytes"]
+            _bytes = data_json["bytes"]
+        self._set_segments([_bytes] if len(_bytes) > 0 else [], len(_bytes))
 
         # NOTE: this is happening after the resampling and processing
         self._duration = data_json.get("duration")  # ms
@@ -67,21 +93,78 @@ class AudioPacket(DataPacket):
     # def start(self):
     #     return self._start
 
+    def _set_segments(self, segments: List[bytes], frame_size: int, num_segments: int = None) -> None:
+        """Point this packet at the first `num_segments` entries of `segments`
+
+        Args:
+            segments (List[bytes]): segment list, possibly shared with other packets
+            frame_size (int): total number of bytes in the used segments
+            num_segments (int, optional): number of segments owned by this packet. Defaults to all.
+        """
+        self._segments = segments
+        self._num_segments = len(segments) if num_segments is None else num_segments
+        self._frame_size = frame_size
+        self._float_cache = None
+
+    def _collapse_segments(self) -> None:
+        """Join the segments into a single contiguous buffer owned by this packet"""
+        _bytes = b"".join(self._segments[:self._num_segments])
+        self._set_segments([_bytes], len(_bytes))
+
+    @property
+    def segments(self) -> List[bytes]:
+        """Buffers (bytes or bytes-like views) that make up the packet, in order, without joining them"""
+        return self._segments[:self._num_segments]
+
+    def copy(self) -> "AudioPacket":
+        """Get a packet with the same data in its own contiguous buffer, detached from any shared memory"""
+        _bytes = bytes(self.bytes) if self._num_segments else b""
+        return self._derive([_bytes] if _bytes else [], len(_bytes), self.timestamp)
+
     @property
     def bytes(self):
-        return self._dst_bytes
+        if self._num_segments != 1 or not isinstance(self._segments[0], bytes):
+            # several segments or a view on shared memory (e.g. an AudioBuffer frame)
+            self._collapse_segments()
+        return self._segments[0]
 
     @property
-    def float(self):
+    def int16(self) -> np.ndarray:
+        """Get audio buffer as a read-only int16 view, without copying unless the packet has several segments
+
+        Returns:
+            np.array(int16): audio buffer as int16
+        """
+        if self.sample_width != 2:
+            raise ValueError(f"int16 view needs a sample width of 2, found {self.sample_width}")
+        if self._num_segments == 0:
+            return np.zeros(0, dtype=np.int16)
+        if self._num_segments > 1:
+            self._collapse_segments()
+        samples = np.frombuffer(self._segments[0], dtype=np.int16)
+        samples.flags.writeable = False
+        return samples
+
+    @property
+    def float(self) -> np.ndarray:
         """Get audio buffer as float
 
+        Computed on first access and cached until the packet buffer changes.
+
         Returns:
-            np.array(float): audio buffer as float
+            np.array(float32): read-only audio buffer as float32 in [-1, 1]
         """
-        # NOTE: adding silence to make sure the length is a multiple of 32
-        # approximation to convert int16 to float32
-        _bytes = self.bytes + b'0'*(len(self.bytes)%32)
-        return np.frombuffer(_bytes, dtype=np.float32).copy()
+        if self._float_cache is None:
+            if self.sample_width == 4:
+                if self._num_segments > 1:
+                    self._collapse_segments()
+                samples = np.frombuffer(self._segments[0], dtype=np.float32) if self._num_segments else np.zeros(0, dtype=np.float32)
+            else:
+                samples = self.int16.astype(np.float32)
+                samples *= np.float32(1 / (1 << 15))
+            samples.flags.writeable = False
+            self._float_cache = samples
+        return self._float_cache
 
     @property
     def sample_rate(self):
@@ -100,13 +183,22 @@ class AudioPacket(DataPacket):
     @property
     def frame_size(self):
         """Get frame size of AudioPacket"""
-        return len(self.bytes)
+        return self._frame_size
 
     @property
     def duration(self):
         """Get duration of AudioPacket in ms"""
         return self._duration
 
+    @property
+    def partial(self):
+        """Whether the packet is a chunk of an utterance still being spoken"""
+        return self._partial
+
+    @partial.setter
+    def partial(self, partial: bool):
+        self._partial = partial
+
     @property
     def id(self):
         return self._id
@@ -151,6 +243,45 @@ class AudioPacket(DataPacket):
                 )
             
         
+    _SAMPLE_DTYPES = {2: np.int16, 4: np.float32}
+
+    @staticmethod
+    def ingest_to_float(buffer, num_channels, sample_width, channels=None) -> np.ndarray:
+        """Convert an interleaved audio buffer to mono float32 in [-1, 1]
+
+        Channel selection, downmixing and dtype conversion are done with a
+        single reshape-and-mean over the samples.
+
+        Args:
+            buffer (bytes or list or np.array): interleaved samples, int16 (width 2) or float32 (width 4)
+            num_channels (int): number of interleaved channels
+            sample_width (int): sample width of buffer
+            channels (Sequence[int], optional): indices of channels to keep. Defaults to all.
+
+        Returns:
+            np.array(float32): mono audio buffer
+        """
+        if sample_width not in AudioPacket._SAMPLE_DTYPES:
+            raise ValueError(f"Unhandled sample width `{sample_width}`. Please use `2` or `4`")
+        dtype = AudioPacket._SAMPLE_DTYPES[sample_width]
+        if isinstance(buffer, (bytes, bytearray, memoryview)):
+            samples = np.frombuffer(buffer, dtype=dtype)
+        else:
+            samples = np.asarray(buffer, dtype=dtype)
+
+        if num_channels > 1 or channels is not None:
+            # drop a trailing incomplete frame if any
+            samples = samples[:len(samples) - len(samples) % num_channels].reshape((-1, num_channels))
+            if channels is not None:
+                samples = samples[:, channels]
+            mono = samples.mean(axis=1, dtype=np.float32)
+        else:
+            mono = samples.astype(np.float32)
+
+        if sample_width == 2:
+            mono *= np.float32(1 / (1 << 15))
+        return mono
+
     @staticmethod
     def from_bytes_to_float(buffer, sample_rate, num_channels, sample_width):
         """Convert audio buffer from bytes to float
@@ -162,26 +293,19 @@ class AudioPacket(DataPacket):
             sample_width (int): sample width of buffer
 
         Returns:
-            np.array(float): audio buffer as float
+            np.array(float): audio buffer as float of shape (samples, channels)
         """
         if buffer == b"":
-            # logger.debug("0 Returning empty buffer")
             # DUMMY AUX PACKET
             return buffer
-        
+
+        if sample_width not in AudioPacket._SAMPLE_DTYPES:
+            raise ValueError(f"Unhandled sample width `{sample_width}`. Please use `2` or `4`")
+        buffer_float = np.frombuffer(buffer, dtype=AudioPacket._SAMPLE_DTYPES[sample_width]).reshape((-1, num_channels))
         if sample_width == 2: # int16
-            # logger.debug("1 Converting buffer to int16")
-            buffer_float = np.frombuffer(buffer, dtype=np.int16).reshape((-1, num_channels)) / (1 << (8 * sample_width - 1))
-            # import soundfile as sf
-            # sf.write(f"__original_{AudioPacket.resampling}.wav", buffer_float, sample_rate)
-        elif sample_width == 4: # float32
-            # logger.debug("1 Converting buffer to float32")
-            buffer_float = np.frombuffer(buffer, dtype=np.float32).reshape((-1, num_channels)) / (1 << (8 * sample_width - 1))
-        else:
-            raise ValueError(f"Unhandled format `{format}`. Please use `int16` or `float32`")
-        
-        return buffer_float
-    
+            buffer_float = buffer_float / (1 << 15)
+        return buffer_float.astype(np.float32, copy=False)
+
     @staticmethod
     def from_float_to_bytes(buffer_float, sample_rate, num_channels, sample_width):
         """Convert audio buffer from float to bytes
@@ -196,126 +320,73 @@ class AudioPacket(DataPacket):
             bytes: audio buffer as bytes
         """
         if buffer_float.size == 0:
-            # logger.debug("0 Returning empty buffer")
             # DUMMY AUX PACKET
             return buffer_float.tobytes()
 
         if sample_width == 2: # int16
-            # logger.debug("1 Converting buffer to int16")
-            buffer = (buffer_float * (1 << (8 * sample_width - 1))).astype(np.int16).reshape(-1).tobytes()
+            buffer = np.clip(buffer_float * (1 << 15), -(1 << 15), (1 << 15) - 1).astype(np.int16).reshape(-1).tobytes()
         elif sample_width == 4: # float32
-            # logger.debug("1 Converting buffer to float32")
-            buffer = (buffer_float * (1 << (8 * sample_width - 1))).astype(np.float32).reshape(-1).tobytes()
+            buffer = buffer_float.astype(np.float32).reshape(-1).tobytes()
         else:
             raise ValueError(f"Unhandled sample width `{sample_width}`. Please use `2` or `4` ")
 
         return buffer
-    
-    def _preprocess_audio_buffer(self, buffer, resample=True, target_sample_rate=16000):
+
+    def _preprocess_audio_buffer(self, buffer, resample=True, target_sample_rate=16000, channels=None, resampler=None):
         """Preprocess audio buffer to 16k 1ch int16 bytes format
 
         Args:
-            buffer Union(np.array(float), bytes): audio buffer
-            sample_rate (int): sample rate of buffer
-            num_channels (int): number of channels of buffer
+            buffer Union(np.array(float), bytes): interleaved audio buffer
+            resample (bool, optional): whether to resample to target_sample_rate. Defaults to True.
+            target_sample_rate (int, optional): sample rate to resample to. Defaults to 16000.
+            channels (Sequence[int], optional): indices of channels to keep before downmixing. Defaults to all.
+            resampler (StreamResampler, optional): stateful resampler of the stream. Defaults to None.
 
         Returns:
             bytes: preprocessed audio buffer
         """
+        # 1: Convert to mono float32, merging (selected) channels if > 1
+        one_channel_buffer = AudioPacket.ingest_to_float(
+            buffer, self._src_num_channels, self._src_sample_width, channels=channels
+        )
+        self._dst_num_channels = 1
+        self._dst_sample_width = 2
 
-        # TODO remove format as it is the same as sample_width
-        # 1: Convert to a NumPy array of float32
-        self._dst_sample_width = 2 # TODO debug this
-        if isinstance(buffer, bytes):
-            # 1.1: converting/ensuring a bytes buffer to np.array float32 from either 2 or 4 sample width
-            buffer_float = AudioPacket.from_bytes_to_float(
-                buffer, self._src_sample_rate, 
-                self._src_num_channels, self._src_sample_width
-            )
-        else:
-            # 1.2: converting/ensuring a np.array buffer to np.array float32 from either 2 or 4 sample width
-            if self._src_sample_width == 2:
-                buffer_float = np.fromstring(np.array(buffer, dtype=np.int16).tobytes(), dtype=np.float32)
-            elif self._src_sample_width == 4:
-                buffer_float = np.array(buffer).astype(np.float32)
-            else:
-                raise ValueError(f"Unhandled sample width `{self._src_sample_width}`. Please use `2` or `4`")
-            
-        # 2: Merge Channels if > 1
-        if self._src_num_channels > 1:
-            # TODO revise
-            logger.warning(f"AudioPacket has {self._src_num_channels} channels, merging to 1 channel")
-            one_channel_buffer = np.zeros(
-                len(buffer_float) // self._src_num_channels, dtype=np.float32
-            )
-            channel_contribution = 1 / self._src_num_channels
-            for i in range(len(one_channel_buffer)):
-                for channel_i in range(self._src_num_channels):
-                    one_channel_buffer[i] += (
-                        buffer_float[i * self._src_num_channels + channel_i]
-                        * channel_contribution
-                    )
-            self._dst_num_channels = 1
-        else:
-            one_channel_buffer = buffer_float
-
-
-        # 3: Resample if necessary
+        # 2: Resample if necessary
         final_buffer = one_channel_buffer
         if target_sample_rate != self._src_sample_rate and resample:
-            # debug resampling TODO
-            audio_resampled = AudioPacket.resample(one_channel_buffer, self._src_sample_rate, target_sample_rate)
+            if resampler is not None:
+                audio_resampled = resampler.process(one_channel_buffer, self._src_sample_rate, target_sample_rate)
+            else:
+                audio_resampled = AudioPacket.resample(one_channel_buffer, self._src_sample_rate, target_sample_rate)
             AudioPacket.resampling += 1
             self._dst_sample_rate = target_sample_rate
             final_buffer = audio_resampled
-        
-        if isinstance(buffer, bytes):
-            self._dst_bytes = AudioPacket.from_float_to_bytes(
-                final_buffer,
-                self._dst_sample_rate,
-                self._dst_num_channels,
-                self._dst_sample_width,
-            )
-        else:
-            self._dst_bytes = final_buffer.tobytes()
 
-        return self._dst_bytes
+        # 3: Convert to int16 bytes
+        return AudioPacket.from_float_to_bytes(
+            final_buffer,
+            self._dst_sample_rate,
+            self._dst_num_channels,
+            self._dst_sample_width,
+        )
 
     @staticmethod
     def resample(waveform, current_sample_rate, target_sample_rate):
-        # try:
-        if target_sample_rate == current_sample_rate:
-            return waveform
-
-        import torch
-        from torchaudio.transforms import Resample
+        """Resample a complete mono float buffer with a cached polyphase filter
 
-        if current_sample_rate > target_sample_rate:
-            waveform = torch.from_numpy(waveform.copy())
-
-            # check if resampler is defined and matching the same sample rates
-            resampler = Resample(current_sample_rate, target_sample_rate, dtype=waveform.dtype)
-            logger.debug(f"Resampling {current_sample_rate} -> {target_sample_rate}")
+        Args:
+            waveform (np.array(float)): audio buffer
+            current_sample_rate (int): sample rate of waveform
+            target_sample_rate (int): sample rate to resample to
 
-            audio_resampled = resampler(waveform).numpy()
-        else:
-            # TODO revise this
-            # if  target_sample_rate % current_sample_rate == 0:
-            #     rate = target_sample_rate // current_sample_rate
-            #     audio_resampled = np.zeros(rate*len(waveform)-rate+1, dtype=waveform.dtype)
-            #     audio_resampled[::rate] = waveform
-            #     audio_resampled[1::rate] = (waveform[:-1] + waveform[1:]) / 2
-            # else:
-            audio_resampled = np.zeros(int(len(waveform) * target_sample_rate / current_sample_rate), dtype=waveform.dtype)
-            for i in range(len(audio_resampled)):
-                audio_resampled[i] = waveform[int(i * current_sample_rate / target_sample_rate)]
-
-        # write the resampled audio to a wav file
-        # import soundfile as sf
-        # sf.write(f"resampled_{AudioPacket.resampling}.wav", audio_resampled, target_sample_rate)
-        # sf.write(f"original_{AudioPacket.resampling}.wav", waveform, current_sample_rate)
-
-        return audio_resampled
+        Returns:
+            np.array(float32): resampled audio buffer
+        """
+        if target_sample_rate == current_sample_rate:
+            return waveform
+        logger.trace(f"Resampling {current_sample_rate} -> {target_sample_rate}")
+        return resample_waveform(waveform, current_sample_rate, target_sample_rate)
 
     def __add__(self, _audio_packet: Type["AudioPacket"]):
         """Add two audio packets together and return new packet with combined bytes
@@ -348,62 +419,112 @@ class AudioPacket(DataPacket):
         #         )
 
         timestamp = self.timestamp
-        if self.bytes == b"":  # DUMMY AUX PACKET
+        if len(self) == 0:  # DUMMY AUX PACKET
             timestamp = _audio_packet.timestamp
 
-        return AudioPacket(
-            {
-                "bytes": self.bytes + _audio_packet.bytes,
-                "timestamp": timestamp,
-                "sampleRate": _audio_packet.sample_rate,
-                "numChannels": _audio_packet.num_channels,
-                "sampleWidth": _audio_packet.sample_width,
-                # "start": self._start,
-                "packetID": self.id
-            },
-            resample=False,
-            is_processed=True,
+        with AudioPacket._segments_lock:
+            if len(self._segments) == self._num_segments:
+                # self is the tip of its rope: extend the shared list in place,
+                # packets sharing it keep seeing only their first segments
+                segments = self._segments
+            else:
+                segments = self._segments[:self._num_segments]
+            segments.extend(_audio_packet._segments[:_audio_packet._num_segments])
+            num_segments = len(segments)
+
+        audio_packet = self._derive(
+            segments,
+            frame_size=len(self) + len(_audio_packet),
+            timestamp=timestamp,
+            num_segments=num_segments,
         )
+        if self._metadata is not None or _audio_packet._metadata is not None:
+            # stream clock timestamps, so the speech of both packets just adds up
+            speech_timestamps = (self._metadata or {}).get("speech_timestamps", []) + \
+                (_audio_packet._metadata or {}).get("speech_timestamps", [])
+            if speech_timestamps:
+                audio_packet.metadata["speech_timestamps"] = speech_timestamps
+        return audio_packet
+
+    def _derive(self, segments: List[bytes], frame_size: int, timestamp, num_segments: int = None) -> "AudioPacket":
+        """Create a processed AudioPacket with the same format as self, skipping the json constructor
+
+        Args:
+            segments (List[bytes]): segments of the new packet
+            frame_size (int): total number of bytes in the segments
+            timestamp (float): timestamp of the new packet
+            num_segments (int, optional): number of segments used from `segments`. Defaults to all.
+
+        Returns:
+            AudioPacket: new AudioPacket
+        """
+        packet = AudioPacket.__new__(AudioPacket)
+        DataPacket.__init__(packet, timestamp=timestamp)
+        packet._src_sample_rate = packet._dst_sample_rate = self.sample_rate
+        packet._src_num_channels = packet._dst_num_channels = self.num_channels
+        packet._src_sample_width = packet._dst_sample_width = self.sample_width
+        packet._id = self._id
+        packet._source = None
+        packet._set_segments(segments, frame_size, num_segments)
+        packet._duration = (frame_size / packet.sample_rate) / (packet.num_channels * packet.sample_width) * 1000  # ms
+        return packet
 
     def __getitem__(self, key):
         """Get item from AudioPacket
 
+        Slices are read-only views sharing the memory of this packet; their
+        timestamp and duration are derived arithmetically. The shared memory stays
+        alive as long as the view does, use `copy()` to detach a small slice from
+        a large parent buffer.
+
         Args:
             key (int or slice): index or slice
 
         Returns:
-            AudioPacket: new AudioPacket with sliced bytes
+            AudioPacket: new AudioPacket viewing the sliced bytes
         """
         if isinstance(key, slice):
             # Note that step != 1 is not supported
             start, stop, step = key.indices(len(self))
             if step != 1:
-                raise (NotImplementedError, "step != 1 not supported")
-
-            if start < 0:
-                raise (NotImplementedError, "start < 0 not supported")
-
-            if stop > len(self):
-                raise (NotImplementedError, "stop > len(self) not supported")
+                raise NotImplementedError("step != 1 not supported")
+            stop = max(start, stop)
+
+            views = []
+            offset = 0
+            for segment in self.segments:
+                if offset >= stop:
+                    break
+                segment_size = len(segment)
+                segment_start, segment_stop = max(start - offset, 0), min(stop - offset, segment_size)
+                if segment_start < segment_stop:
+                    view = memoryview(segment)
+                    if not view.readonly:
+                        view = view.toreadonly()
+                    if segment_start > 0 or segment_stop < segment_size:
+                        view = view[segment_start:segment_stop]
+                    views.append(view)
+                offset += segment_size
 
             # calculate new timestamp
-            calculated_timestamp = (
-                self.timestamp + float((start / self.frame_size)) * self.duration
-            )
-
-            return AudioPacket(
-                {
-                    "bytes": self.bytes[start:stop],
-                    "timestamp": calculated_timestamp,
-                    "sampleRate": self.sample_rate,
-                    "numChannels": self.num_channels,
-                    "sampleWidth": self.sample_width,
-                    # "start": self._start,
-                    "packetID": self._id
-                },
-                resample=False,
-                is_processed=True,
-            )
+            calculated_timestamp = self.timestamp
+            if self.frame_size > 0:
+                calculated_timestamp += (start / self.frame_size) * self.duration
+
+            audio_packet = self._derive(views, stop - start, calculated_timestamp)
+            if self._float_cache is not None and self.sample_width == 2 and start % 2 == 0 and stop % 2 == 0:
+                audio_packet._float_cache = self._float_cache[start // 2:stop // 2]
+            if self._metadata is not None and self._metadata.get("speech_timestamps"):
+                # keep the speech within the slice
+                slice_end = audio_packet.timestamp + audio_packet.duration
+                speech_timestamps = [
+                    (max(speech_start, audio_packet.timestamp), min(speech_end, slice_end))
+                    for speech_start, speech_end in self._metadata["speech_timestamps"]
+                    if speech_start < slice_end and speech_end > audio_packet.timestamp
+                ]
+                if speech_timestamps:
+                    audio_packet.metadata["speech_timestamps"] = speech_timestamps
+            return audio_packet
 
         elif isinstance(key, int):
             raise NotImplementedError("value as index; only slices")
@@ -414,7 +535,7 @@ class AudioPacket(DataPacket):
         
     
     def __str__(self) -> str:
-        return f"{self.timestamp}, {self._duration}, {len(self.bytes)}"
+        return f"{self.timestamp}, {self._duration}, {self.frame_size}"
 
     def __eq__(self, __o: object) -> bool:
         return self.timestamp == __o.timestamp
@@ -1,10 +1,22 @@
 import functools
-from typing import Type
+from typing import List, Optional, Tuple, Type, TypedDict
 from abc import ABCMeta, abstractmethod
 from datetime import datetime
 
+
+class PacketMetadata(TypedDict, total=False):
+    """Optional metadata travelling with a packet through the pipeline"""
+    recog_time: float  # seconds spent on recognition (STT)
+    recorded_audio_length: float  # ms of audio the transcription is based on
+    speech_timestamps: List[Tuple[float, float]]  # (start, end) in ms of the speech in an utterance, on the stream clock
+    timestamp_map: List[Tuple[float, float]]  # (compacted, original) ms at the start of each piece kept of a compacted utterance
+    keyword: str  # keyword spotted in the utterance, transcribed as is
+    spoken_command: str  # bot action of the spotted keyword, answered without the LLM
+
+
 @functools.total_ordering
 class DataPacket(metaclass=ABCMeta):
+    __slots__ = ("_timestamp", "_start", "_partial", "_metadata")
 
     def __init__(
         self, 
@@ -18,11 +30,19 @@ class DataPacket(metaclass=ABCMeta):
         self._timestamp = timestamp
         self._start = start
         self._partial = partial
+        self._metadata: Optional[PacketMetadata] = None
 
     @property
     def timestamp(self):
         return self._timestamp
 
+    @property
+    def metadata(self) -> PacketMetadata:
+        """Metadata of the packet, created on first access"""
+        if self._metadata is None:
+            self._metadata = PacketMetadata()
+        return self._metadata
+
     def to_dict(self) -> dict:
         return {"timestamp": self.timestamp}
 
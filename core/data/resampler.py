@@ -0,0 +1,170 @@
+import numpy as np
+from math import gcd
+from functools import lru_cache
+from typing import Optional, Tuple
+from numpy.lib.stride_tricks import sliding_window_view
+
+
+ZERO_CROSSINGS = 16  # half width of the low-pass filter, in samples of the lower rate
+ROLLOFF = 0.945  # cutoff as a fraction of the lower Nyquist frequency
+KAISER_BETA = 8.6
+
+
+@lru_cache(maxsize=32)
+def get_filter_bank(src_sample_rate: int, dst_sample_rate: int) -> Tuple[np.ndarray, int, int, int]:
+    """Design (once per rate pair) the polyphase filter bank for src -> dst resampling
+
+    A windowed-sinc low-pass filter running at `up` times the source rate is split
+    into `up` phases of `taps` coefficients each. Phase rows are stored reversed so
+    that they can be multiplied directly with a forward window of input samples.
+
+    Args:
+        src_sample_rate (int): source sample rate
+        dst_sample_rate (int): destination sample rate
+
+    Returns:
+        Tuple[np.array(float32), int, int, int]: bank of shape (up, taps), up, down, group delay in upsampled samples
+    """
+    divisor = gcd(src_sample_rate, dst_sample_rate)
+    up, down = dst_sample_rate // divisor, src_sample_rate // divisor
+
+    num_coefficients = 2 * ZERO_CROSSINGS * max(up, down) + 1
+    cutoff = ROLLOFF / max(up, down)
+    n = np.arange(num_coefficients) - (num_coefficients - 1) / 2
+    prototype = up * cutoff * np.sinc(cutoff * n) * np.kaiser(num_coefficients, KAISER_BETA)
+
+    taps = -(-num_coefficients // up)
+    prototype = np.pad(prototype, (0, taps * up - num_coefficients))
+    # bank[p, k] = prototype[p + (taps - 1 - k) * up]
+    bank = prototype.reshape((taps, up)).T[:, ::-1]
+    bank = np.ascontiguousarray(bank, dtype=np.float32)
+    bank.setflags(write=False)
+    return bank, up, down, (num_coefficients - 1) // 2
+
+
+class PolyphaseResampler:
+    """Streaming polyphase FIR resampler between two fixed sample rates
+
+    Keeps the filter history and output phase between calls to `process`, so a
+    stream chunked into packets is resampled exactly as if it were one buffer.
+    Output is aligned with the input and lags it by the filter half width
+    (ZERO_CROSSINGS samples of the lower rate, 1 ms at 16 kHz).
+    """
+
+    def __init__(self, src_sample_rate: int, dst_sample_rate: int):
+        self.src_sample_rate = src_sample_rate
+        self.dst_sample_rate = dst_sample_rate
+        self._bank, self._up, self._down, self._delay = get_filter_bank(src_sample_rate, dst_sample_rate)
+        self.reset()
+
+    @property
+    def taps(self) -> int:
+        return self._bank.shape[1]
+
+    def reset(self) -> None:
+        """Forget the stream history"""
+        self._history = np.zeros(self.taps - 1, dtype=np.float32)
+        # upsampled time of the next output, relative to the first sample of the next chunk
+        self._next_time = self._delay
+
+    def process(self, waveform: np.ndarray) -> np.ndarray:
+        """Resample the next chunk of the stream
+
+        Args:
+            waveform (np.array(float)): mono chunk at src_sample_rate
+
+        Returns:
+            np.array(float32): resampled chunk at dst_sample_rate
+        """
+        waveform = np.asarray(waveform, dtype=np.float32).reshape(-1)
+        padded = np.concatenate([self._history, waveform])
+        end_time = len(waveform) * self._up
+
+        if self._next_time < end_time:
+            times = np.arange(self._next_time, end_time, self._down)
+            windows = sliding_window_view(padded, self.taps)
+            resampled = np.einsum(
+                "nk,nk->n", self._bank[times % self._up], windows[times // self._up]
+            ).astype(np.float32, copy=False)
+            self._next_time = int(times[-1]) + self._down
+        else:
+            resampled = np.zeros(0, dtype=np.float32)
+
+        self._next_time -= end_time
+        self._history = padded[len(padded) - (self.taps - 1):].copy()
+        return resampled
+
+    def flush(self) -> np.ndarray:
+        """Return the samples still held back by the filter delay and reset"""
+        num_pending = max(0, -(-(self._delay - self._next_time) // self._down))
+        resampled = self.process(np.zeros(self.taps, dtype=np.float32))[:num_pending]
+        self.reset()
+        return resampled
+
+
+class StreamResampler:
+    """Resampler for one audio stream whose rates may change between chunks
+
+    Wraps a PolyphaseResampler, recreating it (filter banks are cached) whenever
+    the source or destination rate changes.
+    """
+
+    def __init__(self):
+        self._resampler: Optional[PolyphaseResampler] = None
+
+    def process(self, waveform: np.ndarray, src_sample_rate: int, dst_sample_rate: int) -> np.ndarray:
+        """Resample the next chunk of the stream
+
+        Args:
+            waveform (np.array(float)): mono chunk
+            src_sample_rate (int): sample rate of waveform
+            dst_sample_rate (int): target sample rate
+
+        Returns:
+            np.array(float32): resampled chunk
+        """
+        if src_sample_rate == dst_sample_rate:
+            return waveform
+        if (
+            self._resampler is None
+            or self._resampler.src_sample_rate != src_sample_rate
+            or self._resampler.dst_sample_rate != dst_sample_rate
+        ):
+            self._resampler = PolyphaseResampler(src_sample_rate, dst_sample_rate)
+        return self._resampler.process(waveform)
+
+    @property
+    def dst_sample_rate(self) -> Optional[int]:
+        """Sample rate of the last resampled chunk, None if nothing was resampled"""
+        return self._resampler.dst_sample_rate if self._resampler is not None else None
+
+    def flush(self) -> np.ndarray:
+        """Return the end of the stream still held back by the filter delay (at dst_sample_rate) and reset
+
+        Returns:
+            np.array(float32): the last resampled samples, empty if nothing was resampled
+        """
+        if self._resampler is None:
+            return np.zeros(0, dtype=np.float32)
+        return self._resampler.flush()
+
+    def reset(self) -> None:
+        if self._resampler is not None:
+            self._resampler.reset()
+
+
+def resample(waveform: np.ndarray, src_sample_rate: int, dst_sample_rate: int) -> np.ndarray:
+    """Resample a complete (non-streamed) buffer
+
+    Args:
+        waveform (np.array(float)): mono buffer at src_sample_rate
+        src_sample_rate (int): sample rate of waveform
+        dst_sample_rate (int): target sample rate
+
+    Returns:
+        np.array(float32): buffer at dst_sample_rate of length ceil(len * dst / src)
+    """
+    if src_sample_rate == dst_sample_rate:
+        return waveform
+    resampler = PolyphaseResampler(src_sample_rate, dst_sample_rate)
+    return np.concatenate([resampler.process(waveform), resampler.flush()])
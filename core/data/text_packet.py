@@ -1,9 +1,10 @@
 from typing import List
 from loguru import logger
-from .data_packet import DataPacket
+from .data_packet import DataPacket, PacketMetadata
 from .exceptions import SequenceMismatchException
 
 class TextPacket(DataPacket):
+    __slots__ = ("_text", "commands")
 
     def __init__(
         self, text: str,
@@ -11,7 +12,7 @@ class TextPacket(DataPacket):
         start: bool,
         commands: List[str]=[],
         timestamp=None,
-        **metadata # TODO add metadata to all packets
+        **metadata
     ):
         super().__init__(
             timestamp=timestamp,
@@ -20,8 +21,8 @@ class TextPacket(DataPacket):
         )
         self._text = text
         self.commands = commands if commands else []
-        for key, value in metadata.items():
-            setattr(self, key, value)
+        if metadata:
+            self._metadata = PacketMetadata(**metadata)
 
     @property
     def text(self):
@@ -0,0 +1,73 @@
+import struct
+
+# Binary `stream_audio` frame, sent as a socket.io binary attachment:
+# magic (2s), version (B), numChannels (B), sampleWidth (B), pad, sampleRate (I), sequence (I), timestamp in ms (Q)
+# followed by raw interleaved PCM. Keep in sync with client/python/wire_format.py
+WIRE_FORMAT_BINARY = "binary/v1"
+WIRE_FORMAT_DICT = "dict"
+SUPPORTED_WIRE_FORMATS = [WIRE_FORMAT_BINARY, WIRE_FORMAT_DICT]
+
+FRAME_MAGIC = b"MA"
+FRAME_VERSION = 1
+FRAME_HEADER = struct.Struct("<2sBBBxIIQ")
+
+
+class WireFormatError(ValueError):
+    """Exception raised when a binary audio frame cannot be decoded"""
+    pass
+
+
+def pack_audio_frame(pcm: bytes, sequence: int, timestamp: int, sample_rate: int, sample_width: int, num_channels: int) -> bytes:
+    """Pack raw PCM and its format into a binary audio frame
+
+    Args:
+        pcm (bytes): raw interleaved PCM
+        sequence (int): sequence number of the frame in its stream
+        timestamp (int): capture time in ms
+        sample_rate (int): sample rate of pcm
+        sample_width (int): sample width of pcm in bytes
+        num_channels (int): number of interleaved channels
+
+    Returns:
+        bytes: binary frame
+    """
+    header = FRAME_HEADER.pack(
+        FRAME_MAGIC, FRAME_VERSION, num_channels, sample_width,
+        sample_rate, sequence & 0xFFFFFFFF, int(timestamp),
+    )
+    return header + pcm
+
+
+def unpack_audio_frame(frame: bytes) -> dict:
+    """Unpack a binary audio frame into AudioPacket json data
+
+    Args:
+        frame (bytes): binary frame
+
+    Returns:
+        dict: json data accepted by AudioPacket, the PCM is a zero-copy memoryview
+
+    Raises:
+        WireFormatError: if the header is invalid
+    """
+    if len(frame) < FRAME_HEADER.size:
+        raise WireFormatError(f"Frame of {len(frame)} bytes is shorter than its header")
+    magic, version, num_channels, sample_width, sample_rate, sequence, timestamp = FRAME_HEADER.unpack_from(frame)
+    if magic != FRAME_MAGIC or version != FRAME_VERSION:
+        raise WireFormatError(f"Unsupported frame magic/version: {magic!r}/{version}")
+    return {
+        "bytes": memoryview(frame)[FRAME_HEADER.size:],
+        "sampleRate": sample_rate,
+        "sampleWidth": sample_width,
+        "numChannels": num_channels,
+        "timestamp": timestamp,
+        "packetID": sequence,
+    }
+
+
+def negotiate_wire_format(client_formats) -> str:
+    """Pick the first format proposed by the client that is supported, falling back to dict"""
+    for wire_format in client_formats or []:
+        if wire_format in SUPPORTED_WIRE_FORMATS:
+            return wire_format
+    return WIRE_FORMAT_DICT
@@ -1,4 +1,4 @@
-from typing import Optional
+from typing import List, Optional
 from abc import ABCMeta, abstractmethod
 from functools import reduce
 from core.data import AudioPacket, TextPacket
@@ -19,6 +19,10 @@ class AudioToAudioStage(PipelineStage, metaclass=ABCMeta):
     def frame_size(self):
         return self._frame_size
 
+    def _unpack_batch(self) -> List[AudioPacket]:
+        """Drain all complete frames from the input buffer"""
+        return self._input_buffer.get_frames_nowait()
+
     @abstractmethod
     def _process(self, audio_packet: AudioPacket) -> Optional[TextPacket]:
         raise NotImplementedError()
\ No newline at end of file
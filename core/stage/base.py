@@ -1,7 +1,7 @@
 from abc import ABCMeta, abstractmethod
-from typing import Callable, List, Optional, Union
-from threading import RLock
-from multiprocessing import JoinableQueue
+from typing import Callable, Iterator, List, Optional, Union
+from threading import Event, RLock
+from queue import Queue
 from queue import Empty as QueueEmpty
 from loguru import logger
 from ..data.data_packet import DataPacket
@@ -42,10 +42,25 @@ class PipelineStage(metaclass=ABCMeta):
     def __init__(
         self,
         verbose=False,
+        tick_interval: Optional[float] = None,
+        batch_processing: bool = False,
         **kwargs
     ):
-        self._input_buffer = JoinableQueue()
+        """Initialize pipeline stage
+
+        Args:
+            verbose (bool, optional): Whether to print debug messages. Defaults to False.
+            tick_interval (float, optional): Seconds after which an idle stage runs `_process` again even
+                if nothing was fed, for stages with periodic work. Defaults to None (only wake up on input).
+            batch_processing (bool, optional): Whether each loop drains everything available from the input
+                buffer and hands it to `_process_batch` at once. Defaults to False.
+        """
+        self._input_buffer = Queue()
         self._intermediate_input_buffer = []
+        self._tick_interval = tick_interval
+        self._batch_processing = batch_processing
+        # set whenever there may be new work: input fed or interrupt signalled
+        self._wakeup = Event()
 
         self._verbose = verbose
         self._lock = RLock() # TODO option to disable lock
@@ -53,6 +68,7 @@ class PipelineStage(metaclass=ABCMeta):
         self._host: 'DigitalAssistant' = None
         self._is_interrupt_forward_pending: bool = False
         self._is_interrupt_signal_pending: bool = False
+        self._is_running: bool = False
 
     @property
     def host(self):
@@ -99,10 +115,30 @@ class PipelineStage(metaclass=ABCMeta):
         return complete_data_packet
 
 
+    def _unpack_batch(self) -> List[DataPacket]:
+        """Drain all packets available in the input buffer, without merging them"""
+        data_packets: List[DataPacket] = self._intermediate_input_buffer
+        self._intermediate_input_buffer = []
+        while True:
+            try:
+                data_packets.append(self._input_buffer.get_nowait())
+            except QueueEmpty:
+                return data_packets
+
     @abstractmethod
     def _process(self, data_packet: DataPacket) -> Optional[Union[DataPacket, List[DataPacket]]]:
         raise NotImplementedError()
 
+    def _process_batch(self, data_packets: List[DataPacket]) -> Iterator[Optional[Union[DataPacket, bool]]]:
+        """Process a batch of drained packets, yielding one result per packet in order
+
+        Override to evaluate the whole batch at once (e.g. one model call) before
+        yielding; the per-packet work after each `yield` still runs frame by frame,
+        interleaved with interrupt checks and outputs. Defaults to `_process` on each packet.
+        """
+        for data_packet in data_packets:
+            yield self._process(data_packet)
+
     def on_sleep(self) -> None:
         pass
 
@@ -123,11 +159,21 @@ class PipelineStage(metaclass=ABCMeta):
         logger.info(f'Starting {self}')
 
         self._host = host
+        self._is_running = True
 
         self.on_start()
 
+        if hasattr(self._host, "create_event"):
+            # an event matching the host's async model, keeping an early wake up if any
+            wakeup = self._host.create_event()
+            if self._wakeup.is_set():
+                wakeup.set()
+            self._wakeup = wakeup
+
         def _start_thread():
-            while True:
+            while self._is_running:
+                # NOTE: cleared before unpacking so that a feed during processing is not missed
+                self._wakeup.clear()
                 with self._lock:
                     data = self._unpack()
                     data_packet = self._process(data)
@@ -136,17 +182,52 @@ class PipelineStage(metaclass=ABCMeta):
                         self.on_interrupt()
 
                 if data_packet is None:
-                    self._host.sleep(0.05)
                     self.on_sleep()
+                    self._wakeup.wait(self._tick_interval)
                 elif not isinstance(data_packet, bool):
                     # TODO this is just hacky way.. use proper standards
                     self.on_ready(data_packet)
-                    
 
-        self._processor = self._host.start_background_task(_start_thread)
+        def _start_batch_thread():
+            while self._is_running:
+                self._wakeup.clear()
+                with self._lock:
+                    data_packets = self._unpack_batch()
+                    results = iter(self._process_batch(data_packets))
+                    if not data_packets and self._is_interrupt_signal_pending:
+                        self.on_interrupt()
+
+                is_idle = True
+                for _ in range(len(data_packets)):
+                    # NOTE: the lock is released between frames to emit their output
+                    with self._lock:
+                        data_packet = next(results)
+                        if self._is_interrupt_signal_pending:
+                            self.on_interrupt()
+
+                    if data_packet is None:
+                        continue
+                    is_idle = False
+                    if not isinstance(data_packet, bool):
+                        self.on_ready(data_packet)
+
+                if is_idle:
+                    self.on_sleep()
+                    self._wakeup.wait(self._tick_interval)
+
+        self._processor = self._host.start_background_task(
+            _start_batch_thread if self._batch_processing else _start_thread
+        )
+
+    def stop(self) -> None:
+        """Stop processing thread after its current loop"""
+        logger.info(f'Stopping {self}')
+        self._is_running = False
+        self._wakeup.set()
 
     def feed(self, data_packet: DataPacket) -> None:
         self._input_buffer.put(data_packet)
+        self._wakeup.set()
 
     def log(self, msg, end="", force=False) -> None:
         """Log message to console if verbose is True or force is True with flush
@@ -171,6 +252,7 @@ class PipelineStage(metaclass=ABCMeta):
 
     def signal_interrupt(self, timestamp: int):
         self._is_interrupt_signal_pending = True
+        self._wakeup.set()
         # TODO use timestamp
 
     def on_interrupt(self):
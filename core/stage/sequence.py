@@ -19,7 +19,8 @@ class PipelineSequence(PipelineStage):
         verbose=False,
         **kwargs
     ):
-        self._stages: List[PipelineStage] = stages
+        # NOTE: copied so that sequences never share the default list
+        self._stages: List[PipelineStage] = list(stages)
         self._verbose = verbose
         self._on_ready_callback = lambda x: None
         self._host: 'DigitalAssistant' = None
@@ -45,7 +46,7 @@ class PipelineSequence(PipelineStage):
             next_stage: Optional[PipelineStage],
         ):
             def _callback(data_packet: DataPacket):
-                from mangrove import STTStage, BotStage, TTSStage
+                from mangrove import STTStage, BotStage, TTSStage, WakeWordStage
 
                 if stage.is_interrupt_forward_pending():
                     import time
@@ -78,6 +79,9 @@ class PipelineSequence(PipelineStage):
                 elif isinstance(stage, TTSStage):
                     assert isinstance(data_packet, TTSStage.output_type), f"Expected {TTSStage.output_type}, got {type(data_packet)}"
                     self._host.emit_bot_voice(data_packet)
+                elif isinstance(stage, WakeWordStage):
+                    # forwards the raw frames once awake, nothing to emit
+                    pass
                 else:
                     logger.info(f"Unknown stage type {type(stage)}, not emitting response")    
                     # raise ValueError("Unknown Pipeline Stage Type")
@@ -93,6 +97,11 @@ class PipelineSequence(PipelineStage):
         self._host = host
         self.on_start()
 
+    def stop(self):
+        """Stop processing threads of all stages"""
+        for stage in self._stages:
+            stage.stop()
+
     def feed(self, data_packet: DataPacket):
         if data_packet is None:
             return None
@@ -1,2 +1,3 @@
 from .audio import *
-from .timer import Timer
\ No newline at end of file
+from .timer import Timer
+from .model_registry import ModelRegistry
@@ -6,8 +6,8 @@ import backoff
 import numpy as np
 from pydub import AudioSegment
 from loguru import logger
-from typing import Generator
-from core import AudioPacket
+from typing import Generator, Optional
+from core import AudioPacket, StreamResampler
 
 # TODO adjust automatically a sort of universal target_sample_rate according to client's perference!
 TARGET_SAMPLE_RATE = 48000
@@ -29,7 +29,8 @@ def filepath_to_audio_packet(
     if remove_after:
         os.remove(filepath)
 
-    # chunk the audio
+    # chunk the audio, resampling the chunks as one stream
+    resampler = StreamResampler()
     for i in range(0, len(audio), chunk_size):
         yield AudioPacket({
                 'bytes': audio[i:i + chunk_size]._data,
@@ -37,12 +38,42 @@ def filepath_to_audio_packet(
                 'sampleWidth': audio.sample_width,
                 'numChannels': audio.channels,
             }, resample=True, is_processed=False, 
-            target_sample_rate=target_sample_rate
+            target_sample_rate=target_sample_rate,
+            resampler=resampler
         )
+    tail = flush_resampler_to_audio_packet(resampler)
+    if tail is not None:
+        yield tail
+
+def flush_resampler_to_audio_packet(resampler: Optional[StreamResampler]) -> Optional[AudioPacket]:
+    """Last packet of a stream resampled chunk by chunk: the samples the resampler's filter delay held back
+
+    Streams converted with the helpers below and a shared `resampler` end with it.
+
+    Args:
+        resampler (StreamResampler, optional): resampler of the stream, reset after.
+
+    Returns:
+        Optional[AudioPacket]: the packet, None if nothing is pending
+    """
+    if resampler is None or resampler.dst_sample_rate is None:
+        return None
+    sample_rate = resampler.dst_sample_rate
+    waveform = resampler.flush()
+    if waveform.size == 0:
+        return None
+    return AudioPacket({
+            'bytes': AudioPacket.from_float_to_bytes(waveform, sample_rate, 1, 2),
+            'sampleRate': sample_rate,
+            'sampleWidth': 2,
+            'numChannels': 1,
+        }, resample=False, is_processed=True
+    )
 
 def pydub_audio_segment_to_audio_packet(
         audio_segment: AudioSegment,
-        target_sample_rate: int=TARGET_SAMPLE_RATE
+        target_sample_rate: int=TARGET_SAMPLE_RATE,
+        resampler: Optional[StreamResampler]=None
     ) -> AudioPacket:
     return AudioPacket({
             'bytes': audio_segment._data,
@@ -50,7 +81,8 @@ def pydub_audio_segment_to_audio_packet(
             'sampleWidth': audio_segment.sample_width,
             'numChannels': audio_segment.channels,
         }, resample=True, is_processed=False, 
-        target_sample_rate=target_sample_rate
+        target_sample_rate=target_sample_rate,
+        resampler=resampler
     )
 
 def np_audio_to_audio_segment(wav_audio: np.ndarray, sample_rate: int):
@@ -61,12 +93,13 @@ def np_audio_to_audio_segment(wav_audio: np.ndarray, sample_rate: int):
     wav_buffer.seek(0)
     return AudioSegment.from_file(wav_buffer, format="wav")
 
-def np_audio_to_audio_packet(wav_audio: np.ndarray, sample_rate: int):
+def np_audio_to_audio_packet(wav_audio: np.ndarray, sample_rate: int, resampler: Optional[StreamResampler]=None):
     return pydub_audio_segment_to_audio_packet(
-        np_audio_to_audio_segment(wav_audio, sample_rate)
+        np_audio_to_audio_segment(wav_audio, sample_rate),
+        resampler=resampler
     )
 
-def bytes_to_audio_packet(audio_bytes: bytes, format=None) -> AudioPacket:
+def bytes_to_audio_packet(audio_bytes: bytes, format=None, resampler: Optional[StreamResampler]=None) -> AudioPacket:
     # convert bytes to audio segment
     audio_segment = AudioSegment.from_file(io.BytesIO(audio_bytes), format=format)
-    return pydub_audio_segment_to_audio_packet(audio_segment)
\ No newline at end of file
+    return pydub_audio_segment_to_audio_packet(audio_segment, resampler=resampler)
\ No newline at end of file
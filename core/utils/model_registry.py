@@ -0,0 +1,54 @@
+from threading import Lock
+from typing import Any, Callable, Dict, Hashable, List
+from loguru import logger
+
+
+class ModelRegistry:
+    """Process-wide registry of heavy models shared between sessions
+
+    Every model is loaded once per key, on first use, and the same instance is
+    then handed to every pipeline asking for it. Shared models are used
+    read-only: any per-session state must live outside of them.
+    """
+
+    _models: Dict[Hashable, Any] = {}
+    _loading_locks: Dict[Hashable, Lock] = {}
+    _lock = Lock()
+
+    @classmethod
+    def get(cls, key: Hashable, loader: Callable[[], Any]) -> Any:
+        """Get the model registered under `key`, loading it with `loader` if needed
+
+        Args:
+            key (Hashable): identifies the model and its loading options, e.g. ("faster_whisper", name, device)
+            loader (Callable[[], Any]): loads the model, called at most once per key
+
+        Returns:
+            Any: shared model
+        """
+        with cls._lock:
+            if key in cls._models:
+                return cls._models[key]
+            loading_lock = cls._loading_locks.setdefault(key, Lock())
+
+        # NOTE: loading is done outside of the registry lock so that different models load concurrently
+        with loading_lock:
+            if key not in cls._models:
+                logger.info(f"Loading shared model {key}")
+                model = loader()
+                with cls._lock:
+                    cls._models[key] = model
+            return cls._models[key]
+
+    @classmethod
+    def keys(cls) -> List[Hashable]:
+        """Keys of the models loaded so far"""
+        with cls._lock:
+            return list(cls._models.keys())
+
+    @classmethod
+    def release(cls, key: Hashable) -> None:
+        """Drop the model registered under `key`, sessions holding it keep their reference"""
+        with cls._lock:
+            cls._models.pop(key, None)
+            cls._loading_locks.pop(key, None)
@@ -1,4 +1,6 @@
 from .bot import BotStage
 from .tts import TTSStage
 from .vad import VADStage
-from .stt import STTStage
\ No newline at end of file
+from .stt import STTStage
+from .kws import KeywordSpottingStage
+from .stt.wakeup_word import WakeWordStage
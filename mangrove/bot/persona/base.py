@@ -4,6 +4,9 @@ from langchain_core.runnables import Runnable
 from langchain_core.prompts import ChatPromptTemplate
 
 class BotPersona(metaclass=ABCMeta):
+    # spoken keyword -> action of the prompt, for commands recognised without the bot (see KeywordSpottingStage)
+    spoken_commands: Dict[str, str] = {}
+
     @property
     @abstractmethod
     def prompt(self) -> ChatPromptTemplate:
@@ -5,9 +5,12 @@ from langchain_core.prompts import format_document, ChatPromptTemplate
 from langchain_core.runnables import RunnablePassthrough, Runnable
 from langchain_core.prompts.prompt import PromptTemplate
 from operator import itemgetter
+from core.utils import ModelRegistry
 from .base import BotPersona
 
 class ProtectorOfMangrove(BotPersona):
+    spoken_commands = {"follow": "Follow User", "down": "Sit Down", "stop": "Stop Following User"}
+
     def __init__(self, assistant_name='Marvin'):
         self.assistant_name = assistant_name
 
@@ -22,6 +25,11 @@ class ProtectorOfMangrove(BotPersona):
 
         self._prompt = ChatPromptTemplate.from_template(template)
 
+        self.vectorstore: FAISS = self.load_vectorstore(assistant_name)
+
+    @classmethod
+    def load_vectorstore(cls, assistant_name='Marvin') -> FAISS:
+        """Knowledge base store of the persona, built on the first call and shared (read-only) by all sessions"""
         kb = [
             f"Your name is {assistant_name}.",
             "You live in a holographic world called The Estuary.",
@@ -52,7 +60,11 @@ class ProtectorOfMangrove(BotPersona):
             "The war against the Palmerians is at a standstill.  Their advances have been halted, but at a dear cost.",
             "Unfortunately, Alice was caught in a Palmerian ambush and broke her leg."
         ]
-        self.vectorstore = FAISS.from_texts(kb, embedding=OpenAIEmbeddings())
+        # NOTE: embedding the knowledge base is costly
+        return ModelRegistry.get(
+            ("faiss", cls.__name__, assistant_name),
+            lambda: FAISS.from_texts(kb, embedding=OpenAIEmbeddings()),
+        )
 
     @property
     def prompt(self) -> ChatPromptTemplate:
@@ -5,9 +5,12 @@ from langchain_core.prompts import format_document, ChatPromptTemplate
 from langchain_core.runnables import RunnablePassthrough, Runnable
 from langchain_core.prompts.prompt import PromptTemplate
 from operator import itemgetter
+from core.utils import ModelRegistry
 from .base import BotPersona
 
 class ProtectorOfMangroveNemotron(BotPersona):
+    spoken_commands = {"follow": "come", "down": "sit down"}
+
     def __init__(self, assistant_name='Marvin'):
         self.assistant_name = assistant_name
 
@@ -30,6 +33,11 @@ class ProtectorOfMangroveNemotron(BotPersona):
 
         self._prompt = ChatPromptTemplate.from_template(template)
 
+        self.vectorstore: FAISS = self.load_vectorstore(assistant_name)
+
+    @classmethod
+    def load_vectorstore(cls, assistant_name='Marvin') -> FAISS:
+        """Knowledge base store of the persona, built on the first call and shared (read-only) by all sessions"""
         kb = [
             f"Your name is {assistant_name}.",
             "You live in a holographic world called The Estuary.",
@@ -60,7 +68,11 @@ class ProtectorOfMangroveNemotron(BotPersona):
             "The war against the Palmerians is at a standstill.  Their advances have been halted, but at a dear cost.",
             "Unfortunately, Alice was caught in a Palmerian ambush and broke her leg."
         ]
-        self.vectorstore = FAISS.from_texts(kb, embedding=OllamaEmbeddings(model="nemotron-mini"))
+        # NOTE: embedding the knowledge base is costly
+        return ModelRegistry.get(
+            ("faiss", cls.__name__, assistant_name),
+            lambda: FAISS.from_texts(kb, embedding=OllamaEmbeddings(model="nemotron-mini")),
+        )
 
     @property
     def prompt(self) -> ChatPromptTemplate:
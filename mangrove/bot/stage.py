@@ -31,15 +31,25 @@ class BotStage(TextToTextStage):
         self._partial_command = ""
         self._in_command = False
 
+    @property
+    def persona(self):
+        return self._persona
+
     def _process(self, in_text_packet: TextPacket) -> Optional[TextPacket]:
+        is_partial = in_text_packet is not None and in_text_packet.partial
+        if is_partial:
+            # partial transcription of an utterance still being spoken, the final one follows
+            in_text_packet = None
+
         if in_text_packet is None and self._text_packet_generator is None:
-            return None
+            # NOTE: no sleep after a partial one, the final one may already be set aside by _unpack
+            return True if is_partial else None
                 
         if in_text_packet:
             logger.success(f"Processing: {in_text_packet}")
 
             if self._text_packet_generator is None:
-                self._text_packet_generator = self.respond(in_text_packet)
+                self._text_packet_generator = self._respond_to(in_text_packet)
             else:
                 # interrupt the current conversation and replace with new input
                 self.schedule_forward_interrupt()
@@ -47,7 +57,7 @@ class BotStage(TextToTextStage):
                 # if chat history has ended with an AIMessage, delete it
                 if isinstance(self._chat_history[-1], AIMessage):
                     self._chat_history.pop()
-                self._text_packet_generator = self.respond(in_text_packet)
+                self._text_packet_generator = self._respond_to(in_text_packet)
                 logger.warning(f'Interrupting current conversation with new input: {in_text_packet}')
 
                 # TODO remove the below code if not needed
@@ -94,6 +104,21 @@ class BotStage(TextToTextStage):
                 clean_text += char
         return clean_text, commands
 
+    def _respond_to(self, text_packet: TextPacket) -> Generator[TextPacket, None, None]:
+        if text_packet.metadata.get("spoken_command") is not None:
+            return self.respond_command(text_packet)
+        return self.respond(text_packet)
+
+    def respond_command(self, text_packet: TextPacket) -> Generator[TextPacket, None, None]:
+        """Answer a command spotted by the keyword stage with its action, without the LLM"""
+        action = text_packet.metadata["spoken_command"]
+        logger.info(f"Answering the spoken command '{text_packet.text}' with [{action}]")
+        with self._lock:
+            # kept in the history as if the LLM had answered with the action
+            self._chat_history.append(HumanMessage(content=text_packet.text))
+            yield TextPacket(text="", commands=[action], partial=False, start=True)
+            self._chat_history.append(AIMessage(content=f"[{action}]"))
+
     def respond(self, text_packet: TextPacket) -> Generator[TextPacket, None, None]:
         def _pack_response(content, commands=[], partial=False, start=False):
             # format response from openai chat to be sent to the user
@@ -0,0 +1 @@
+from .stage import KeywordSpottingStage
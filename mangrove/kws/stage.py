@@ -0,0 +1,170 @@
+from typing import Dict, Iterator, List, Optional
+from loguru import logger
+from queue import Queue, Empty as QueueEmpty
+
+from core import AudioPacket
+from core.stage import AudioToAudioStage
+from core.utils import Timer
+
+
+class KeywordSpottingStage(AudioToAudioStage):
+    """Closed-vocabulary fast path for spoken commands
+
+    Sits between the VAD and STT stages. A short utterance classified as one of
+    the configured keywords with a high score is forwarded with the keyword and
+    its action in its metadata: STT transcribes it as the keyword without
+    decoding, and the bot answers with the action without calling the LLM,
+    keeping the exchange in its chat history. Every other utterance is
+    forwarded unchanged.
+
+    Partial chunks of a streamed utterance are held back until the utterance is
+    longer than a command could be; a command's chunks are forwarded as one
+    utterance if it is not recognised.
+    """
+
+    def __init__(
+        self,
+        commands: Dict[str, str],
+        score_threshold: float = 0.9,
+        max_command_ms: float = 1500,
+        device=None,
+        verbose=False,
+        endpoint="hf",
+        endpoint_kwargs={},
+    ):
+        """Initialize Keyword Spotting Stage
+
+        Args:
+            commands (Dict[str, str]): keyword (a label of the classifier) -> action emitted when it is spoken,
+                e.g. the bot persona's `spoken_commands`.
+            score_threshold (float, optional): Classifier score from which a keyword is accepted. Defaults to 0.9.
+            max_command_ms (float, optional): Longest speech classified, longer utterances go to STT. Defaults to 1500.
+            device (str, optional): Device to use. Defaults to None.
+            verbose (bool, optional): Whether to print debug messages. Defaults to False.
+            endpoint (str, optional): Keyword classifier, "hf" (speech commands audio classification). Defaults to "hf".
+            endpoint_kwargs (dict, optional): Extra arguments of the classifier endpoint. Defaults to {}.
+        """
+        super().__init__(verbose=verbose, batch_processing=True)
+        # utterances are kept whole (not re-framed) so that partial chunks stay distinguishable
+        self._input_buffer = Queue()
+
+        if device is None:
+            import torch
+            device = "cuda" if torch.cuda.is_available() else "cpu"
+
+        if endpoint == "hf":
+            from mangrove.stt.wakeup_word.audio_classification_endpoint import HFAudioClassificationEndpoint
+            self._endpoint = HFAudioClassificationEndpoint(wake_word=None, device=device, **endpoint_kwargs)
+        else:
+            raise Exception(f"Unknown Endpoint {endpoint}, available endpoints: hf")
+
+        unknown_keywords = set(commands) - set(self._endpoint.labels)
+        if unknown_keywords:
+            raise ValueError(f"Keywords {unknown_keywords} are not labels of the classifier, pick among {self._endpoint.labels}")
+        self.commands = commands
+        self.score_threshold = score_threshold
+        self.max_command_ms = max_command_ms
+
+        self._held_audio_packet: Optional[AudioPacket] = None  # partial chunks of a possible command
+        self._is_passing_through = False  # the utterance is too long to be a command
+
+        self.num_classified = 0
+        self.num_spotted = 0
+        self.total_classification_time = 0.0
+
+    def on_start(self):
+        self.reset_audio_stream()
+
+    def reset_audio_stream(self) -> None:
+        self._held_audio_packet = None
+        self._is_passing_through = False
+
+    def on_sleep(self):
+        self.log('<kws>')
+
+    def on_disconnect(self) -> None:
+        logger.info(f"Keyword spotting {self.metrics()}")
+
+    def metrics(self) -> dict:
+        return {
+            "classified": self.num_classified,
+            "spotted": self.num_spotted,
+            "avg_classification_ms": self.total_classification_time * 1000 / self.num_classified if self.num_classified else 0.0,
+        }
+
+    def _unpack_batch(self) -> List[AudioPacket]:
+        """Drain all utterances and partial chunks fed"""
+        audio_packets = []
+        while True:
+            try:
+                audio_packets.append(self._input_buffer.get_nowait())
+            except QueueEmpty:
+                return audio_packets
+
+    def _process_batch(self, audio_packets: List[AudioPacket]) -> Iterator[Optional[AudioPacket]]:
+        for audio_packet in audio_packets:
+            yield self._process(audio_packet)
+
+    @staticmethod
+    def _speech_duration(audio_packet: AudioPacket) -> float:
+        speech_timestamps = audio_packet.metadata.get("speech_timestamps")
+        if not speech_timestamps:
+            return audio_packet.duration
+        return speech_timestamps[-1][1] - speech_timestamps[0][0]
+
+    def _spot(self, audio_packet: AudioPacket) -> Optional[str]:
+        """Keyword of the utterance if it is a command, else None"""
+        if self._speech_duration(audio_packet) > self.max_command_ms:
+            return None
+        speech_timestamps = audio_packet.metadata.get("speech_timestamps")
+        if speech_timestamps:
+            # classify the speech only, with a little margin
+            start = max(speech_timestamps[0][0] - 100 - audio_packet.timestamp, 0)
+            end = speech_timestamps[-1][1] + 100 - audio_packet.timestamp
+            bytes_per_ms = audio_packet.sample_rate * audio_packet.sample_width // 1000
+            audio_packet = audio_packet[int(start) * bytes_per_ms:int(end) * bytes_per_ms]
+
+        with Timer() as timer:
+            # the utterance is forwarded as is, only the classified copy is at the classifier's rate
+            waveform = AudioPacket.resample(audio_packet.float, audio_packet.sample_rate, self._endpoint.sample_rate)
+            keyword, score = self._endpoint.classify(waveform)
+        self.num_classified += 1
+        self.total_classification_time += timer.record()
+        logger.debug(f"Classified as '{keyword}' ({score:.2f}) in {timer.record()} seconds")
+        if keyword in self.commands and score >= self.score_threshold:
+            return keyword
+        return None
+
+    def _process(self, audio_packet: AudioPacket) -> Optional[AudioPacket]:
+        if audio_packet.partial:
+            if self._is_passing_through:
+                return audio_packet
+            if self._held_audio_packet is not None:
+                audio_packet = self._held_audio_packet + audio_packet
+            if self._speech_duration(audio_packet) > self.max_command_ms:
+                # not a command, STT gets the chunks held so far at once
+                self._held_audio_packet = None
+                self._is_passing_through = True
+                audio_packet.partial = True
+                return audio_packet
+            self._held_audio_packet = audio_packet
+            return None
+
+        if self._is_passing_through:
+            self.reset_audio_stream()
+            return audio_packet
+        if self._held_audio_packet is not None:
+            # the whole utterance, forwarded as one if it is not a command
+            audio_packet = self._held_audio_packet + audio_packet
+        self.reset_audio_stream()
+
+        keyword = self._spot(audio_packet)
+        if keyword is None:
+            return audio_packet
+
+        action = self.commands[keyword]
+        self.num_spotted += 1
+        logger.success(f"Spotted command '{keyword}', answering with [{action}]")
+        audio_packet.metadata["keyword"] = keyword
+        audio_packet.metadata["spoken_command"] = action
+        return audio_packet
@@ -0,0 +1,300 @@
+import os
+import time
+import atexit
+import numpy as np
+from collections import OrderedDict
+from threading import Condition, Lock, Thread
+from typing import Dict, List, Optional, Tuple
+from loguru import logger
+
+from storage_manager import COMMANDS_CACHE_DIR
+
+# (quantised feature frames, speech duration in s)
+Fingerprint = Tuple[np.ndarray, float]
+
+
+class TranscriptionCache:
+    """Transcripts of past utterances, looked up by an audio fingerprint
+
+    The fingerprint of an utterance is the sequence of its log-mel cepstra
+    (without the energy coefficient) trimmed to the speech, mean-normalised
+    over the utterance, normalised per frame and quantised to int8. Two
+    utterances match when their speech durations are close and the mean
+    cosine similarity of their frames along the best time alignment (DTW,
+    local tempo changes up to 2x) reaches `similarity_threshold`, so a repeated
+    command is recognised despite differences in pace, pitch, loudness or
+    channel.
+
+    Entries are kept in LRU order and evicted beyond `max_entries`. They are
+    persisted to `directory` by a background thread once no insertion came for
+    `save_delay_ms`, off the transcription path, and at exit. The cache is
+    safe to share between sessions.
+    """
+
+    SAMPLE_RATE = 16000
+    FILENAME = "transcription_cache.npz"
+
+    def __init__(
+        self,
+        directory: str = COMMANDS_CACHE_DIR,
+        max_entries: int = 256,
+        similarity_threshold: float = 0.8,
+        max_duration_ratio: float = 1.3,
+        min_speech_ms: float = 200,
+        max_speech_ms: float = 4000,
+        n_mels: int = 40,
+        n_ceps: int = 20,
+        trim_db: float = 30,
+        save_delay_ms: float = 2000,
+    ):
+        """Initialize cache, loading the entries persisted in `directory`
+
+        Args:
+            directory (str, optional): Where the cache is persisted. Defaults to COMMANDS_CACHE_DIR.
+            max_entries (int, optional): Entries kept, least recently used are evicted. Defaults to 256.
+            similarity_threshold (float, optional): Aligned frame similarity of a hit. Defaults to 0.8.
+            max_duration_ratio (float, optional): Largest ratio between the speech durations of a hit. Defaults to 1.3.
+            min_speech_ms (float, optional): Shortest speech fingerprinted. Defaults to 200.
+            max_speech_ms (float, optional): Longest speech fingerprinted, longer utterances are rarely
+                repeated commands. Defaults to 4000.
+            n_mels (int, optional): Mel bands the cepstra are taken from. Defaults to 40.
+            n_ceps (int, optional): Cepstral coefficients kept, including the dropped energy one. Defaults to 20.
+            trim_db (float, optional): Frames quieter than the loudest one by this much are trimmed from
+                both ends. Defaults to 30.
+            save_delay_ms (float, optional): Time without insertion after which the entries are
+                persisted, so that a burst of insertions is written once. Defaults to 2000.
+        """
+        self.filepath = os.path.join(directory, self.FILENAME)
+        self.max_entries = max_entries
+        self.similarity_threshold = similarity_threshold
+        self.max_duration_ratio = max_duration_ratio
+        self.min_speech = min_speech_ms / 1000
+        self.max_speech = max_speech_ms / 1000
+        self.trim_db = trim_db
+        self.save_delay = save_delay_ms / 1000
+
+        self._n_fft = 400  # 25 ms
+        self._hop = 160  # 10 ms, fingerprint frames average two of them
+        self._window = np.hanning(self._n_fft).astype(np.float32)
+        self._mel_filters = self._mel_filterbank(n_mels, self._n_fft, self.SAMPLE_RATE)
+        self._dct = self._dct_matrix(n_mels)[1:n_ceps]
+
+        # fingerprint bytes -> (frames, duration, text), least recently used first
+        self._entries: "OrderedDict[bytes, Tuple[np.ndarray, float, str]]" = OrderedDict()
+        self._lock = Lock()
+        self.num_lookups = 0
+        self.num_hits = 0
+        self._load()
+
+        # the entries changed since the last save, and when they last did
+        self._is_dirty = False
+        self._last_insert_time = 0.0
+        self._dirty_condition = Condition(self._lock)
+        self._save_lock = Lock()  # one writer of the file at a time
+        self._saver = Thread(target=self._run_saver, daemon=True, name="TranscriptionCacheSaver")
+        self._saver.start()
+        atexit.register(self.flush)
+
+    @staticmethod
+    def _mel_filterbank(n_mels: int, n_fft: int, sample_rate: int) -> np.ndarray:
+        """Triangular mel filters, (n_mels, n_fft // 2 + 1)"""
+        def hz_to_mel(hz):
+            return 2595 * np.log10(1 + hz / 700)
+
+        def mel_to_hz(mel):
+            return 700 * (10 ** (mel / 2595) - 1)
+
+        edges = mel_to_hz(np.linspace(hz_to_mel(60), hz_to_mel(sample_rate / 2), n_mels + 2))
+        freqs = np.linspace(0, sample_rate / 2, n_fft // 2 + 1)
+        lower = (freqs[None, :] - edges[:-2, None]) / (edges[1:-1, None] - edges[:-2, None])
+        upper = (edges[2:, None] - freqs[None, :]) / (edges[2:, None] - edges[1:-1, None])
+        return np.maximum(0, np.minimum(lower, upper)).astype(np.float32)
+
+    @staticmethod
+    def _dct_matrix(n: int) -> np.ndarray:
+        """Orthonormal DCT-II, (n, n)"""
+        k = np.arange(n)[:, None]
+        dct = np.cos(np.pi * k * (2 * np.arange(n)[None, :] + 1) / (2 * n)) * np.sqrt(2 / n)
+        dct[0] /= np.sqrt(2)
+        return dct.astype(np.float32)
+
+    def fingerprint(self, waveform: np.ndarray) -> Optional[Fingerprint]:
+        """Fingerprint of an utterance
+
+        Args:
+            waveform (np.array(float32)): utterance at 16 kHz
+
+        Returns:
+            Fingerprint: quantised frames and speech duration, None if the speech is too short or too
+                long to fingerprint
+        """
+        if len(waveform) < self._n_fft:
+            return None
+        frames = np.lib.stride_tricks.sliding_window_view(waveform, self._n_fft)[::self._hop] * self._window
+        power = np.abs(np.fft.rfft(frames, axis=1)) ** 2
+
+        # trim the silence around the speech
+        energy = 10 * np.log10(power.sum(axis=1) + 1e-10)
+        loud = np.flatnonzero(energy > max(energy.max() - self.trim_db, np.percentile(energy, 10) + 10))
+        if len(loud) == 0:
+            return None
+        power = power[loud[0]:loud[-1] + 1]
+        duration = len(power) * self._hop / self.SAMPLE_RATE
+        if not self.min_speech <= duration <= self.max_speech:
+            return None
+
+        cepstra = np.log(power @ self._mel_filters.T + 1e-10) @ self._dct.T
+        cepstra -= cepstra.mean(axis=0)
+        cepstra = cepstra[:len(cepstra) // 2 * 2].reshape(-1, 2, cepstra.shape[1]).mean(axis=1)
+        cepstra /= np.linalg.norm(cepstra, axis=1, keepdims=True) + 1e-9
+        return np.round(cepstra * 127).astype(np.int8), duration
+
+    def _similarities(self, frames: np.ndarray, candidates: List[np.ndarray]) -> np.ndarray:
+        """Mean frame similarity of `frames` to each candidate along their best DTW alignment
+
+        Symmetric steps with slope constraint (Sakoe-Chiba, P = 1): every path weighs n + m
+        frame distances, and all candidates are aligned at once row by row.
+        """
+        query = frames.astype(np.float32) / 127
+        lengths = np.array([len(candidate) for candidate in candidates])
+        num_rows, num_cols = len(query), lengths.max()
+        stacked = np.zeros((len(candidates), num_cols, query.shape[1]), dtype=np.float32)
+        for i, candidate in enumerate(candidates):
+            stacked[i, :len(candidate)] = candidate.astype(np.float32) / 127
+
+        distances = 1 - np.einsum("nd,kmd->knm", query, stacked)
+        distances[np.broadcast_to(np.arange(num_cols)[None, None, :] >= lengths[:, None, None], distances.shape)] = np.inf
+        # costs and distances padded by two rows and columns, paths start at (0, 0)
+        distances = np.pad(distances, ((0, 0), (2, 0), (2, 0)), constant_values=np.inf)
+        costs = np.full_like(distances, np.inf)
+        costs[:, 2, 2] = 2 * distances[:, 2, 2]
+        for i in range(3, num_rows + 2):
+            row = distances[:, i, 2:]
+            costs[:, i, 2:] = np.minimum(
+                costs[:, i - 1, 1:-1] + 2 * row,
+                np.minimum(
+                    costs[:, i - 1, :-2] + 2 * distances[:, i, 1:-1] + row,
+                    costs[:, i - 2, 1:-1] + 2 * distances[:, i - 1, 2:] + row,
+                ),
+            )
+        total = costs[np.arange(len(candidates)), num_rows + 1, lengths + 1]
+        return 1 - total / (num_rows + lengths)
+
+    def lookup(self, fingerprint: Fingerprint) -> Optional[str]:
+        """Transcript of the most similar cached utterance
+
+        Returns:
+            str: the transcript on a hit, else None
+        """
+        frames, duration = fingerprint
+        with self._lock:
+            self.num_lookups += 1
+            # NOTE: only the entries are copied under the lock, the alignments run outside it
+            entries = list(self._entries.items())
+        candidates = [
+            (key, cached_frames, text) for key, (cached_frames, cached_duration, text) in entries
+            if max(cached_duration, duration) / min(cached_duration, duration) <= self.max_duration_ratio
+        ]
+        if not candidates:
+            return None
+
+        similarities = []
+        for i in range(0, len(candidates), 32):
+            # chunked to bound the memory of the alignments
+            similarities.append(self._similarities(frames, [candidate[1] for candidate in candidates[i:i + 32]]))
+        similarities = np.concatenate(similarities)
+        best = int(np.argmax(similarities))
+        if similarities[best] < self.similarity_threshold:
+            return None
+
+        key, _, text = candidates[best]
+        with self._lock:
+            self.num_hits += 1
+            if key in self._entries:
+                # may have been evicted meanwhile
+                self._entries.move_to_end(key)
+        logger.debug(f"Transcription cache hit ({similarities[best]:.2f} similar): '{text}'")
+        return text
+
+    def insert(self, fingerprint: Fingerprint, text: str) -> None:
+        """Cache the transcript of an utterance, persisted later by the background thread"""
+        frames, duration = fingerprint
+        with self._lock:
+            key = frames.tobytes()
+            self._entries[key] = (frames, duration, text)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+            self._is_dirty = True
+            self._last_insert_time = time.monotonic()
+            self._dirty_condition.notify()
+
+    def flush(self) -> None:
+        """Persist the entries now if they changed since the last save"""
+        # NOTE: snapshots are taken and written in turn, so that an older one never overwrites a newer one
+        with self._save_lock:
+            with self._lock:
+                if not self._is_dirty:
+                    return
+                # entries are never modified in place, a shallow copy is a consistent snapshot
+                entries = list(self._entries.values())
+                self._is_dirty = False
+            self._save(entries)
+
+    @property
+    def hit_rate(self) -> float:
+        return self.num_hits / self.num_lookups if self.num_lookups else 0.0
+
+    def metrics(self) -> Dict[str, float]:
+        return {
+            "lookups": self.num_lookups,
+            "hits": self.num_hits,
+            "hit_rate": self.hit_rate,
+            "entries": len(self._entries),
+        }
+
+    def _load(self) -> None:
+        if not os.path.exists(self.filepath):
+            return
+        try:
+            with np.load(self.filepath) as data:
+                frames = np.split(data["frames"], np.cumsum(data["lengths"])[:-1])
+                for frames, duration, text in zip(frames, data["durations"], data["texts"]):
+                    if frames.shape[1] != len(self._dct):
+                        # fingerprinted with other parameters
+                        continue
+                    self._entries[frames.tobytes()] = (frames, float(duration), str(text))
+        except Exception as e:
+            logger.warning(f"Ignoring unreadable transcription cache {self.filepath}: {e}")
+            self._entries.clear()
+            return
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+        logger.info(f"Loaded {len(self._entries)} cached transcriptions from {self.filepath}")
+
+    def _run_saver(self) -> None:
+        while True:
+            with self._dirty_condition:
+                self._dirty_condition.wait_for(lambda: self._is_dirty)
+                # debounced: wait for the insertions to pause
+                while self._is_dirty and time.monotonic() - self._last_insert_time < self.save_delay:
+                    self._dirty_condition.wait(self._last_insert_time + self.save_delay - time.monotonic())
+            try:
+                self.flush()
+            except Exception as e:
+                logger.warning(f"Could not persist the transcription cache to {self.filepath}: {e}")
+
+    def _save(self, entries: List[Tuple[np.ndarray, float, str]]) -> None:
+        """Write a snapshot of the entries, outside the lock"""
+        if not entries:
+            return
+        tmp_filepath = self.filepath + ".tmp.npz"
+        np.savez(
+            tmp_filepath,
+            frames=np.concatenate([entry[0] for entry in entries]),
+            lengths=np.array([len(entry[0]) for entry in entries]),
+            durations=np.array([entry[1] for entry in entries]),
+            texts=np.array([entry[2] for entry in entries]),
+        )
+        # NOTE: replaced atomically so that a crash never leaves a truncated cache
+        os.replace(tmp_filepath, self.filepath)
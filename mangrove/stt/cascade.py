@@ -0,0 +1,132 @@
+import numpy as np
+from threading import Lock
+from typing import Dict, List, Optional, Tuple
+from loguru import logger
+
+from faster_whisper import WhisperModel
+
+from core.utils import Timer
+
+# (model name, model, longest utterance it is routed in ms, None for the last tier)
+Tier = Tuple[str, WhisperModel, Optional[float]]
+
+
+class WhisperCascade:
+    """Utterance-length-aware cascade of whisper models
+
+    Each utterance goes to the first (smallest) tier whose `max_duration_ms`
+    it fits in, so short commands are decoded by a small model and long turns
+    by the last, largest one. A transcript of a smaller tier is kept only if
+    every segment is confident: its average log prob is at least
+    `min_avg_logprob` and its no-speech prob at most `max_no_speech_prob`.
+    Otherwise (or if the small model found no speech in audio the VAD kept)
+    the utterance is decoded again by the last tier.
+
+    The cascade is safe to share between sessions.
+    """
+
+    SAMPLE_RATE = 16000
+
+    def __init__(
+        self,
+        tiers: List[Tier],
+        language: str = "en",
+        min_avg_logprob: float = -0.6,
+        max_no_speech_prob: float = 0.5,
+        vad_parameters: Optional[dict] = None,
+    ):
+        """Initialize cascade
+
+        Args:
+            tiers (List[Tier]): models from the smallest to the largest, with the longest utterance (ms) each
+                one is routed, None for the last one
+            language (str, optional): Transcription language. Defaults to "en".
+            min_avg_logprob (float, optional): Lowest segment average log prob of a small tier transcript that
+                is kept. Defaults to -0.6.
+            max_no_speech_prob (float, optional): Highest segment no-speech prob of a small tier transcript that
+                is kept. Defaults to 0.5.
+            vad_parameters (dict, optional): Parameters of whisper's VAD filter, when used. Defaults to None.
+        """
+        assert tiers and tiers[-1][2] is None, "The last tier must take utterances of any length"
+        self.tiers = tiers
+        self.language = language
+        self.min_avg_logprob = min_avg_logprob
+        self.max_no_speech_prob = max_no_speech_prob
+        self.vad_parameters = vad_parameters
+
+        self._lock = Lock()
+        self.num_routed = [0] * len(tiers)  # utterances routed to each tier
+        self.num_escalated = [0] * len(tiers)  # of which decoded again by the last tier
+        self.num_decodes = [0] * len(tiers)
+        self.total_decode_time = [0.0] * len(tiers)
+
+    def _route(self, waveform: np.ndarray) -> int:
+        duration_ms = len(waveform) * 1000 / self.SAMPLE_RATE
+        for i, (_, _, max_duration_ms) in enumerate(self.tiers):
+            if max_duration_ms is None or duration_ms <= max_duration_ms:
+                return i
+
+    def _decode(self, tier: int, waveform: np.ndarray, vad_filter: bool) -> Tuple[str, bool]:
+        """Transcript of a tier and whether all its segments are confident"""
+        _, model, _ = self.tiers[tier]
+        with Timer() as timer:
+            segments, _ = model.transcribe(
+                waveform,
+                language=self.language,
+                vad_filter=vad_filter,
+                vad_parameters=self.vad_parameters,
+                without_timestamps=True,
+            )
+            segments = list(segments)
+        with self._lock:
+            self.num_decodes[tier] += 1
+            self.total_decode_time[tier] += timer.interval
+
+        is_confident = len(segments) > 0 and all(
+            segment.avg_logprob >= self.min_avg_logprob and segment.no_speech_prob <= self.max_no_speech_prob
+            for segment in segments
+        )
+        return " ".join(segment.text for segment in segments), is_confident
+
+    def transcribe(self, waveform: np.ndarray, vad_filter: bool = False) -> str:
+        """Transcribe an utterance with the smallest tier fit for it, escalating if unsure
+
+        Args:
+            waveform (np.array(float32)): mono utterance at 16 kHz
+            vad_filter (bool, optional): Whether whisper's VAD filter is run. Defaults to False.
+
+        Returns:
+            str: the transcript, empty if no speech
+        """
+        tier = self._route(waveform)
+        with self._lock:
+            self.num_routed[tier] += 1
+
+        text, is_confident = self._decode(tier, waveform, vad_filter)
+        last = len(self.tiers) - 1
+        if tier == last or is_confident:
+            return text
+
+        with self._lock:
+            self.num_escalated[tier] += 1
+        logger.debug(f"Unsure transcript of {self.tiers[tier][0]} '{text}', decoding again with {self.tiers[last][0]}")
+        text, _ = self._decode(last, waveform, vad_filter)
+        return text
+
+    @property
+    def escalation_rate(self) -> float:
+        """Fraction of the utterances routed to a smaller tier that were decoded again"""
+        num_routed = sum(self.num_routed[:-1])
+        return sum(self.num_escalated) / num_routed if num_routed else 0.0
+
+    def metrics(self) -> Dict[str, Dict[str, float]]:
+        """Per tier routing, escalation and decoding latency since start"""
+        return {
+            name: {
+                "routed": self.num_routed[i],
+                "escalated": self.num_escalated[i],
+                "decodes": self.num_decodes[i],
+                "avg_decode_ms": 1000 * self.total_decode_time[i] / self.num_decodes[i] if self.num_decodes[i] else 0.0,
+            }
+            for i, (name, _, _) in enumerate(self.tiers)
+        }
@@ -0,0 +1,154 @@
+import numpy as np
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import List, Optional
+from loguru import logger
+
+from faster_whisper import WhisperModel
+
+
+class ChunkedTranscriber:
+    """Parallel transcription of a long utterance in chunks cut at its pauses
+
+    The utterance is fed while it is being spoken. As soon as more than
+    `min_chunk_s` of it is pending, the longest pause of at least
+    `min_pause_ms` after that point (frames quieter than the loud ones by
+    `pause_drop_db`) splits off a chunk, which is transcribed right away on
+    the worker pool; without a pause, the chunk is cut at its quietest frame
+    once it reaches `max_chunk_s`. After the end of speech only the last chunk
+    is left to transcribe, and the texts are stitched back in order.
+
+    Chunks are transcribed independently (no previous text as prompt), so
+    they should be long enough for whisper to have context.
+    """
+
+    SAMPLE_RATE = 16000
+    FRAME = 320  # 20 ms, resolution of the pause search
+
+    def __init__(
+        self,
+        model: WhisperModel,
+        executor: ThreadPoolExecutor,
+        language: str = "en",
+        beam_size: int = 5,
+        min_chunk_s: float = 5,
+        max_chunk_s: float = 20,
+        min_pause_ms: float = 300,
+        pause_drop_db: float = 25,
+    ):
+        """Initialize transcriber
+
+        Args:
+            model (WhisperModel): shared faster-whisper model, loaded with several workers for the
+                chunks to be decoded in parallel
+            executor (ThreadPoolExecutor): worker pool the chunks are transcribed on
+            language (str, optional): Transcription language. Defaults to "en".
+            beam_size (int, optional): Beam size of the decoding. Defaults to 5.
+            min_chunk_s (float, optional): Shortest chunk split off before the end of speech. Defaults to 5.
+            max_chunk_s (float, optional): Longest chunk, cut without a pause if needed. Defaults to 20.
+            min_pause_ms (float, optional): Shortest pause a chunk is cut at. Defaults to 300.
+            pause_drop_db (float, optional): Level below the loud frames (90th percentile) of a pause. Defaults to 25.
+        """
+        self.model = model
+        self.executor = executor
+        self.language = language
+        self.beam_size = beam_size
+        self.min_chunk = int(min_chunk_s * self.SAMPLE_RATE)
+        self.max_chunk = int(max_chunk_s * self.SAMPLE_RATE)
+        self.min_pause_frames = max(int(min_pause_ms * self.SAMPLE_RATE / 1000) // self.FRAME, 1)
+        self.pause_drop_db = pause_drop_db
+
+        self.num_chunks = 0
+        self.num_utterances = 0
+        self.decoded_duration = 0.0  # s of audio decoded
+        self.reset()
+
+    def reset(self) -> None:
+        """Forget the utterance, dropping the chunks being transcribed"""
+        self._pending = np.zeros(0, dtype=np.float32)
+        self._futures: List[Future] = []
+        self._num_returned = 0  # chunks whose text was returned by `process`
+        self._is_text_returned = False
+
+    def insert_audio(self, waveform: np.ndarray) -> None:
+        """Append audio (float32, 16 kHz) of the utterance, submitting the chunks it completes"""
+        self._pending = np.concatenate([self._pending, waveform])
+        while len(self._pending) > self.min_chunk:
+            cut = self._find_cut()
+            if cut is None:
+                break
+            self._submit(self._pending[:cut])
+            self._pending = self._pending[cut:]
+
+    def _find_cut(self) -> Optional[int]:
+        """Sample at which the pending audio is split, None to wait for more audio"""
+        num_frames = len(self._pending) // self.FRAME
+        frames = self._pending[:num_frames * self.FRAME].reshape(num_frames, self.FRAME)
+        rms_db = 10 * np.log10(np.mean(frames ** 2, axis=1) + 1e-10)
+        is_quiet = rms_db < np.percentile(rms_db, 90) - self.pause_drop_db
+
+        first = self.min_chunk // self.FRAME
+        last = min(num_frames, self.max_chunk // self.FRAME)
+        # runs of quiet frames, as [start, end) frame indices
+        edges = np.flatnonzero(np.diff(np.concatenate([[False], is_quiet[first:], [False]]).astype(np.int8)))
+        starts, ends = edges[0::2] + first, edges[1::2] + first
+        lengths = ends - starts
+        candidates = np.flatnonzero((lengths >= self.min_pause_frames) & (starts < last))
+        if len(candidates) > 0:
+            best = candidates[np.argmax(lengths[candidates])]
+            return (starts[best] + ends[best]) // 2 * self.FRAME
+        if num_frames >= self.max_chunk // self.FRAME:
+            return (first + int(np.argmin(rms_db[first:last]))) * self.FRAME
+        return None
+
+    def _submit(self, waveform: np.ndarray) -> None:
+        logger.debug(f"Transcribing chunk {len(self._futures)} of {len(waveform) / self.SAMPLE_RATE:.2f} s in the background")
+        self._futures.append(self.executor.submit(self._transcribe, waveform))
+        self.num_chunks += 1
+        self.decoded_duration += len(waveform) / self.SAMPLE_RATE
+
+    def _transcribe(self, waveform: np.ndarray) -> str:
+        segments, _ = self.model.transcribe(
+            waveform,
+            language=self.language,
+            beam_size=self.beam_size,
+            vad_filter=False,
+            without_timestamps=True,
+        )
+        return "".join(segment.text for segment in segments).strip()
+
+    def process(self) -> str:
+        """Texts of the chunks transcribed since the last call, following the ones returned before
+
+        Returns:
+            str: newly transcribed text, empty if none
+        """
+        texts = []
+        while self._num_returned < len(self._futures) and self._futures[self._num_returned].done():
+            texts.append(self._futures[self._num_returned].result())
+            self._num_returned += 1
+        text = " ".join(text for text in texts if text)
+        if not text:
+            return ""
+        is_first = not self._is_text_returned
+        self._is_text_returned = True
+        return text if is_first else " " + text
+
+    def finish(self) -> str:
+        """Transcribe the last chunk after the end of speech, stitch the texts and forget the utterance
+
+        Returns:
+            str: text of the whole utterance
+        """
+        if len(self._pending) > 0:
+            self._submit(self._pending)
+        text = " ".join(text for text in (future.result() for future in self._futures) if text)
+        self.num_utterances += 1
+        self.reset()
+        return text
+
+    def metrics(self) -> dict:
+        return {
+            "chunks": self.num_chunks,
+            "avg_chunks_per_utterance": self.num_chunks / self.num_utterances if self.num_utterances else 0.0,
+            "decoded_s": self.decoded_duration,
+        }
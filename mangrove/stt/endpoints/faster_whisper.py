@@ -1,31 +1,211 @@
-from typing import Optional
+import numpy as np
+from typing import List, Optional, Tuple, Union
 from loguru import logger
 from queue import Empty
+from concurrent.futures import ThreadPoolExecutor
 from faster_whisper import WhisperModel
 
 from core import AudioPacket
-from core.utils import Timer
+from core.utils import ModelRegistry, Timer
+from ..scheduler import BatchedWhisperScheduler
+from ..streaming import LocalAgreementTranscriber
+from ..chunking import ChunkedTranscriber
+from ..cache import TranscriptionCache
+from ..cascade import WhisperCascade
 from .base import STTEndpoint
 
 class FasterWhisperEndpoint(STTEndpoint):
-    def __init__(self, model_name="distil-medium.en", device=None):
+    def __init__(
+        self,
+        model_name="distil-medium.en",
+        device=None,
+        batch_window_ms: Optional[float] = None,
+        max_latency_ms: float = 100,
+        max_batch_size: int = 8,
+        streaming: bool = False,
+        min_chunk_ms: float = 500,
+        chunking: bool = False,
+        num_workers: int = 2,
+        chunking_kwargs: dict = {},
+        vad_filter: str = "precomputed",
+        cache: bool = False,
+        cache_kwargs: dict = {},
+        cascade: Optional[List[Tuple[str, float]]] = None,
+        cascade_kwargs: dict = {},
+    ):
+        """Initialize faster-whisper endpoint
+
+        Args:
+            model_name (str, optional): Whisper model. Defaults to "distil-medium.en".
+            device (str, optional): Device to use. Defaults to None (auto).
+            batch_window_ms (float, optional): If set, utterances of all sessions sharing the model are
+                transcribed in batches collected within this window (see BatchedWhisperScheduler).
+                Defaults to None (each utterance transcribed on its own).
+            max_latency_ms (float, optional): Longest the first utterance of a batch is held back waiting
+                for others. Defaults to 100.
+            max_batch_size (int, optional): Maximum number of utterances per batch. Defaults to 8.
+            streaming (bool, optional): Whether utterances are transcribed incrementally while spoken, from
+                partial chunks (see LocalAgreementTranscriber); streaming decodes are not batched. Defaults to False.
+            min_chunk_ms (float, optional): New audio needed before decoding a streamed utterance again. Defaults to 500.
+            chunking (bool, optional): Whether long utterances are split at their pauses while spoken, from partial
+                chunks, and the chunks transcribed in parallel (see ChunkedTranscriber). Exclusive with streaming.
+                Defaults to False.
+            num_workers (int, optional): Decodes run in parallel by the shared model (set by the endpoint loading it)
+                and chunks of the sessions with this setting transcribed at once when chunking. Defaults to 2.
+            chunking_kwargs (dict, optional): Keyword arguments of the ChunkedTranscriber. Defaults to {}.
+            vad_filter (str, optional): How silence is removed before decoding. "precomputed" cuts out the speech
+                segments the VAD stage attached to the utterance (whisper's own VAD filter for utterances without
+                them), "whisper" runs whisper's VAD filter again and "none" decodes the utterance as is.
+                Defaults to "precomputed".
+            cache (bool, optional): Whether transcripts of repeated utterances are taken from a fingerprint
+                cache shared by all sessions (see TranscriptionCache); streamed utterances are not cached.
+                Defaults to False.
+            cache_kwargs (dict, optional): Keyword arguments of the TranscriptionCache. Defaults to {}.
+            cascade (List[Tuple[str, float]], optional): If set, smaller whisper models and the longest utterance (ms)
+                each one transcribes, from the smallest; longer utterances and unsure transcripts go to `model_name`
+                (see WhisperCascade). Takes precedence over batching. Defaults to None.
+            cascade_kwargs (dict, optional): Keyword arguments of the WhisperCascade, e.g. confidence thresholds.
+                Defaults to {}.
+        """
+        assert vad_filter in ("precomputed", "whisper", "none"), f"Unknown vad_filter `{vad_filter}`"
+        assert not (streaming and chunking), "Streaming and chunking are exclusive"
         super().__init__()
         self.device = "auto" if device is None else device
-        try:
-            self.model = WhisperModel(model_name, device=self.device, compute_type="int8")
-        except:
-            logger.warning(f'Device {device} is not supported, defaulting to CPU!')
-            self.model = WhisperModel(model_name, device='cpu')
+        # NOTE: WhisperModel is safe to share, concurrent transcribe calls are supported
+        # but only run in parallel on as many model workers. One model is shared by every session
+        # (chunking, cascade or not), only the chunk executors differ by worker count
+        self.model: WhisperModel = self.load_model(model_name, self.device, num_workers)
+
+        self.scheduler: Optional[BatchedWhisperScheduler] = None
+        if batch_window_ms is not None:
+            self.scheduler = ModelRegistry.get(
+                ("faster_whisper_scheduler", model_name, self.device, batch_window_ms, max_latency_ms, max_batch_size),
+                lambda: BatchedWhisperScheduler(
+                    self.model,
+                    batch_window_ms=batch_window_ms,
+                    max_latency_ms=max_latency_ms,
+                    max_batch_size=max_batch_size,
+                ),
+            )
+
+        self.transcriber: Optional[Union[LocalAgreementTranscriber, ChunkedTranscriber]] = None
+        if streaming:
+            self.transcriber = LocalAgreementTranscriber(self.model, min_chunk_ms=min_chunk_ms)
+        elif chunking:
+            executor = ModelRegistry.get(
+                ("faster_whisper_chunk_executor", model_name, self.device, num_workers),
+                lambda: ThreadPoolExecutor(max_workers=num_workers, thread_name_prefix="ChunkedTranscriber"),
+            )
+            self.transcriber = ChunkedTranscriber(self.model, executor, **chunking_kwargs)
         
-        # Custom VAD parameters
+        self.cache: Optional[TranscriptionCache] = None
+        if cache:
+            self.cache = ModelRegistry.get(
+                ("transcription_cache", cache_kwargs.get("directory")),
+                lambda: TranscriptionCache(**cache_kwargs),
+            )
+
+        self.vad_filter = vad_filter
+        # Custom VAD parameters, also used to merge and pad the precomputed speech segments
         self.vad_parameters = {
             "threshold": 0.3,          # Lower = more sensitive to quiet speech
             "min_speech_duration_ms": 500,    # Minimum speech chunk
             "min_silence_duration_ms": 1000,  # Longer pause needed to split
             "speech_pad_ms": 600,            # Padding around speech segments
         }
+
+        self.cascade: Optional[WhisperCascade] = None
+        if cascade:
+            tiers = [
+                (name, self.load_model(name, self.device, num_workers), max_duration_ms)
+                for name, max_duration_ms in cascade
+            ]
+            self.cascade = ModelRegistry.get(
+                ("faster_whisper_cascade", tuple(cascade), model_name, self.device),
+                lambda: WhisperCascade(
+                    tiers + [(model_name, self.model, None)], vad_parameters=self.vad_parameters, **cascade_kwargs
+                ),
+            )
         self.reset()
 
+    @staticmethod
+    def load_model(model_name: str = "distil-medium.en", device: Optional[str] = None, num_workers: int = 2) -> WhisperModel:
+        """Shared Whisper model of the process, loaded on the first call
+
+        Args:
+            model_name (str, optional): Whisper model. Defaults to "distil-medium.en".
+            device (str, optional): Device to use. Defaults to None (auto).
+            num_workers (int, optional): Model workers, only used by the first call. Defaults to 2.
+
+        Returns:
+            WhisperModel: the model
+        """
+        device = "auto" if device is None else device
+        return ModelRegistry.get(
+            ("faster_whisper", model_name, device),
+            lambda: FasterWhisperEndpoint._load_model(model_name, device, num_workers),
+        )
+
+    @staticmethod
+    def _load_model(model_name: str, device: str, num_workers: int = 1) -> WhisperModel:
+        try:
+            return WhisperModel(model_name, device=device, compute_type="int8", num_workers=num_workers)
+        except:
+            logger.warning(f'Device {device} is not supported, defaulting to CPU!')
+            return WhisperModel(model_name, device='cpu', num_workers=num_workers)
+
+    def _speech_waveform(self, audio_packet: AudioPacket) -> Optional[np.ndarray]:
+        """Speech of the utterance from the speech segments the VAD attached to it
+
+        Segments closer than `min_silence_duration_ms` are merged and each is padded by `speech_pad_ms`,
+        as whisper's VAD filter would do.
+
+        Returns:
+            np.array(float32): the speech, None if the packet has no speech segments
+        """
+        speech_timestamps = audio_packet.metadata.get("speech_timestamps")
+        if not speech_timestamps:
+            return None
+        min_silence = self.vad_parameters["min_silence_duration_ms"]
+        pad = self.vad_parameters["speech_pad_ms"]
+
+        spans = []
+        for start, end in speech_timestamps:
+            if spans and start - spans[-1][1] < min_silence:
+                spans[-1][1] = end
+            else:
+                spans.append([start, end])
+
+        waveform = audio_packet.float
+        samples_per_ms = audio_packet.sample_rate / 1000
+        chunks = []
+        for start, end in spans:
+            start = max(int((start - pad - audio_packet.timestamp) * samples_per_ms), 0)
+            end = min(int((end + pad - audio_packet.timestamp) * samples_per_ms), len(waveform))
+            if chunks and start <= chunks[-1][1]:
+                chunks[-1][1] = max(chunks[-1][1], end)
+            elif start < end:
+                chunks.append([start, end])
+        if len(chunks) == 1 and chunks[0] == [0, len(waveform)]:
+            return waveform
+        return np.concatenate([waveform[start:end] for start, end in chunks])
+
+    def get_partial_transcription_if_any(self) -> Optional[str]:
+        """Transcribe the utterance fed so far (streaming or chunking only)
+
+        Returns:
+            str: Text newly committed since the last call, None if none
+        """
+        audio_packet = self.get_buffered_audio_packet()
+        if audio_packet is not None:
+            self.transcriber.insert_audio(audio_packet.float)
+        with Timer() as timer:
+            _out = self.transcriber.process()
+        if not _out:
+            return None
+        logger.debug(f"Committed '{_out}' in {timer.record()} seconds")
+        return _out
+
     def get_transcription_if_any(self) -> Optional[str]:
         """Get transcription if available
 
@@ -39,19 +219,61 @@ class FasterWhisperEndpoint(STTEndpoint):
         if audio_packet is None:
             return None
         
+        if self.transcriber is not None:
+            with Timer() as timer:
+                self.transcriber.insert_audio(audio_packet.float)
+                _out = self.transcriber.finish()
+                logger.success(f"Took {timer.record()} seconds to finish the streamed utterance, {self.transcriber.metrics()}")
+            return _out
         
-        with Timer() as timer:
-            segments, _ = self.model.transcribe(
-                audio_packet.float,
-                language='en',
-                vad_filter=True,
-                vad_parameters=self.vad_parameters,  # Pass custom VAD settings
-                without_timestamps=True
-            )
-            _out = list(segments)
-            if len(_out) >= 1:
-                _out = " ".join([segment.text for segment in _out])
-            logger.success(f"Took {timer.record()} seconds")
+        fingerprint = None
+        if self.cache is not None:
+            fingerprint = self.cache.fingerprint(audio_packet.float)
+            if fingerprint is not None:
+                _out = self.cache.lookup(fingerprint)
+                logger.debug(f"Transcription cache {self.cache.metrics()}")
+                if _out is not None:
+                    logger.success(f"Took the cached transcription, hit rate {self.cache.hit_rate:.0%}")
+                    return _out
+
+        waveform = audio_packet.float
+        vad_filter = self.vad_filter == "whisper"
+        if self.vad_filter == "precomputed":
+            speech = self._speech_waveform(audio_packet)
+            if speech is None:
+                # not segmented by a VAD stage, let whisper find the speech
+                vad_filter = True
+            else:
+                logger.debug(f"Decoding {len(speech) / len(waveform) if len(waveform) else 0:.0%} of the utterance as speech")
+                waveform = speech
+
+        if self.cascade is not None:
+            with Timer() as timer:
+                _out = self.cascade.transcribe(waveform, vad_filter=vad_filter)
+                logger.success(
+                    f"Took {timer.record()} seconds, escalation rate {self.cascade.escalation_rate:.0%}, {self.cascade.metrics()}"
+                )
+        elif self.scheduler is not None and not vad_filter:
+            # NOTE: the batched decoding has no VAD filter, utterances needing whisper's one are decoded alone
+            with Timer() as timer:
+                _out = self.scheduler.transcribe(waveform)
+                logger.success(f"Took {timer.record()} seconds, batching {self.scheduler.metrics()}")
+        else:
+            with Timer() as timer:
+                segments, _ = self.model.transcribe(
+                    waveform,
+                    language='en',
+                    vad_filter=vad_filter,
+                    vad_parameters=self.vad_parameters,  # Pass custom VAD settings
+                    without_timestamps=True
+                )
+                _out = list(segments)
+                if len(_out) >= 1:
+                    _out = " ".join([segment.text for segment in _out])
+                logger.success(f"Took {timer.record()} seconds")
+
+        if fingerprint is not None and isinstance(_out, str) and _out.strip():
+            self.cache.insert(fingerprint, _out)
 
         # if _out:
         #     logger.success(f"Transcription: {_out}")
@@ -67,4 +289,6 @@ class FasterWhisperEndpoint(STTEndpoint):
                 self.input_queue.get_nowait()
             except Empty:
                 break
+        if self.transcriber is not None:
+            self.transcriber.reset()
         logger.debug(f"Resetting {self.__class__.__name__} endpoint")
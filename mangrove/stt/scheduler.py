@@ -0,0 +1,202 @@
+import time
+import numpy as np
+from concurrent.futures import Future
+from threading import Condition, Thread
+from typing import Dict, List, Optional, Tuple
+from loguru import logger
+
+import ctranslate2
+from faster_whisper import WhisperModel
+from faster_whisper.audio import pad_or_trim
+from faster_whisper.tokenizer import Tokenizer
+
+
+class BatchedWhisperScheduler:
+    """Cross-session batching of faster-whisper transcriptions
+
+    Every STT endpoint sharing a WhisperModel submits its finished utterances
+    here. A worker thread collects them while they keep arriving within
+    `batch_window_ms` of each other (but for no longer than `max_latency_ms`
+    after the first one, and no more than `max_batch_size`), runs them through
+    CTranslate2 as one encode/generate batch and resolves each submitter's
+    future with its own transcript.
+
+    Utterances are already segmented by the VAD stage, so whisper's own VAD
+    filter and 30 s windowing are not used: longer utterances are transcribed
+    on their own with `WhisperModel.transcribe`.
+    """
+
+    def __init__(
+        self,
+        model: WhisperModel,
+        batch_window_ms: float = 20,
+        max_latency_ms: float = 100,
+        max_batch_size: int = 8,
+        language: str = "en",
+        beam_size: int = 5,
+        no_speech_threshold: float = 0.6,
+        log_prob_threshold: float = -1.0,
+    ):
+        """Initialize scheduler and start its worker thread
+
+        Args:
+            model (WhisperModel): shared faster-whisper model
+            batch_window_ms (float, optional): Time to wait for another utterance before running a batch. Defaults to 20.
+            max_latency_ms (float, optional): Longest the first utterance of a batch is held back waiting
+                for others. Defaults to 100.
+            max_batch_size (int, optional): Maximum number of utterances per batch. Defaults to 8.
+            language (str, optional): Transcription language. Defaults to "en".
+            beam_size (int, optional): Beam size of the decoding. Defaults to 5.
+            no_speech_threshold (float, optional): no_speech_prob above which (with a low log prob) a
+                transcript is dropped as silence, as in `transcribe`. Defaults to 0.6.
+            log_prob_threshold (float, optional): Average log prob below which a no-speech
+                transcript is dropped. Defaults to -1.0.
+        """
+        self.model = model
+        self.batch_window = batch_window_ms / 1000
+        self.max_latency = max_latency_ms / 1000
+        self.max_batch_size = max_batch_size
+        self.language = language
+        self.beam_size = beam_size
+        self.no_speech_threshold = no_speech_threshold
+        self.log_prob_threshold = log_prob_threshold
+
+        self._tokenizer = Tokenizer(
+            model.hf_tokenizer, model.model.is_multilingual, task="transcribe", language=language
+        )
+        self._prompt = list(self._tokenizer.sot_sequence) + [self._tokenizer.no_timestamps]
+
+        # (submission time, waveform, future) in arrival order
+        self._pending: List[Tuple[float, np.ndarray, Future]] = []
+        self._condition = Condition()
+
+        self.num_batches = 0
+        self.num_utterances = 0
+        self.total_wait_time = 0.0
+        self.max_wait_time = 0.0
+
+        self._worker = Thread(target=self._run, daemon=True, name="BatchedWhisperScheduler")
+        self._worker.start()
+
+    def submit(self, waveform: np.ndarray) -> Future:
+        """Queue an utterance for transcription
+
+        Args:
+            waveform (np.array(float32)): mono utterance at 16 kHz
+
+        Returns:
+            Future: resolves to the transcript (str, empty if no speech)
+        """
+        future = Future()
+        with self._condition:
+            self._pending.append((time.monotonic(), waveform, future))
+            self._condition.notify()
+        return future
+
+    def transcribe(self, waveform: np.ndarray) -> str:
+        """Submit an utterance and wait for its transcript"""
+        return self.submit(waveform).result()
+
+    @property
+    def fill_rate(self) -> float:
+        """Average fraction of max_batch_size used per batch"""
+        if self.num_batches == 0:
+            return 0.0
+        return self.num_utterances / (self.num_batches * self.max_batch_size)
+
+    def metrics(self) -> Dict[str, float]:
+        """Batching metrics since start"""
+        return {
+            "batches": self.num_batches,
+            "utterances": self.num_utterances,
+            "avg_batch_size": self.num_utterances / self.num_batches if self.num_batches else 0.0,
+            "fill_rate": self.fill_rate,
+            "avg_wait_ms": 1000 * self.total_wait_time / self.num_utterances if self.num_utterances else 0.0,
+            "max_wait_ms": 1000 * self.max_wait_time,
+        }
+
+    def _collect_batch(self) -> List[Tuple[float, np.ndarray, Future]]:
+        """Wait for a batch to be due and take it from the pending list"""
+        with self._condition:
+            self._condition.wait_for(lambda: len(self._pending) > 0)
+            while len(self._pending) < self.max_batch_size:
+                now = time.monotonic()
+                deadline = min(
+                    self._pending[-1][0] + self.batch_window,  # no other utterance came in time
+                    self._pending[0][0] + self.max_latency,  # the oldest one waited long enough
+                )
+                if now >= deadline:
+                    break
+                num_pending = len(self._pending)
+                self._condition.wait_for(lambda: len(self._pending) > num_pending, timeout=deadline - now)
+
+            batch = self._pending[:self.max_batch_size]
+            self._pending = self._pending[self.max_batch_size:]
+            return batch
+
+    def _run(self) -> None:
+        while True:
+            batch = self._collect_batch()
+            started = time.monotonic()
+            for submitted, _, _ in batch:
+                self.total_wait_time += started - submitted
+                self.max_wait_time = max(self.max_wait_time, started - submitted)
+            self.num_batches += 1
+            self.num_utterances += len(batch)
+
+            try:
+                transcripts = self._transcribe_batch([waveform for _, waveform, _ in batch])
+            except Exception as e:
+                logger.exception(f"Batched transcription of {len(batch)} utterances failed")
+                for _, _, future in batch:
+                    future.set_exception(e)
+                continue
+
+            logger.debug(
+                f"Transcribed batch of {len(batch)} in {time.monotonic() - started:.3f} s "
+                f"(fill rate {self.fill_rate:.2f})"
+            )
+            for (_, _, future), transcript in zip(batch, transcripts):
+                future.set_result(transcript)
+
+    def _transcribe_batch(self, waveforms: List[np.ndarray]) -> List[str]:
+        """Transcribe utterances, batching those that fit in one 30 s whisper window"""
+        feature_extractor = self.model.feature_extractor
+        transcripts: List[Optional[str]] = [None] * len(waveforms)
+
+        batched_indices, features = [], []
+        for i, waveform in enumerate(waveforms):
+            if len(waveform) > feature_extractor.n_samples:
+                segments, _ = self.model.transcribe(
+                    waveform, language=self.language, beam_size=self.beam_size, without_timestamps=True
+                )
+                transcripts[i] = " ".join(segment.text for segment in segments)
+                continue
+            batched_indices.append(i)
+            features.append(
+                pad_or_trim(feature_extractor(waveform)[:, :feature_extractor.nb_max_frames], feature_extractor.nb_max_frames)
+            )
+
+        if batched_indices:
+            features = ctranslate2.StorageView.from_array(np.ascontiguousarray(np.stack(features)))
+            encoder_output = self.model.model.encode(features)
+            results = self.model.model.generate(
+                encoder_output,
+                [self._prompt] * len(batched_indices),
+                beam_size=self.beam_size,
+                max_length=self.model.max_length,
+                return_scores=True,
+                return_no_speech_prob=True,
+                suppress_blank=True,
+                suppress_tokens=[-1],
+            )
+            for i, result in zip(batched_indices, results):
+                tokens = result.sequences_ids[0]
+                # as in WhisperModel.generate_with_fallback (length_penalty of 1)
+                avg_logprob = result.scores[0] * len(tokens) / (len(tokens) + 1)
+                if result.no_speech_prob > self.no_speech_threshold and avg_logprob < self.log_prob_threshold:
+                    transcripts[i] = ""
+                else:
+                    transcripts[i] = self._tokenizer.decode(tokens).strip()
+
+        return transcripts
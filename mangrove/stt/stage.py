@@ -1,7 +1,7 @@
 import torch
-from typing import Optional
+from typing import Iterator, List, Optional
 from loguru import logger
-from queue import Empty as QueueEmpty
+from queue import Queue, Empty as QueueEmpty
 
 from core import TextPacket, AudioPacket
 from core.stage import AudioToTextStage
@@ -16,61 +16,121 @@ class STTStage(AudioToTextStage):
         frame_size=512 * 4,
         device=None,
         verbose=False,
+        endpoint_kwargs={},
     ):
         """Initialize STT Stage
 
         Args:
             frame_size (int, optional): audio frame size. Defaults to 320.
             device (str, optional): Device to use. Defaults to None.
+            endpoint_kwargs (dict, optional): Extra arguments of the STT endpoint, e.g. batching. Defaults to {}.
             verbose (bool, optional): Whether to print debug messages. Defaults to False.
 
         Raises:
             ValueError: If custom scorer is defined but not found
         """
-        super().__init__(frame_size=frame_size, verbose=verbose)
+        super().__init__(frame_size=frame_size, verbose=verbose, batch_processing=True)
+        # utterances are kept whole (not re-framed) so that partial chunks stay distinguishable
+        self._input_buffer = Queue()
 
         if device is None:
             device = "cuda" if torch.cuda.is_available() else "cpu"
 
-        self._endpoint = FasterWhisperEndpoint(device=device)  # TODO make selection dynamic by name or type
+        self._endpoint = FasterWhisperEndpoint(device=device, **endpoint_kwargs)  # TODO make selection dynamic by name or type
 
         self._recorded_audio_length: int = 0  # FOR DEBUGGING
         self._interrupted_audio_packet: Optional[AudioPacket] = None
+        self._is_utterance_started = False  # a partial transcription of the current utterance was emitted
 
     def on_start(self):
         self._recorded_audio_length = 0  # FOR DEBUGGING
         self._interrupted_audio_packet = None
+        self._is_utterance_started = False
 
     def reset_audio_stream(self, reset_buffers=True) -> None:
         """Reset audio stream context"""
         if reset_buffers:
             self.log("[stt-hard-reset]", end="\n")
             self._endpoint.reset()
-            self._input_buffer.reset()
+            self._unpack_batch()
             self._interrupted_audio_packet = None
         else:
             self.log("[stt-soft-reset]", end=" ")
         self._recorded_audio_length = 0
+        self._is_utterance_started = False
 
     def on_sleep(self):
         self.log('<stt>')
 
+    def _unpack_batch(self) -> List[AudioPacket]:
+        """Drain all utterances and partial chunks fed"""
+        audio_packets = []
+        while True:
+            try:
+                audio_packets.append(self._input_buffer.get_nowait())
+            except QueueEmpty:
+                return audio_packets
+
+    def _process_batch(self, audio_packets: List[AudioPacket]) -> Iterator[Optional[TextPacket]]:
+        for i, audio_packet in enumerate(audio_packets):
+            if not audio_packet.partial:
+                yield self._process(audio_packet)
+            elif i + 1 < len(audio_packets):
+                # decoded together with the next chunks, or with the whole utterance if the final one follows
+                self._feed(audio_packet)
+                yield None
+            else:
+                yield self._process_partial(audio_packet)
+
+    def _feed(self, audio_packet: AudioPacket) -> None:
+        """Feed audio content to stream context"""
+        if self._interrupted_audio_packet is not None:
+            logger.debug("Interrupted audio packet found, appending at head")
+            audio_packet = self._interrupted_audio_packet + audio_packet
+            self._interrupted_audio_packet = None
+        self._endpoint.feed(audio_packet)
+        self._recorded_audio_length += audio_packet.duration # FOR DEBUGGING
+
+    def _process_partial(self, audio_packet: AudioPacket) -> Optional[TextPacket]:
+        """Feed a chunk of the utterance being spoken and return the newly stable text if any"""
+        self._feed(audio_packet)
+        with Timer() as timer:
+            transcription: Optional[str] = self._endpoint.get_partial_transcription_if_any()
+            if transcription is not None:
+                is_start = not self._is_utterance_started
+                self._is_utterance_started = True
+                return TextPacket(
+                    text=transcription,
+                    partial=True,
+                    start=is_start,
+                    recog_time=timer.record(),
+                    recorded_audio_length=self._recorded_audio_length,
+                )
+
     def _process(self, audio_packet) -> Optional[TextPacket]:
         """Process audio buffer and return transcription if any found"""
         if audio_packet is None:
             return
 
+        keyword = audio_packet.metadata.get("keyword")
+        if keyword is not None:
+            # spotted by the keyword stage, nothing to decode
+            logger.info(f"Transcribing {audio_packet} as the spotted keyword '{keyword}'")
+            self.reset_audio_stream(reset_buffers=False)
+            return TextPacket(
+                text=keyword,
+                partial=False,
+                start=True,
+                recog_time=0.0,
+                recorded_audio_length=audio_packet.duration,
+                spoken_command=audio_packet.metadata["spoken_command"],
+            )
+
         if len(audio_packet) < self.frame_size:
             raise Exception("Partial audio packet found; this should not happen")
 
-        # Feed audio content to stream context
         logger.info(f"Processing {audio_packet}")
-        if self._interrupted_audio_packet is not None:
-            logger.debug("Interrupted audio packet found, appending at head")
-            audio_packet = self._interrupted_audio_packet + audio_packet
-            self._interrupted_audio_packet = None
-        self._endpoint.feed(audio_packet)
-        self._recorded_audio_length += audio_packet.duration # FOR DEBUGGING
+        self._feed(audio_packet)
 
         # Finish stream and return transcription if any found
         logger.debug("Trying to finish stream..")
@@ -79,10 +139,11 @@ class STTStage(AudioToTextStage):
             if transcription is not None:
                 self.reset_audio_stream(reset_buffers=False)
 
+                # the complete transcription of the utterance, after its partial ones if streamed
                 return TextPacket(
                     text=transcription,
-                    partial=True,  # TODO is it?
-                    start=False,
+                    partial=False,
+                    start=True,
                     recog_time=timer.record(),
                     recorded_audio_length=self._recorded_audio_length,
                 )
@@ -0,0 +1,151 @@
+import re
+import numpy as np
+from typing import List, Tuple
+from loguru import logger
+
+from faster_whisper import WhisperModel
+
+# (start, end, text) of a word, in seconds from the start of the utterance
+Word = Tuple[float, float, str]
+
+
+class LocalAgreementTranscriber:
+    """Incremental transcription of an utterance while it is being spoken
+
+    Every time enough new audio arrived, the uncommitted part of the utterance
+    is decoded again. Words on which two consecutive hypotheses agree (their
+    longest common prefix, LocalAgreement-2) are committed: they are final,
+    the audio up to the end of the last committed word is dropped from the
+    window and the committed text becomes the decoding prompt. After the end
+    of speech, `finish` only decodes the remaining unstable tail.
+    """
+
+    SAMPLE_RATE = 16000
+
+    def __init__(
+        self,
+        model: WhisperModel,
+        language: str = "en",
+        beam_size: int = 5,
+        min_chunk_ms: float = 500,
+        max_window_s: float = 20,
+        prompt_words: int = 50,
+    ):
+        """Initialize transcriber
+
+        Args:
+            model (WhisperModel): shared faster-whisper model
+            language (str, optional): Transcription language. Defaults to "en".
+            beam_size (int, optional): Beam size of the decoding. Defaults to 5.
+            min_chunk_ms (float, optional): New audio needed before decoding again. Defaults to 500.
+            max_window_s (float, optional): Window length above which the hypothesis is committed without
+                agreement (whisper decodes at most 30 s). Defaults to 20.
+            prompt_words (int, optional): Last committed words given as prompt. Defaults to 50.
+        """
+        self.model = model
+        self.language = language
+        self.beam_size = beam_size
+        self.min_chunk = int(min_chunk_ms * self.SAMPLE_RATE / 1000)
+        self.max_window = int(max_window_s * self.SAMPLE_RATE)
+        self.prompt_words = prompt_words
+
+        self.num_decodes = 0
+        self.decoded_duration = 0.0  # s of audio decoded
+        self.reset()
+
+    def reset(self) -> None:
+        """Forget the utterance"""
+        self._window = np.zeros(0, dtype=np.float32)
+        self._window_start = 0.0  # s, position of the window in the utterance
+        self._num_new_samples = 0
+        self._committed: List[Word] = []
+        self._hypothesis: List[Word] = []  # uncommitted words of the last decode
+
+    @property
+    def committed_text(self) -> str:
+        return "".join(word for _, _, word in self._committed).strip()
+
+    def insert_audio(self, waveform: np.ndarray) -> None:
+        """Append audio (float32, 16 kHz) of the utterance"""
+        self._window = np.concatenate([self._window, waveform])
+        self._num_new_samples += len(waveform)
+
+    def process(self) -> str:
+        """Decode the window if enough audio arrived and commit the words two hypotheses agree on
+
+        Returns:
+            str: newly committed text, empty if none
+        """
+        if self._num_new_samples < self.min_chunk:
+            return ""
+        self._num_new_samples = 0
+
+        hypothesis = self._decode()
+        num_agreed = 0
+        for previous, current in zip(self._hypothesis, hypothesis):
+            if self._normalize(previous[2]) != self._normalize(current[2]):
+                break
+            num_agreed += 1
+        if len(self._window) > self.max_window:
+            # no agreement reached within a window whisper can still decode, keep the last words open
+            num_agreed = max(num_agreed, len(hypothesis) - 2)
+
+        committed, self._hypothesis = hypothesis[:num_agreed], hypothesis[num_agreed:]
+        if not committed:
+            return ""
+        is_first = not self._committed
+        self._committed += committed
+
+        # the next decodes start after the last committed word
+        cut = int(round((committed[-1][1] - self._window_start) * self.SAMPLE_RATE))
+        self._window = self._window[max(cut, 0):]
+        self._window_start = committed[-1][1]
+
+        text = "".join(word for _, _, word in committed)
+        return text.lstrip() if is_first else text
+
+    def finish(self) -> str:
+        """Decode the unstable tail after the end of speech and forget the utterance
+
+        Returns:
+            str: text of the whole utterance
+        """
+        if len(self._window) > 0:
+            logger.debug(f"Decoding the last {len(self._window) / self.SAMPLE_RATE:.2f} s of the utterance")
+            self._committed += self._decode()
+        text = self.committed_text
+        self.reset()
+        return text
+
+    def metrics(self) -> dict:
+        return {"decodes": self.num_decodes, "decoded_s": self.decoded_duration}
+
+    @staticmethod
+    def _normalize(word: str) -> str:
+        return re.sub(r"[^\w']", "", word.lower())
+
+    def _decode(self) -> List[Word]:
+        """Hypothesis of the window, without the words already committed"""
+        prompt = "".join(word for _, _, word in self._committed[-self.prompt_words:]).strip()
+        segments, _ = self.model.transcribe(
+            self._window,
+            language=self.language,
+            beam_size=self.beam_size,
+            word_timestamps=True,
+            initial_prompt=prompt or None,
+            condition_on_previous_text=False,
+            vad_filter=False,
+        )
+        words = [
+            (self._window_start + word.start, self._window_start + word.end, word.word)
+            for segment in segments for word in segment.words
+        ]
+        self.num_decodes += 1
+        self.decoded_duration += len(self._window) / self.SAMPLE_RATE
+
+        # whisper may repeat the last committed words at the start of the window
+        for n in range(min(5, len(self._committed), len(words)), 0, -1):
+            tail = [self._normalize(word) for _, _, word in self._committed[-n:]]
+            if [self._normalize(word) for _, _, word in words[:n]] == tail:
+                return words[n:]
+        return words
@@ -0,0 +1 @@
+from .wakeup_word_detector import WakeWordStage
@@ -0,0 +1,74 @@
+# go to parent directory
+import os
+import sys
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))))
+
+import numpy as np
+from core import AudioPacket
+from mangrove.stt.wakeup_word import WakeWordStage
+
+
+print("Testing WakeWordStage windows of a burst longer than the ring ...")
+try:
+    stage = WakeWordStage(device="cpu", window_ms=1000, hop_ms=250, max_pending_windows=8, preroll_ms=300)
+except OSError as e:
+    # the classifier is not cached and the hub is not reachable
+    print(f"Skipping, the wake word classifier is not available offline: {e}")
+    sys.exit(0)
+window, hop, capacity = stage._window, stage._hop, stage._capacity
+
+
+def check_burst(chunks):
+    """Write the chunks without classifying in between, then check the windows pending"""
+    stage.on_start()
+    for chunk in chunks:
+        stage._write(chunk)
+    burst = np.concatenate(chunks)
+    windows = stage._pending_windows()
+    print(f"Burst of {len(burst)} samples in {len(chunks)} writes, ring of {capacity}, {len(windows)} windows pending")
+    # the newest windows on the hop grid of the stream whose start is still in the ring
+    ends = [end for end in range(window, len(burst) + 1, hop) if end - window >= len(burst) - capacity]
+    assert 0 < len(windows) == len(ends) <= 8
+    for pending, end in zip(windows, ends):
+        assert np.array_equal(pending, burst[end - window:end]), f"window does not end at sample {end}"
+    assert len(stage._pending_windows()) == 0
+    return burst, ends
+
+
+# 5 s ending within a hop, the ring keeps the last 2.75 s
+noise = np.random.uniform(-0.3, 0.3, 5 * stage._sample_rate + hop // 4).astype(np.float32)
+burst, ends = check_burst([noise])
+# a burst over several packets, not classified in between
+check_burst([noise[:40000], noise[40000:]])
+check_burst(np.array_split(noise, 20))
+
+# and through the stage, while asleep nothing is forwarded
+stage.on_start()
+audio_packet = AudioPacket(
+    {
+        "bytes": (burst * 32767).astype(np.int16).tobytes(),
+        "sampleRate": stage._sample_rate,
+        "numChannels": 1,
+        "sampleWidth": 2,
+        "timestamp": 0,
+    },
+    resample=False,
+    is_processed=True,
+)
+assert stage._process(audio_packet) is None
+print(stage.metrics())
+assert stage.metrics()["windows"] == len(ends)
+
+# a stream at another rate than the classifier's is refused, not classified as garbage
+audio_packet = AudioPacket(
+    {"bytes": b"\0" * 1920, "sampleRate": 48000, "numChannels": 1, "sampleWidth": 2, "timestamp": 0},
+    resample=False,
+    is_processed=True,
+)
+try:
+    stage._process(audio_packet)
+    raise AssertionError("48 kHz audio was classified")
+except ValueError as e:
+    print(f"Refused: {e}")
+print("Testing WakeWordStage Done!")
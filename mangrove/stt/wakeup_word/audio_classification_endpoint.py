@@ -1,8 +1,10 @@
-from typing import Generator
+import numpy as np
+from typing import Generator, List, Optional, Tuple
 from abc import ABC, abstractmethod
 from transformers import pipeline
 from storage_manager import write_output
 from loguru import logger
+from core.utils import ModelRegistry
 
 
 class AudioClassificationEndpoint(ABC):
@@ -25,16 +27,14 @@ class HFAudioClassificationEndpoint:
     def __init__(
         self,
         model_name: str = "MIT/ast-finetuned-speech-commands-v2",
-        wake_word: str = "marvin",
+        wake_word: Optional[str] = "marvin",
         prediction_prob_threshold: float = 0.7,
         device: str = "cuda",
     ):
-        self._classifier = pipeline(
-            "audio-classification", model=model_name, device=device,
-        )
+        self._classifier = self.load_classifier(model_name, device)
         self.prediction_prob_threshold = prediction_prob_threshold
 
-        if wake_word not in self._classifier.model.config.label2id.keys():
+        if wake_word is not None and wake_word not in self.labels:
             raise ValueError(
                 f"Wake word {wake_word} not in set of valid class labels,"
                 f"pick a wake word in the set {self._classifier.model.config.label2id.keys()}."
@@ -46,6 +46,43 @@ class HFAudioClassificationEndpoint:
             f"Wakeword set is {self.wake_word} out of {self._classifier.model.config.label2id.keys()}"
         )
 
+    @staticmethod
+    def load_classifier(model_name: str = "MIT/ast-finetuned-speech-commands-v2", device: str = "cuda"):
+        """Shared audio classification pipeline of the process, loaded on the first call"""
+        return ModelRegistry.get(
+            ("audio_classification", model_name, device),
+            lambda: pipeline("audio-classification", model=model_name, device=device),
+        )
+
+    @property
+    def labels(self) -> List[str]:
+        return list(self._classifier.model.config.label2id.keys())
+
+    def classify(self, waveform: np.ndarray) -> Tuple[str, float]:
+        """Most likely label of a clip
+
+        Args:
+            waveform (np.array(float32)): clip at the classifier's sample rate
+
+        Returns:
+            Tuple[str, float]: label and its score
+        """
+        return self.classify_batch([waveform])[0]
+
+    def classify_batch(self, waveforms: List[np.ndarray]) -> List[Tuple[str, float]]:
+        """Most likely label of each clip, classified in one call
+
+        Args:
+            waveforms (List[np.array(float32)]): clips at the classifier's sample rate
+
+        Returns:
+            List[Tuple[str, float]]: label and its score, per clip
+        """
+        predictions = self._classifier(
+            [{"raw": waveform, "sampling_rate": self.sample_rate} for waveform in waveforms], top_k=1
+        )
+        return [(prediction[0]["label"], prediction[0]["score"]) for prediction in predictions]
+
     def detect(self, preprocessed_mic: Generator) -> Generator:
         is_detected = False
         for prediction in self._classifier(preprocessed_mic):
@@ -1,156 +1,203 @@
 import numpy as np
+from typing import Optional
+from loguru import logger
 
-from typing import Tuple, Generator
-from datetime import datetime, timedelta
-from core import AudioBuffer, AudioPacket
-from .audio_classification_endpoint import HFAudioClassificationEndpoint
+from core import AudioPacket
+from core.stage import AudioToAudioStage
+from core.utils import Timer
+from ...vad.energy_gate import EnergyGate
+
+
+class WakeWordStage(AudioToAudioStage):
+    """Gate of the pipeline until the wake word is spoken
+
+    Placed first in the pipeline. While asleep, frames are only kept in a ring
+    buffer and classified in overlapping windows, and nothing is forwarded, so
+    no VAD, STT or bot compute is spent. Once a window is classified as the wake
+    word, the last `preroll_ms` of audio and every following frame are
+    forwarded, until no frame was louder than `activity_db` for
+    `awake_timeout_ms`.
+
+    The stream must be at the classifier's sample rate (16 kHz for the speech
+    commands models), as the preroll is forwarded from the same ring.
+
+    The ring holds every sample twice (at `i` and `i + capacity`), so the
+    most recent `capacity` samples are always contiguous and the windows are
+    strided views of it, never copies.
+    """
 
-# TODO rewrite as a stage !!!
-class WakeUpVoiceDetector:
     def __init__(
         self,
-        audio_classification_endpoint_kwargs: dict = {
-            "model_name": "MIT/ast-finetuned-speech-commands-v2",
-            "prediction_prob_threshold": 0.90,
-        },
-        device="cuda",
+        wake_word: str = "marvin",
+        score_threshold: float = 0.9,
+        window_ms: float = 1000,
+        hop_ms: float = 250,
+        max_pending_windows: int = 8,
+        awake_timeout_ms: float = 10000,
+        activity_db: float = -45,
+        preroll_ms: float = 300,
+        frame_size=512 * 4,
+        device=None,
         verbose=False,
+        endpoint="hf",
+        endpoint_kwargs={},
     ):
-        self.verbose = verbose
-        self._audio_classifier = HFAudioClassificationEndpoint(
-            **audio_classification_endpoint_kwargs, device=device
-        )
-        self.frame_size = self._audio_classifier.frame_size
-        if self.frame_size is None:
-            raise ValueError(f'Check implementation of {self._audio_classifier} for frame_size')
-        self._input_buffer = AudioBuffer(frame_size=self._audio_classifier.frame_size)
-
-        stream_chunk_s = self._audio_classifier.frame_size / self._audio_classifier.sample_rate
-        self._setup_params(stream_chunk_s=stream_chunk_s, chunk_length_s=2.0)
-
-    def reset_data_buffer(self):
-        """Reset data buffer"""
-        self._input_buffer.reset()
-
-    def feed_audio(self, audio_packet: AudioPacket):
-        """Feed audio packet to buffer
+        """Initialize Wake Word Stage
 
         Args:
-            audio_packet (AudioPacket): Audio packet to feed procupine hot-word detector
+            wake_word (str, optional): Wake word, a label of the classifier. Defaults to "marvin".
+            score_threshold (float, optional): Classifier score from which the wake word is accepted. Defaults to 0.9.
+            window_ms (float, optional): Audio classified at once. Defaults to 1000.
+            hop_ms (float, optional): Step between windows. Defaults to 250.
+            max_pending_windows (int, optional): Windows classified at once when audio arrives in bursts, older
+                ones are skipped. Defaults to 8.
+            awake_timeout_ms (float, optional): Inactivity after which the pipeline is gated again. Defaults to 10000.
+            activity_db (float, optional): Frame level (dBFS) counted as activity while awake. Defaults to -45.
+            preroll_ms (float, optional): Audio before the wake up forwarded with it, so that speech right
+                after the wake word is not cut. Defaults to 300.
+            frame_size (int, optional): audio frame size. Defaults to 512*4.
+            device (str, optional): Device to use. Defaults to None.
+            verbose (bool, optional): Whether to print debug messages. Defaults to False.
+            endpoint (str, optional): Wake word classifier, "hf" (speech commands audio classification). Defaults to "hf".
+            endpoint_kwargs (dict, optional): Extra arguments of the classifier endpoint. Defaults to {}.
         """
-        self._input_buffer.put(audio_packet)
-
-    @staticmethod
-    def chunk_bytes_iter(
-        iterator: AudioBuffer,
-        chunk_len: int,
-        stride: Tuple[int, int],
-        stream: bool = False,
-    ):
-        """
-        Reads raw bytes from an iterator and does chunks of length `chunk_len`. Optionally adds `stride` to each chunks to
-        get overlaps. `stream` is used to return partial results even if a full `chunk_len` is not yet available.
-        """
-        acc = b""
-        stride_left, stride_right = stride
-        if stride_left + stride_right >= chunk_len:
-            raise ValueError(
-                f"Stride needs to be strictly smaller than chunk_len: ({stride_left}, {stride_right}) vs {chunk_len}"
-            )
+        super().__init__(frame_size=frame_size, verbose=verbose, batch_processing=True)
 
-        _stride_left = 0
-        while True:
-            try:
-                audio_packet = iterator.get_nowait(
-                    frame_size=chunk_len + stride_left + stride_right
-                )
-                # print(f"audio_packet {len(audio_packet)}: {audio_packet}")
-            except AudioBuffer.Empty:
-                # logger.warning('no packets in buffer')
-                break
-
-            raw = audio_packet.bytes
-            acc += raw
-            if stream and len(acc) < chunk_len:
-                stride = (_stride_left, 0)
-                yield {"raw": acc[:chunk_len], "stride": stride, "partial": True}
-
-            else:
-                while len(acc) >= chunk_len:
-                    # We are flushing the accumulator
-                    stride = (_stride_left, stride_right)
-                    item = {"raw": acc[:chunk_len], "stride": stride}
-                    if stream:
-                        item["partial"] = False
-                    yield item
-                    _stride_left = stride_left
-                    acc = acc[chunk_len - stride_left - stride_right :]
-
-        # Last chunk
-        # if len(acc) > stride_left:
-        #     item = {"raw": acc, "stride": (_stride_left, 0)}
-        #     if stream:
-        #         item["partial"] = False
-        #     yield item
-
-    def _setup_params(self, stream_chunk_s, chunk_length_s=0.5):
-        # TODO add option to change format_for_conversion dynamically by audio_packet given format
-        self.chunk_s = stream_chunk_s
-        self.sampling_rate = self._audio_classifier.sample_rate
-        self.dtype = np.float32
-        self.size_of_sample = 4 # 32 bits because of float32
-
-        stride_length_s = chunk_length_s/ 6
-
-        self.chunk_len = int(round(self.sampling_rate * chunk_length_s)) * self.size_of_sample
-
-        if isinstance(stride_length_s, (int, float)):
-            stride_length_s = [stride_length_s, stride_length_s]
-
-        self.stride_left = (
-            int(round(self.sampling_rate * stride_length_s[0])) * self.size_of_sample
-        )
-        self.stride_right = (
-            int(round(self.sampling_rate * stride_length_s[1])) * self.size_of_sample
-        )
-
-    def _preprocessed_mic(self) -> Generator:
-        audio_time = datetime.now()
-        delta = timedelta(
-            seconds=self.chunk_s
-        )  # TODO calculate based on timestamp of AudioPacket
-        # logger.debug('starting processing...', end='', flush=True)
-        for item in self.chunk_bytes_iter(
-            self._input_buffer,
-            self.chunk_len,
-            stride=(self.stride_left, self.stride_right),
-            stream=True,
-        ):
-            # print(">", end="", flush=True)
-            # Put everything back in numpy scale
-            item["raw"] = np.frombuffer(item["raw"], dtype=self.dtype).copy()
-            item["stride"] = (
-                item["stride"][0] // self.size_of_sample,
-                item["stride"][1] // self.size_of_sample,
+        if device is None:
+            import torch
+            device = "cuda" if torch.cuda.is_available() else "cpu"
+
+        if endpoint == "hf":
+            from .audio_classification_endpoint import HFAudioClassificationEndpoint
+            self._endpoint = HFAudioClassificationEndpoint(
+                wake_word=wake_word, prediction_prob_threshold=score_threshold, device=device, **endpoint_kwargs
             )
-            item["sampling_rate"] = self.sampling_rate
-
-            audio_time += delta  # TODO fix audio time to match the transmitted time from AudioPacket
-            if datetime.now() > audio_time + 10 * delta:  # TODO put back
-                print(
-                    f"time: {audio_time + 10 * delta};;; while now is {datetime.now()}; skipping ...",
-                    end="",
-                    flush=True,
-                )
-                # We're late !! SKIP
-                continue
-            yield item
-        # logger.debug('quitting processing', flush=True)
-
-    def is_wake_word_detected(self) -> bool:
-        """Check if wake word is detected in the audio stream
-
-        Returns:
-            bool: True if wake word is detected
-        """
-        return self._audio_classifier.detect(self._preprocessed_mic())
+        else:
+            raise Exception(f"Unknown Endpoint {endpoint}, available endpoints: hf")
+
+        self.wake_word = wake_word
+        self.score_threshold = score_threshold
+        self.awake_timeout_ms = awake_timeout_ms
+        self.activity_db = activity_db
+
+        sample_rate = self._endpoint.sample_rate
+        self._sample_rate = sample_rate
+        self._window = int(window_ms * sample_rate / 1000)
+        self._hop = int(hop_ms * sample_rate / 1000)
+        self._preroll = int(preroll_ms * sample_rate / 1000)
+        self._capacity = max(self._window + (max_pending_windows - 1) * self._hop, self._preroll)
+        self._ring = np.zeros(2 * self._capacity, dtype=np.float32)
+
+        self.num_windows = 0
+        self.num_wake_ups = 0
+        self.total_classification_time = 0.0
+        self.on_start()
+
+    def on_start(self):
+        self._num_samples = 0  # written to the ring so far
+        self._next_window_end = self._window  # in samples written
+        self._awake_until: Optional[float] = None  # stream timestamp (ms) at which the gate closes, None while asleep
+
+    @property
+    def is_awake(self) -> bool:
+        return self._awake_until is not None
+
+    def on_sleep(self):
+        self.log('<wake>' if self.is_awake else '<zzz>')
+
+    def on_disconnect(self) -> None:
+        logger.info(f"Wake word {self.metrics()}")
+
+    def metrics(self) -> dict:
+        return {
+            "windows": self.num_windows,
+            "wake_ups": self.num_wake_ups,
+            "avg_classification_ms": self.total_classification_time * 1000 / self.num_windows if self.num_windows else 0.0,
+        }
+
+    def _write(self, samples: np.ndarray) -> None:
+        """Append samples to the ring, keeping the most recent ones if there are too many"""
+        # the samples skipped still count, so that windows stay on the hop grid of the stream
+        num_skipped = max(len(samples) - self._capacity, 0)
+        self._num_samples += num_skipped
+        samples = samples[num_skipped:]
+        start = self._num_samples % self._capacity
+        first = min(len(samples), self._capacity - start)
+        for offset in (0, self._capacity):
+            self._ring[offset + start:offset + start + first] = samples[:first]
+            self._ring[offset:offset + len(samples) - first] = samples[first:]
+        self._num_samples += len(samples)
+
+    def _recent(self, num_samples: int) -> np.ndarray:
+        """View of the last `num_samples` samples written, `num_samples` <= capacity"""
+        assert num_samples <= self._capacity, f"Only the last {self._capacity} samples are kept, not {num_samples}"
+        end = self._num_samples % self._capacity + self._capacity
+        return self._ring[end - num_samples:end]
+
+    def _pending_windows(self) -> np.ndarray:
+        """Windows ending at every hop not classified yet, as strided views of the ring"""
+        # skip the oldest windows whose start was already overwritten in the ring
+        oldest_end = self._num_samples - self._capacity + self._window
+        if self._next_window_end < oldest_end:
+            num_skipped = -(-(oldest_end - self._next_window_end) // self._hop)
+            logger.debug(f"Skipping {num_skipped} windows of a burst of audio")
+            self._next_window_end += num_skipped * self._hop
+        if self._next_window_end > self._num_samples:
+            return self._ring[:0].reshape(0, self._window)
+        num_windows = (self._num_samples - self._next_window_end) // self._hop + 1
+        first_start = self._next_window_end - self._window
+        self._next_window_end += num_windows * self._hop
+
+        span = self._recent(self._num_samples - first_start)
+        return np.lib.stride_tricks.sliding_window_view(span, self._window)[::self._hop][:num_windows]
+
+    def _wake_up(self, audio_packet: AudioPacket) -> AudioPacket:
+        """Open the gate, returning the preroll audio up to the end of `audio_packet`"""
+        self.num_wake_ups += 1
+        end = audio_packet.timestamp + audio_packet.duration
+        self._awake_until = end + self.awake_timeout_ms
+        logger.success(f"Wake word '{self.wake_word}' spoken, listening for {self.awake_timeout_ms / 1000:.0f} s of inactivity")
+
+        num_samples = min(self._preroll, self._num_samples)
+        preroll = (self._recent(num_samples) * 32767).astype(np.int16)
+        return AudioPacket({
+            "bytes": preroll.tobytes(),
+            "sampleRate": self._sample_rate,
+            "numChannels": 1,
+            "sampleWidth": 2,
+            "timestamp": end - num_samples * 1000 / self._sample_rate,
+        }, resample=False, is_processed=True)
+
+    def _fall_asleep(self) -> None:
+        logger.info("No activity, waiting for the wake word again")
+        self._awake_until = None
+        # the next window is made of audio received from now on only
+        self._next_window_end = self._num_samples + self._window
+
+    def _process(self, audio_packet: AudioPacket) -> Optional[AudioPacket]:
+        if self.is_awake:
+            rms_db, _ = EnergyGate.features([audio_packet])
+            end = audio_packet.timestamp + audio_packet.duration
+            if rms_db[0] >= self.activity_db:
+                self._awake_until = end + self.awake_timeout_ms
+            if end <= self._awake_until:
+                return audio_packet
+            self._fall_asleep()
+
+        if audio_packet.sample_rate != self._sample_rate:
+            raise ValueError(
+                f"Wake word classifier takes {self._sample_rate} Hz audio, got {audio_packet.sample_rate} Hz, "
+                f"resample the stream before this stage"
+            )
+        self._write(audio_packet.float)
+        windows = self._pending_windows()
+        if len(windows) == 0:
+            return None
+        with Timer() as timer:
+            predictions = self._endpoint.classify_batch(list(windows))
+        self.num_windows += len(windows)
+        self.total_classification_time += timer.record()
+
+        if any(label == self.wake_word and score >= self.score_threshold for label, score in predictions):
+            return self._wake_up(audio_packet)
+        return None
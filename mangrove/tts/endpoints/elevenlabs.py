@@ -2,8 +2,8 @@ import os
 import numpy as np
 from typing import Generator
 from elevenlabs.client import ElevenLabs
-from core.data import AudioPacket, TextPacket
-from core.utils import bytes_to_audio_packet
+from core.data import AudioPacket, TextPacket, StreamResampler
+from core.utils import bytes_to_audio_packet, flush_resampler_to_audio_packet
 from .base import TTSEndpoint
 
 class ElevenLabsTTSEndpoint(TTSEndpoint):
@@ -20,6 +20,7 @@ class ElevenLabsTTSEndpoint(TTSEndpoint):
     def text_to_audio(self, text_packet: TextPacket) -> Generator[AudioPacket, None, None]:
         # TODO fix stuttering output
         leftover = None
+        resampler = StreamResampler()
         for chunk in self.client.generate(
             text=text_packet.text, model=self.model_name, 
             output_format="mp3_22050_32",
@@ -29,7 +30,10 @@ class ElevenLabsTTSEndpoint(TTSEndpoint):
                 chunk = leftover + chunk
                 leftover = None
             try:
-                yield bytes_to_audio_packet(chunk, format="mp3")
+                yield bytes_to_audio_packet(chunk, format="mp3", resampler=resampler)
             except Exception as e:
                 leftover = chunk
-                continue
\ No newline at end of file
+                continue
+        tail = flush_resampler_to_audio_packet(resampler)
+        if tail is not None:
+            yield tail
@@ -2,8 +2,8 @@ import backoff
 from typing import Generator
 from pydub import AudioSegment
 from gtts import gTTS, gTTSError
-from core.data import AudioPacket, TextPacket
-from core.utils import bytes_to_audio_packet
+from core.data import AudioPacket, TextPacket, StreamResampler
+from core.utils import bytes_to_audio_packet, flush_resampler_to_audio_packet
 from .base import TTSEndpoint
 
 class GTTSEndpoint(TTSEndpoint):
@@ -17,6 +17,10 @@ class GTTSEndpoint(TTSEndpoint):
     def text_to_audio(self, text_packet: TextPacket) -> Generator[AudioPacket, None, None]:
         @backoff.on_exception(backoff.expo, gTTSError, max_tries=5)
         def get_audio_packets():
+            resampler = StreamResampler()
             for raw_audio_bytes in self.engine(text_packet.text, lang='en', timeout=3).stream():
-                yield bytes_to_audio_packet(raw_audio_bytes, format="mp3")
+                yield bytes_to_audio_packet(raw_audio_bytes, format="mp3", resampler=resampler)
+            tail = flush_resampler_to_audio_packet(resampler)
+            if tail is not None:
+                yield tail
         yield from get_audio_packets()
\ No newline at end of file
@@ -4,14 +4,14 @@ import time
 import scipy
 import torch
 import numpy as np
-from typing import Generator
+from typing import Generator, Optional
 from TTS.tts.configs.xtts_config import XttsConfig, XttsAudioConfig
 from TTS.tts.models.xtts import Xtts
 from TTS.api import TTS
 from pydub import AudioSegment
 from loguru import logger
-from core.data import AudioPacket, TextPacket
-from core.utils import np_audio_to_audio_packet
+from core.data import AudioPacket, TextPacket, StreamResampler
+from core.utils import ModelRegistry, np_audio_to_audio_packet, flush_resampler_to_audio_packet
 from .elevenlabs import ElevenLabsTTSEndpoint
 from .base import TTSEndpoint
 
@@ -22,9 +22,21 @@ class TTSLibraryEndpoint(TTSEndpoint):
         device=None,
         **kwargs
     ):
+        self.model, self.gpt_cond_latent, self.speaker_embedding = self.load_model(model_name, device)
+        self.sample_rate = XttsAudioConfig.output_sample_rate
+
+    @staticmethod
+    def load_model(model_name: str = "tts_models/multilingual/multi-dataset/xtts_v2", device: Optional[str] = None):
+        """Shared xTTS model and speaker latents of the process, loaded on the first call"""
         if device is None:
             device = "cuda" if torch.cuda.is_available() else "cpu"
+        return ModelRegistry.get(
+            ("xtts", model_name, device), lambda: TTSLibraryEndpoint._load_model(model_name, device)
+        )
 
+    @staticmethod
+    def _load_model(model_name: str, device: str):
+        """Load the xTTS model and the speaker latents, shared by every session"""
         ckpt_dir = TTS().download_model_by_name(model_name)[-1]
         config_path = os.path.join(ckpt_dir, "config.json")
         if not os.path.exists(config_path):
@@ -36,13 +48,13 @@ class TTSLibraryEndpoint(TTSEndpoint):
         model.load_checkpoint(config, checkpoint_dir=ckpt_dir, use_deepspeed=True)
         if device == "cuda":
             model.cuda()
-        self._ensure_speaker_wav()
+        TTSLibraryEndpoint._ensure_speaker_wav()
         logger.info("Computing speaker latents of xTTS model")
-        self.gpt_cond_latent, self.speaker_embedding = model.get_conditioning_latents(audio_path=["speaker.wav"])
-        self.model = model
-        self.sample_rate = XttsAudioConfig.output_sample_rate
+        gpt_cond_latent, speaker_embedding = model.get_conditioning_latents(audio_path=["speaker.wav"])
+        return model, gpt_cond_latent, speaker_embedding
 
-    def _ensure_speaker_wav(self) -> None:
+    @staticmethod
+    def _ensure_speaker_wav() -> None:
         if not os.path.exists('speaker.wav'):
             # generate speaker.wav using ElevenLabsTTSEndpoint
             logger.warning("Generating speaker.wav using ElevenLabsTTSEndpoint as it is not available.")
@@ -67,9 +79,13 @@ class TTSLibraryEndpoint(TTSEndpoint):
             enable_text_splitting=True,
         )
 
+        resampler = StreamResampler()
         for i, chunk in enumerate(chunks):
             # if i == 0:
             #     print(f"Time to first chunck: {time.time() - t0}")
             # print(f"Received chunk {i} of audio length {chunk.shape[-1]}")
-            yield np_audio_to_audio_packet(chunk.cpu().numpy(), self.sample_rate)
+            yield np_audio_to_audio_packet(chunk.cpu().numpy(), self.sample_rate, resampler=resampler)
+        tail = flush_resampler_to_audio_packet(resampler)
+        if tail is not None:
+            yield tail
 
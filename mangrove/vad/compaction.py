@@ -0,0 +1,124 @@
+import numpy as np
+from typing import List, Tuple
+from loguru import logger
+
+from core import AudioPacket
+
+
+class UtteranceCompactor:
+    """Silence removal from an utterance before transcription
+
+    Whisper's compute grows with the length of its input, while an utterance
+    out of the VAD holds its buffered head silence, the whole tail silence
+    that ended it and every pause of the speaker. Based on the speech segments
+    the VAD attached to the utterance, the silence before the first and after
+    the last segment is trimmed to `pad_ms`, and pauses longer than
+    `max_pause_ms` are shortened to it (keeping half of it on each side).
+
+    The compacted utterance starts at the original time of its first sample
+    kept, its speech segments are moved to its own clock, and its
+    `timestamp_map` gives the original time of each piece kept, for
+    `original_timestamp` to align anything found in it with the stream.
+    """
+
+    def __init__(self, pad_ms: float = 200, max_pause_ms: float = 300):
+        """Initialize compactor
+
+        Args:
+            pad_ms (float, optional): Silence kept before the first and after the last speech segment. Defaults to 200.
+            max_pause_ms (float, optional): Longest pause between speech segments kept. Defaults to 300.
+        """
+        self.pad_ms = pad_ms
+        self.max_pause_ms = max_pause_ms
+
+        self.num_utterances = 0
+        self.input_duration = 0.0  # ms
+        self.output_duration = 0.0  # ms
+
+    def compact(self, audio_packet: AudioPacket) -> AudioPacket:
+        """Utterance without its excess silence
+
+        Args:
+            audio_packet (AudioPacket): utterance with its speech segments in its metadata
+
+        Returns:
+            AudioPacket: the compacted utterance, the utterance itself if it has no speech segments
+                or nothing to remove
+        """
+        speech_timestamps = audio_packet.metadata.get("speech_timestamps")
+        if not speech_timestamps:
+            return audio_packet
+
+        samples = audio_packet.int16
+        samples_per_ms = audio_packet.sample_rate / 1000
+        spans = (np.array(speech_timestamps, dtype=np.float64) - audio_packet.timestamp) * samples_per_ms
+        # silence kept around each segment: the pad at both ends, half of the longest pause in between
+        before = np.full(len(spans), self.max_pause_ms / 2 * samples_per_ms)
+        after = before.copy()
+        before[0] = after[-1] = self.pad_ms * samples_per_ms
+        starts = np.clip(np.floor(spans[:, 0] - before), 0, len(samples)).astype(np.int64)
+        ends = np.clip(np.ceil(spans[:, 1] + after), 0, len(samples)).astype(np.int64)
+
+        # samples covered by any kept interval, overlapping intervals (short pauses) merge
+        coverage = np.zeros(len(samples) + 1, dtype=np.int32)
+        np.add.at(coverage, starts, 1)
+        np.add.at(coverage, ends, -1)
+        is_kept = np.cumsum(coverage[:-1]) > 0
+
+        self.num_utterances += 1
+        self.input_duration += audio_packet.duration
+        if is_kept.all():
+            self.output_duration += audio_packet.duration
+            return audio_packet
+
+        # pieces kept, as [start, end) sample indices
+        edges = np.flatnonzero(np.diff(np.concatenate([[False], is_kept, [False]]).astype(np.int8)))
+        piece_starts, piece_ends = edges[0::2], edges[1::2]
+        offsets = np.concatenate([[0], np.cumsum(piece_ends - piece_starts)[:-1]])
+
+        timestamp = audio_packet.timestamp + int(piece_starts[0]) / samples_per_ms
+        compacted = AudioPacket({
+            "bytes": samples[is_kept].tobytes(),
+            "sampleRate": audio_packet.sample_rate,
+            "numChannels": 1,
+            "sampleWidth": 2,
+            "timestamp": timestamp,
+        }, resample=False, is_processed=True)
+        compacted.partial = audio_packet.partial
+
+        timestamp_map = [
+            (timestamp + offset / samples_per_ms, audio_packet.timestamp + start / samples_per_ms)
+            for offset, start in zip(offsets.tolist(), piece_starts.tolist())
+        ]
+        compacted.metadata["timestamp_map"] = timestamp_map
+        # every segment lies within a kept piece, so it just moves with it
+        pieces = np.searchsorted(piece_starts, spans[:, 0], side="right") - 1
+        shifts = (offsets[pieces] - piece_starts[pieces]) / samples_per_ms + timestamp - audio_packet.timestamp
+        compacted.metadata["speech_timestamps"] = [
+            (start + shift, end + shift) for (start, end), shift in zip(speech_timestamps, shifts.tolist())
+        ]
+
+        self.output_duration += compacted.duration
+        logger.debug(f"Compacted utterance from {audio_packet.duration:.0f} ms to {compacted.duration:.0f} ms")
+        return compacted
+
+    @staticmethod
+    def original_timestamp(audio_packet: AudioPacket, timestamp: float) -> float:
+        """Time on the stream clock of a time (ms) within a compacted utterance"""
+        timestamp_map: List[Tuple[float, float]] = audio_packet.metadata.get("timestamp_map")
+        if not timestamp_map:
+            return timestamp
+        compacted_starts = [compacted for compacted, _ in timestamp_map]
+        piece = max(int(np.searchsorted(compacted_starts, timestamp, side="right")) - 1, 0)
+        return timestamp_map[piece][1] + timestamp - timestamp_map[piece][0]
+
+    @property
+    def removed_fraction(self) -> float:
+        """Share of the utterances' audio removed"""
+        return 1 - self.output_duration / self.input_duration if self.input_duration else 0.0
+
+    def metrics(self) -> dict:
+        return {
+            "compacted_utterances": self.num_utterances,
+            "compaction_removed_fraction": self.removed_fraction,
+        }
@@ -0,0 +1,143 @@
+import collections
+import numpy as np
+from typing import Optional
+from loguru import logger
+
+
+class AdaptiveEndpointer:
+    """Tail silence threshold adapted to the utterance and the speaker
+
+    Instead of waiting a fixed tail silence before ending every utterance, the
+    wait starts from the speaker's own pauses (a high quantile of the pauses
+    after which they resumed speaking, once enough were seen) and is then
+
+    - shortened when the speech probability was falling before the silence
+      (speech fading out) or the utterance is a short reply,
+    - lengthened once the speaker already paused within the utterance (a
+      hesitant, mid-sentence speaker).
+
+    An utterance restarting shortly after an end is counted as a pause too,
+    so ending too early raises the speaker's wait. Durations are in ms.
+    """
+
+    def __init__(
+        self,
+        tail_silence_threshold: float = 500,
+        min_tail_silence: float = 200,
+        max_tail_silence: float = 1200,
+        pause_quantile: float = 0.9,
+        pause_margin: float = 100,
+        min_pauses: int = 5,
+        max_pauses: int = 50,
+        trend_frames: int = 4,
+        falling_trend: float = 0.1,
+        falling_factor: float = 0.6,
+        short_utterance: float = 800,
+        short_factor: float = 0.7,
+        pause_extension: float = 150,
+        resume_window: float = 300,
+    ):
+        """Initialize adaptive endpointer
+
+        Args:
+            tail_silence_threshold (float, optional): Wait until the speaker's pauses are known. Defaults to 500.
+            min_tail_silence (float, optional): Shortest wait. Defaults to 200.
+            max_tail_silence (float, optional): Longest wait. Defaults to 1200.
+            pause_quantile (float, optional): Quantile of the speaker's pauses to wait for. Defaults to 0.9.
+            pause_margin (float, optional): Added to the pause quantile. Defaults to 100.
+            min_pauses (int, optional): Pauses to observe before using their quantile. Defaults to 5.
+            max_pauses (int, optional): Most recent pauses kept per speaker. Defaults to 50.
+            trend_frames (int, optional): Last speech frames the probability trend is taken over. Defaults to 4.
+            falling_trend (float, optional): Probability drop over those frames marking speech fading out. Defaults to 0.1.
+            falling_factor (float, optional): Wait factor when speech faded out. Defaults to 0.6.
+            short_utterance (float, optional): Speech duration under which an utterance is a short reply. Defaults to 800.
+            short_factor (float, optional): Wait factor of short replies. Defaults to 0.7.
+            pause_extension (float, optional): Wait added after a pause within the utterance. Defaults to 150.
+            resume_window (float, optional): Restart delay under which an ended utterance counts as a pause. Defaults to 300.
+        """
+        self.default_tail_silence = tail_silence_threshold
+        self.min_tail_silence = min_tail_silence
+        self.max_tail_silence = max_tail_silence
+        self.pause_quantile = pause_quantile
+        self.pause_margin = pause_margin
+        self.min_pauses = min_pauses
+        self.falling_trend = falling_trend
+        self.falling_factor = falling_factor
+        self.short_utterance = short_utterance
+        self.short_factor = short_factor
+        self.pause_extension = pause_extension
+        self.resume_window = resume_window
+
+        # speaker
+        self._pauses = collections.deque(maxlen=max_pauses)
+        self._last_end: Optional[float] = None
+        self._last_end_silence = 0.0
+
+        # utterance
+        self._recent_probs = collections.deque(maxlen=trend_frames)
+        self._speech_duration = 0.0
+        self._num_pauses = 0
+
+        self.num_endpoints = 0
+        self.num_resumed = 0
+        self.total_tail_silence = 0.0
+
+    def reset(self) -> None:
+        """Drop the utterance in progress, the speaker's pauses are kept"""
+        self._recent_probs.clear()
+        self._speech_duration = 0.0
+        self._num_pauses = 0
+        self._last_end = None
+
+    def metrics(self) -> dict:
+        return {
+            "endpoints": self.num_endpoints,
+            "resumed": self.num_resumed,
+            "avg_tail_silence": self.total_tail_silence / self.num_endpoints if self.num_endpoints else 0.0,
+            "speaker_pause_quantile": self._speaker_wait(),
+        }
+
+    def on_utterance_start(self, timestamp: float) -> None:
+        if self._last_end is not None and timestamp - self._last_end < self.resume_window:
+            # the previous utterance was ended within a pause
+            self._pauses.append(self._last_end_silence + timestamp - self._last_end)
+            self.num_resumed += 1
+            logger.debug(f"Utterance resumed {timestamp - self._last_end:.0f} ms after its end")
+        self._last_end = None
+        self._recent_probs.clear()
+        self._speech_duration = 0.0
+        self._num_pauses = 0
+
+    def on_speech(self, speech_prob: float, duration: float) -> None:
+        self._recent_probs.append(speech_prob)
+        self._speech_duration += duration
+
+    def on_pause(self, duration: float) -> None:
+        self._pauses.append(duration)
+        self._num_pauses += 1
+
+    def on_utterance_end(self, timestamp: float, silence_duration: float) -> None:
+        self._last_end = timestamp
+        self._last_end_silence = silence_duration
+        self.num_endpoints += 1
+        self.total_tail_silence += silence_duration
+
+    def _speaker_wait(self) -> Optional[float]:
+        if len(self._pauses) < self.min_pauses:
+            return None
+        return float(np.quantile(self._pauses, self.pause_quantile)) + self.pause_margin
+
+    def tail_silence_threshold(self) -> float:
+        """Silence (ms) ending the current utterance"""
+        threshold = self._speaker_wait()
+        if threshold is None:
+            threshold = self.default_tail_silence
+
+        if len(self._recent_probs) >= 2 and self._recent_probs[0] - self._recent_probs[-1] >= self.falling_trend:
+            threshold *= self.falling_factor
+        if self._num_pauses == 0 and self._speech_duration < self.short_utterance:
+            threshold *= self.short_factor
+        if self._num_pauses > 0:
+            threshold += self.pause_extension
+
+        return min(max(threshold, self.min_tail_silence), self.max_tail_silence)
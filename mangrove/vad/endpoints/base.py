@@ -1,5 +1,5 @@
 import collections
-from typing import Union, List
+from typing import Union, List, Optional, Tuple
 from abc import ABCMeta, abstractmethod
 from functools import reduce
 from queue import Queue, Empty
@@ -7,6 +7,7 @@ from loguru import logger
 
 from storage_manager import write_output
 from core import AudioBuffer, AudioPacket
+from ..endpointer import AdaptiveEndpointer
 
 class VoiceActivityDetector(metaclass=ABCMeta):
 
@@ -14,6 +15,14 @@ class VoiceActivityDetector(metaclass=ABCMeta):
     def is_speech(self, audio_packets: Union[List[AudioPacket], AudioPacket]) -> Union[bool, List[bool]]:
         raise NotImplementedError("is_speech must be implemented in subclass")
 
+    def is_speech_with_probs(self, audio_packets: List[AudioPacket]) -> Tuple[List[bool], List[float]]:
+        """Decision and speech probability of each frame
+
+        Endpoints without a probability report their decision (0 or 1) instead.
+        """
+        is_speeches = self.is_speech(audio_packets)
+        return is_speeches, [float(is_speech) for is_speech in is_speeches]
+
     def __init__(
         self, tail_silence_threshold: int = 150, frame_size: int = 320 * 3, verbose=False
     ):
@@ -27,8 +36,12 @@ class VoiceActivityDetector(metaclass=ABCMeta):
         self._reset_head_silences_buffer()
 
         self._command_audio_packet = None
+        self._speech_timestamps: List[Tuple[float, float]] = []  # speech of the current utterance
         self._output_queue = Queue()
 
+        # adapts the tail silence of each utterance if set, fixed tail_silence_threshold otherwise
+        self.endpointer: Optional[AdaptiveEndpointer] = None
+
     @property
     def frame_size(self):
         return self._frame_size
@@ -37,8 +50,11 @@ class VoiceActivityDetector(metaclass=ABCMeta):
         assert self._is_started, "Recording not started"
         self._is_started = False
         self._command_audio_packet = None
+        self._speech_timestamps = []
         self._tail_silence_timestamp = None
         self._reset_head_silences_buffer()
+        if self.endpointer is not None:
+            self.endpointer.reset()
 
     def _reset_head_silences_buffer(self, amount_to_keep_ms=200) -> None:
         """Reset silence buffer"""
@@ -59,13 +75,42 @@ class VoiceActivityDetector(metaclass=ABCMeta):
             complete_frame = audio_packet
         return complete_frame
     
-    def feed(self, audio_packet: AudioPacket) -> None:
-        if self.is_speech(audio_packet):
+    def feed(self, audio_packet: AudioPacket, is_speech: Optional[bool] = None, speech_prob: Optional[float] = None) -> None:
+        """Feed next frame of the stream
+
+        Args:
+            audio_packet (AudioPacket): frame to feed
+            is_speech (bool, optional): precomputed decision for the frame, e.g. from a batched
+                `is_speech` call. Defaults to None (evaluated here).
+            speech_prob (float, optional): speech probability of the frame, used by the endpointer.
+                Defaults to None (the decision).
+        """
+        if is_speech is None:
+            is_speech = self.is_speech(audio_packet)
+        if speech_prob is None:
+            speech_prob = float(is_speech)
+
+        if is_speech:
             if self._command_audio_packet is None:
                 self._command_audio_packet = self._concat_head_buffered_silences(audio_packet)
                 logger.success(f"Starting an utterance AudioPacket at {self._command_audio_packet.timestamp}")
+                if self.endpointer is not None:
+                    self.endpointer.on_utterance_start(audio_packet.timestamp)
             else:
                 self._command_audio_packet += audio_packet
+                if self._tail_silence_timestamp is not None:
+                    # speech resumed, the silence was a pause within the utterance
+                    if self.endpointer is not None:
+                        self.endpointer.on_pause(audio_packet.timestamp - self._tail_silence_timestamp)
+                    self._tail_silence_timestamp = None
+            if self.endpointer is not None:
+                self.endpointer.on_speech(speech_prob, audio_packet.duration)
+
+            speech_end = audio_packet.timestamp + audio_packet.duration
+            if self._speech_timestamps and abs(self._speech_timestamps[-1][1] - audio_packet.timestamp) < 1:
+                self._speech_timestamps[-1] = (self._speech_timestamps[-1][0], speech_end)
+            else:
+                self._speech_timestamps.append((audio_packet.timestamp, speech_end))
             
         else:
             # silence    
@@ -83,12 +128,20 @@ class VoiceActivityDetector(metaclass=ABCMeta):
                     # TODO should i use now_timestamp or  audio_packet.timestamp
                     silence_duration = now_timestamp - self._tail_silence_timestamp
                     # logger.debug(f'Got Silence after voice duration: {silence_duration}')
-                    if silence_duration >= self._tail_silence_threshold:
+                    tail_silence_threshold = self._tail_silence_threshold
+                    if self.endpointer is not None:
+                        tail_silence_threshold = self.endpointer.tail_silence_threshold()
+                    if silence_duration >= tail_silence_threshold:
+                        if self.endpointer is not None:
+                            self.endpointer.on_utterance_end(now_timestamp, silence_duration)
                         self._tail_silence_timestamp = None
                         self.log("\n[end]", force=True)
                     
+                        # the speech segments travel with the utterance, e.g. for STT to skip its own VAD
+                        self._command_audio_packet.metadata["speech_timestamps"] = self._speech_timestamps
                         self._output_queue.put(self._command_audio_packet)
                         self._command_audio_packet = None
+                        self._speech_timestamps = []
             else:
                 assert isinstance(audio_packet, AudioPacket), f"audio_packet must be AudioPacket, found {type(audio_packet)}"
                 self._head_silences_buffer.append(audio_packet)
@@ -103,6 +156,12 @@ class VoiceActivityDetector(metaclass=ABCMeta):
         audio_packet: AudioPacket = reduce(lambda x, y: x + y, audio_packets)
         return audio_packet
     
+    def get_utterance_in_progress(self) -> Optional[AudioPacket]:
+        """Audio of the utterance being spoken so far (with its head silences), None if there is none"""
+        if self._command_audio_packet is not None:
+            self._command_audio_packet.metadata["speech_timestamps"] = list(self._speech_timestamps)
+        return self._command_audio_packet
+
     def is_speaking(self, threshold=500) -> bool:
         return self._command_audio_packet is not None and self._command_audio_packet.duration >= threshold
 
@@ -0,0 +1,116 @@
+from typing import Union, List, Optional, Tuple
+from core import AudioPacket
+from .base import VoiceActivityDetector
+from .silero import SileroVAD
+from .webrtc import WebRTCVAD
+
+
+class WebRTCSileroVAD(VoiceActivityDetector):
+    """WebRTC VAD screening every frame, Silero confirming only the ambiguous ones
+
+    A frame none of whose webrtc frames is speech is silence, a frame all of
+    whose webrtc frames are speech is speech, anything in between is passed to
+    Silero. Silero's recurrent state only advances over the frames it sees.
+    """
+
+    def __init__(
+        self,
+        device: Optional[str] = None,
+        is_speech_threshold: float = 0.85,
+        tail_silence_threshold: int = 300,
+        frame_size: int = 512 * 4,
+        verbose: bool = False,
+        aggressiveness: int = 3,
+        webrtc_frame_size: int = 960,
+        silence_ratio: float = 0.0,
+        speech_ratio: float = 1.0,
+        backend: str = "torch",
+        model_path: Optional[str] = None,
+        intra_op_num_threads: int = 1,
+    ):
+        """Initialize cascade
+
+        Args:
+            device (str, optional): Device of the Silero torch backend. Defaults to None.
+            is_speech_threshold (float, optional): Silero speech probability threshold. Defaults to 0.85.
+            tail_silence_threshold (int, optional): Silence (ms) ending an utterance. Defaults to 300.
+            frame_size (int, optional): Frame size in bytes. Defaults to 512*4.
+            verbose (bool, optional): Whether to print debug messages. Defaults to False.
+            aggressiveness (int, optional): WebRTC aggressiveness, 0 to 3. Defaults to 3.
+            webrtc_frame_size (int, optional): Size in bytes of the webrtc frames, 320, 640 or 960. Defaults to 960.
+            silence_ratio (float, optional): Speech webrtc frame ratio at or below which a frame is silence. Defaults to 0.0.
+            speech_ratio (float, optional): Speech webrtc frame ratio at or above which a frame is speech,
+                above 1 to have Silero confirm every frame webrtc flags. Defaults to 1.0.
+            backend (str, optional): Silero backend, "torch" or "onnx". Defaults to "torch".
+            model_path (str, optional): Local Silero model file. Defaults to None.
+            intra_op_num_threads (int, optional): ONNX Runtime intra-op threads. Defaults to 1.
+        """
+        self.silence_ratio = silence_ratio
+        self.speech_ratio = speech_ratio
+        self.webrtc = WebRTCVAD(
+            aggressiveness=aggressiveness,
+            tail_silence_threshold=tail_silence_threshold,
+            frame_size=frame_size,
+            verbose=verbose,
+            webrtc_frame_size=webrtc_frame_size,
+        )
+        self.silero = SileroVAD(
+            device=device,
+            is_speech_threshold=is_speech_threshold,
+            tail_silence_threshold=tail_silence_threshold,
+            frame_size=frame_size,
+            verbose=verbose,
+            backend=backend,
+            model_path=model_path,
+            intra_op_num_threads=intra_op_num_threads,
+        )
+
+        self.num_frames = 0
+        self.num_confirmed = 0
+        super().__init__(tail_silence_threshold, frame_size, verbose)
+
+    @property
+    def confirmed_fraction(self) -> float:
+        """Fraction of frames that needed Silero"""
+        return self.num_confirmed / self.num_frames if self.num_frames else 0.0
+
+    def metrics(self) -> dict:
+        return {
+            "cascade_frames": self.num_frames,
+            "cascade_confirmed": self.num_confirmed,
+            "cascade_confirmed_fraction": self.confirmed_fraction,
+        }
+
+    def is_speech_with_probs(self, audio_packets: List[AudioPacket]) -> Tuple[List[bool], List[float]]:
+        """Decision and speech probability of each frame, from Silero for the ambiguous frames
+        and the fraction of speech webrtc frames for the others"""
+        speech_probs = self.webrtc.speech_ratios(audio_packets)
+        is_speeches = [ratio >= self.speech_ratio for ratio in speech_probs]
+        ambiguous = [i for i, ratio in enumerate(speech_probs) if self.silence_ratio < ratio < self.speech_ratio]
+        if ambiguous:
+            confirmed, confirmed_probs = self.silero.is_speech_with_probs([audio_packets[i] for i in ambiguous])
+            for i, is_speech, speech_prob in zip(ambiguous, confirmed, confirmed_probs):
+                is_speeches[i], speech_probs[i] = is_speech, speech_prob
+
+        self.num_frames += len(speech_probs)
+        self.num_confirmed += len(ambiguous)
+        return is_speeches, speech_probs
+
+    def is_speech(self, audio_packets: Union[List[AudioPacket], AudioPacket]) -> Union[bool, List[bool]]:
+        """Check if audio is speech
+
+        Args:
+            audio_packet (AudioPacket): Audio packet to check
+
+        Returns:
+            bool: True if speech, False otherwise
+        """
+        if not isinstance(audio_packets, list):
+            return self.is_speech_with_probs([audio_packets])[0][0]
+        return self.is_speech_with_probs(audio_packets)[0]
+
+    def reset(self) -> None:
+        super().reset()
+        # utterances are tracked by the cascade itself, only the model states are reset
+        self.webrtc.reset_stream()
+        self.silero.reset_stream()
@@ -1,8 +1,215 @@
-import torch
-from typing import Union, List, Optional
+import os
+import importlib.util
+import numpy as np
+from abc import ABCMeta, abstractmethod
+from threading import Lock
+from typing import Union, List, Optional, Tuple
 from core import AudioPacket, AudioBuffer
+from core.utils import ModelRegistry
 from .base import VoiceActivityDetector
 
+
+def get_packaged_model_path(filename: str) -> str:
+    """Path of a model file shipped with the silero-vad package (no hub checkout or download needed)"""
+    # NOTE: located without importing silero_vad, whose __init__ imports torch
+    spec = importlib.util.find_spec("silero_vad")
+    if spec is None or not spec.submodule_search_locations:
+        raise FileNotFoundError("silero-vad package not found, pass model_path explicitly")
+    return os.path.join(spec.submodule_search_locations[0], "data", filename)
+
+
+class SileroStreamState:
+    """Recurrent state of one audio stream evaluated by the Silero model"""
+
+    STATE_SIZE = 128
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self) -> None:
+        self.sample_rate: Optional[int] = None
+        self.state: Optional[np.ndarray] = None  # (2, 1, STATE_SIZE) LSTM hidden and cell states
+        self.context: Optional[np.ndarray] = None  # last samples of the previous window
+
+
+class SileroVADService(metaclass=ABCMeta):
+    """Silero model shared by all streams, evaluating their windows in batched forward passes
+
+    The model is recurrent, so the windows of one stream are evaluated in order,
+    one step each; every step batches the next window of all streams pending at
+    that time. Callers pending while a batch runs are served together by the
+    next batch (whichever caller gets to run it evaluates everyone's windows).
+    Backends only implement the forward pass, the state of every stream is kept
+    explicitly in its SileroStreamState.
+    """
+
+    def __init__(self):
+        self._pending = []
+        self._pending_lock = Lock()
+        self._run_lock = Lock()
+
+        self.num_batches = 0
+        self.num_forward_passes = 0
+        self.num_windows = 0
+
+    @abstractmethod
+    def _forward(self, x: np.ndarray, state: np.ndarray, sample_rate: int) -> Tuple[np.ndarray, np.ndarray]:
+        """Run one step of the model
+
+        Args:
+            x (np.array(float32)): (batch, context_size + window_size) windows preceded by their context
+            state (np.array(float32)): (2, batch, STATE_SIZE) recurrent state
+            sample_rate (int): 16000 or 8000
+
+        Returns:
+            Tuple[np.array(float32), np.array(float32)]: (batch,) speech probabilities, next state
+        """
+        raise NotImplementedError()
+
+    @staticmethod
+    def window_size(sample_rate: int) -> int:
+        """Number of samples per model window: 512 at 16 kHz, 256 at 8 kHz"""
+        return 512 if sample_rate == 16000 else 256
+
+    @staticmethod
+    def context_size(sample_rate: int) -> int:
+        """Number of samples of the previous window prepended to each window"""
+        return 64 if sample_rate == 16000 else 32
+
+    def speech_probs(self, stream: SileroStreamState, windows: np.ndarray, sample_rate: int) -> np.ndarray:
+        """Evaluate consecutive windows of a stream, advancing its state
+
+        Args:
+            stream (SileroStreamState): state of the stream the windows belong to
+            windows (np.array(float32)): (num_windows, window_size) consecutive windows
+            sample_rate (int): 16000 or 8000
+
+        Returns:
+            np.array(float32): speech probability of each window
+        """
+        request = _SileroRequest(stream, windows, sample_rate)
+        with self._pending_lock:
+            self._pending.append(request)
+
+        while request.probs is None and request.error is None:
+            with self._run_lock:
+                if request.probs is not None or request.error is not None:
+                    # served by the batch that just ran
+                    break
+                with self._pending_lock:
+                    batch, self._pending = self._pending, []
+                try:
+                    self._run_batch(batch)
+                except Exception as e:
+                    for batch_request in batch:
+                        batch_request.error = e
+
+        if request.error is not None:
+            raise request.error
+        return request.probs
+
+    def metrics(self) -> dict:
+        """Batching metrics since start"""
+        return {
+            "batches": self.num_batches,
+            "forward_passes": self.num_forward_passes,
+            "windows": self.num_windows,
+            "windows_per_forward": self.num_windows / self.num_forward_passes if self.num_forward_passes else 0.0,
+        }
+
+    def _run_batch(self, batch: List['_SileroRequest']) -> None:
+        self.num_batches += 1
+        for sample_rate in set(request.sample_rate for request in batch):
+            self._run_steps([request for request in batch if request.sample_rate == sample_rate], sample_rate)
+
+    def _run_steps(self, requests: List['_SileroRequest'], sample_rate: int) -> None:
+        context_size = self.context_size(sample_rate)
+        for request in requests:
+            stream = request.stream
+            if stream.sample_rate != sample_rate or stream.state is None:
+                stream.sample_rate = sample_rate
+                stream.state = np.zeros((2, 1, SileroStreamState.STATE_SIZE), dtype=np.float32)
+                stream.context = np.zeros(context_size, dtype=np.float32)
+            request.probs_buffer = np.empty(len(request.windows), dtype=np.float32)
+
+        for step in range(max(len(request.windows) for request in requests)):
+            active = [request for request in requests if step < len(request.windows)]
+            x = np.stack([np.concatenate([request.stream.context, request.windows[step]]) for request in active])
+            state = np.concatenate([request.stream.state for request in active], axis=1)
+
+            probs, state = self._forward(x, state, sample_rate)
+
+            for i, request in enumerate(active):
+                request.probs_buffer[step] = probs[i]
+                request.stream.state = state[:, i:i + 1]
+                request.stream.context = x[i, -context_size:]
+            self.num_forward_passes += 1
+            self.num_windows += len(active)
+
+        for request in requests:
+            request.probs, request.probs_buffer = request.probs_buffer, None
+
+
+class TorchSileroVADService(SileroVADService):
+    """Silero TorchScript model, from the silero-vad package"""
+
+    def __init__(self, device: str = "cpu", model_path: Optional[str] = None):
+        super().__init__()
+        import torch
+        self.device = device
+        self.model: "torch.nn.Module" = torch.jit.load(model_path or get_packaged_model_path("silero_vad.jit"))
+        self.model = self.model.eval()
+        self.model.to(self.device)
+
+    def _forward(self, x: np.ndarray, state: np.ndarray, sample_rate: int) -> Tuple[np.ndarray, np.ndarray]:
+        import torch
+        # the merged model keeps a single stream state, its per-rate submodules take it explicitly
+        model = self.model._model if sample_rate == 16000 else self.model._model_8k
+        with torch.inference_mode():
+            out, state = model(torch.from_numpy(x).to(self.device), torch.from_numpy(state).to(self.device))
+        return out[:, 0].float().cpu().numpy(), state.float().cpu().numpy()
+
+
+class OnnxSileroVADService(SileroVADService):
+    """Silero ONNX model run with ONNX Runtime on CPU, without torch"""
+
+    def __init__(self, model_path: Optional[str] = None, intra_op_num_threads: int = 1):
+        """Initialize ONNX Runtime session
+
+        Args:
+            model_path (str, optional): Local .onnx model file. Defaults to the one shipped with silero-vad.
+            intra_op_num_threads (int, optional): Threads used within an operator. Defaults to 1.
+        """
+        super().__init__()
+        import onnxruntime
+        options = onnxruntime.SessionOptions()
+        options.inter_op_num_threads = 1
+        options.intra_op_num_threads = intra_op_num_threads
+        self.session = onnxruntime.InferenceSession(
+            model_path or get_packaged_model_path("silero_vad.onnx"),
+            sess_options=options,
+            providers=["CPUExecutionProvider"],
+        )
+
+    def _forward(self, x: np.ndarray, state: np.ndarray, sample_rate: int) -> Tuple[np.ndarray, np.ndarray]:
+        out, state = self.session.run(
+            None, {"input": x, "state": state, "sr": np.array(sample_rate, dtype=np.int64)}
+        )
+        return out[:, 0], state
+
+
+class _SileroRequest:
+    __slots__ = ("stream", "windows", "sample_rate", "probs_buffer", "probs", "error")
+
+    def __init__(self, stream: SileroStreamState, windows: np.ndarray, sample_rate: int):
+        self.stream = stream
+        self.windows = windows
+        self.sample_rate = sample_rate
+        self.probs_buffer: Optional[np.ndarray] = None
+        self.probs: Optional[np.ndarray] = None
+        self.error: Optional[Exception] = None
+
+
 class SileroVAD(VoiceActivityDetector):
     def __init__(
         self,
@@ -11,72 +218,121 @@ class SileroVAD(VoiceActivityDetector):
         tail_silence_threshold: int = 300,
         frame_size: int = 512 * 4,
         verbose: bool = False,
+        backend: str = "torch",
+        model_path: Optional[str] = None,
+        intra_op_num_threads: int = 1,
     ):
+        """Initialize Silero VAD
+
+        Args:
+            device (str, optional): Device of the torch backend. Defaults to None (cuda if available).
+            is_speech_threshold (float, optional): Speech probability threshold. Defaults to 0.85.
+            tail_silence_threshold (int, optional): Silence (ms) ending an utterance. Defaults to 300.
+            frame_size (int, optional): Frame size in bytes. Defaults to 512*4.
+            verbose (bool, optional): Whether to print debug messages. Defaults to False.
+            backend (str, optional): "torch" (TorchScript) or "onnx" (ONNX Runtime, CPU). Defaults to "torch".
+            model_path (str, optional): Local model file. Defaults to the one shipped with silero-vad.
+            intra_op_num_threads (int, optional): ONNX Runtime intra-op threads. Defaults to 1.
+        """
         if frame_size < 512 * 4:
             raise ValueError("Frame size must be at least 512*4 with Silero VAD")
 
-        self.device = device
-        if self.device is None:
-            self.device = "cuda:0" if torch.cuda.is_available() else "cpu"
-        elif device.startswith('cuda'):
-            self.device = "cuda:0"
-        else:
-            # because others are not guaranteed to work
-            self.device = "cpu"
-
         self.is_speech_threshold = is_speech_threshold
-        self.model, utils = torch.hub.load(
-            repo_or_dir="snakers4/silero-vad",
-            model="silero_vad",
-            force_reload=False,
-            onnx=False,
-        )
-        self.model: torch.nn.Module = self.model.eval()
-        self.model.to(self.device)
+        # the model is shared by every stream of the process, only the recurrent state is per stream
+        self.service, self.device = self.load_service(backend, device, model_path, intra_op_num_threads)
+        self._stream = SileroStreamState()
 
-        # (get_speech_timestamps,
-        # save_audio,
-        # read_audio,
-        # VADIterator,
-        # collect_chunks) = utils
-        # vad_iterator = VADIterator(model)
         super().__init__(tail_silence_threshold, frame_size, verbose)
 
-    def is_speech(self, audio_packets: Union[List[AudioPacket], AudioPacket]) -> Union[bool, List[bool]]:
-        """Check if audio is speech
+    @staticmethod
+    def load_service(
+        backend: str = "torch",
+        device: Optional[str] = None,
+        model_path: Optional[str] = None,
+        intra_op_num_threads: int = 1,
+    ) -> Tuple[SileroVADService, str]:
+        """Shared Silero service of the process, loaded on the first call
 
         Args:
-            audio_packet (AudioPacket): Audio packet to check
+            backend (str, optional): "torch" (TorchScript) or "onnx" (ONNX Runtime, CPU). Defaults to "torch".
+            device (str, optional): Device of the torch backend. Defaults to None (cuda if available).
+            model_path (str, optional): Local model file. Defaults to the one shipped with silero-vad.
+            intra_op_num_threads (int, optional): ONNX Runtime intra-op threads. Defaults to 1.
 
         Returns:
-            bool: True if speech, False otherwise
+            Tuple[SileroVADService, str]: the service and the device it runs on
         """
-        one_item = False
-        if not isinstance(audio_packets, list):
-            audio_packets = [audio_packets]
-            one_item = True
+        if backend == "torch":
+            import torch
+            if device is None:
+                device = "cuda:0" if torch.cuda.is_available() else "cpu"
+            elif device.startswith('cuda'):
+                device = "cuda:0"
+            else:
+                # because others are not guaranteed to work
+                device = "cpu"
+            service = ModelRegistry.get(
+                ("silero_vad", "torch", device, model_path),
+                lambda: TorchSileroVADService(device, model_path),
+            )
+            return service, device
+        elif backend == "onnx":
+            service = ModelRegistry.get(
+                ("silero_vad", "onnx", model_path, intra_op_num_threads),
+                lambda: OnnxSileroVADService(model_path, intra_op_num_threads),
+            )
+            return service, "cpu"
+        raise ValueError(f"Unknown Silero backend {backend}, available backends: torch, onnx")
+
+    def _split_frames(self, audio_packets: List[AudioPacket]) -> List[AudioPacket]:
+        """Re-frame packets into complete frames of frame_size, dropping a trailing partial frame"""
+        if all(len(audio_packet) == self.frame_size for audio_packet in audio_packets):
+            return audio_packets
 
         audio_buffer = AudioBuffer(self.frame_size)
         for audio_packet in audio_packets:
             audio_buffer.put(audio_packet)
+        # partial TODO maybe add to buffer
+        return audio_buffer.get_frames_nowait()
 
-        is_speeches = []
-        for packet in audio_buffer:
-            if len(packet) < self.frame_size:
-                # partial TODO maybe add to buffer
-                break
-            _audio_tensor = torch.from_numpy(packet.float).to(self.device)
-            is_speeches.append(
-                self.model(_audio_tensor, packet.sample_rate) > self.is_speech_threshold
-            )
+    def is_speech_with_probs(self, audio_packets: List[AudioPacket]) -> Tuple[List[bool], List[float]]:
+        """Decision and speech probability of each frame
+
+        All frames are evaluated in one (batched) call to the shared model, a
+        frame is speech if any of its windows is.
+        """
+        frames = self._split_frames(audio_packets)
+        if not frames:
+            return [], []
+
+        sample_rate = frames[0].sample_rate
+        window_size = SileroVADService.window_size(sample_rate)
+        windows_per_frame = len(frames[0].float) // window_size
+        windows = np.concatenate([
+            frame.float[:windows_per_frame * window_size] for frame in frames
+        ]).reshape((-1, window_size))
+
+        speech_probs = self.service.speech_probs(self._stream, windows, sample_rate)
+        speech_probs = speech_probs.reshape((len(frames), windows_per_frame)).max(axis=1).tolist()
+        return [speech_prob > self.is_speech_threshold for speech_prob in speech_probs], speech_probs
 
-        # if any([not is_speech for is_speech in is_speeches]):
-        #     self.model.reset_states()
+    def is_speech(self, audio_packets: Union[List[AudioPacket], AudioPacket]) -> Union[bool, List[bool]]:
+        """Check if audio is speech
+
+        Args:
+            audio_packet (AudioPacket): Audio packet to check
+
+        Returns:
+            bool: True if speech, False otherwise
+        """
+        if not isinstance(audio_packets, list):
+            return self.is_speech_with_probs([audio_packets])[0][0]
+        return self.is_speech_with_probs(audio_packets)[0]
 
-        if one_item:
-            return is_speeches[0]
-        return is_speeches
+    def reset_stream(self) -> None:
+        """Reset the recurrent state of the stream, not the utterance"""
+        self._stream.reset()
 
     def reset(self) -> None:
         super().reset()
-        self.model.reset_states()
+        self.reset_stream()
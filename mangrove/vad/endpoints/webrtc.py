@@ -1,22 +1,87 @@
 import webrtcvad
-from typing import Union, List
+from typing import Optional, Union, List, Tuple
 from core import AudioPacket
 from .base import VoiceActivityDetector
 
 class WebRTCVAD(VoiceActivityDetector):
+    SAMPLE_RATES = (8000, 16000, 32000, 48000)
 
     def __init__(
         self,
         aggressiveness: int = 3,
-        silence_threshold: int = 200,
+        tail_silence_threshold: int = 200,
         frame_size: int = 320 * 3,
         verbose=False,
+        webrtc_frame_size: Optional[int] = None,
+        speech_ratio: float = 0.5,
     ):
-        if frame_size not in [320, 640, 960]:
-            raise ValueError("Frame size must be 320, 640 or 960 with WebRTC VAD")
+        """Initialize WebRTC VAD
+
+        WebRTC VAD only accepts 10, 20 or 30 ms frames (320, 640 or 960 bytes at
+        16 kHz), so frames of any other size are re-framed internally: each frame
+        is split into webrtc frames, the samples left over are carried into the
+        next frame, and the frame is speech if enough of its webrtc frames are. A
+        frame (e.g. a partial one) too short for any webrtc frame is carried whole
+        and keeps the ratio of the previous frame.
+
+        Args:
+            aggressiveness (int, optional): Filtering aggressiveness of non-speech, 0 to 3. Defaults to 3.
+            tail_silence_threshold (int, optional): Silence (ms) ending an utterance. Defaults to 200.
+            frame_size (int, optional): Frame size in bytes of the fed frames. Defaults to 320*3.
+            verbose (bool, optional): Whether to print debug messages. Defaults to False.
+            webrtc_frame_size (int, optional): Size in bytes (at 16 kHz) of the frames passed to webrtc,
+                320, 640 or 960. Defaults to frame_size if valid, 960 otherwise.
+            speech_ratio (float, optional): Fraction of speech webrtc frames making a frame speech. Defaults to 0.5.
+        """
+        if webrtc_frame_size is None:
+            webrtc_frame_size = frame_size if frame_size in [320, 640, 960] else 960
+        if webrtc_frame_size not in [320, 640, 960]:
+            raise ValueError("WebRTC frame size must be 320, 640 or 960")
+        if frame_size < webrtc_frame_size:
+            raise ValueError(f"Frame size must be at least {webrtc_frame_size} with WebRTC VAD")
+
         self.aggressiveness = aggressiveness
+        self.webrtc_frame_duration = webrtc_frame_size // 32  # ms, 16 bits at 16 kHz
+        self.speech_ratio = speech_ratio
         self.model = webrtcvad.Vad(aggressiveness)
-        super().__init__(silence_threshold, frame_size, verbose)
+        self._remainder = b""
+        self._last_ratio = 0.0
+        super().__init__(tail_silence_threshold, frame_size, verbose)
+
+    def speech_ratios(self, audio_packets: List[AudioPacket]) -> List[float]:
+        """Fraction of speech webrtc frames within each frame
+
+        Args:
+            audio_packets (List[AudioPacket]): consecutive frames of the stream
+
+        Returns:
+            List[float]: ratio per frame
+        """
+        ratios = []
+        for packet in audio_packets:
+            sample_rate = packet.sample_rate
+            if sample_rate not in self.SAMPLE_RATES:
+                raise ValueError(f"WebRTC VAD handles {self.SAMPLE_RATES} Hz audio, not {sample_rate} Hz")
+            webrtc_frame_size = sample_rate * self.webrtc_frame_duration // 1000 * packet.sample_width * packet.num_channels
+            audio_bytes = self._remainder + packet.bytes
+            num_webrtc_frames = len(audio_bytes) // webrtc_frame_size
+            self._remainder = audio_bytes[num_webrtc_frames * webrtc_frame_size:]
+            if num_webrtc_frames == 0:
+                ratios.append(self._last_ratio)
+                continue
+
+            num_speech = sum(
+                self.model.is_speech(audio_bytes[i * webrtc_frame_size:(i + 1) * webrtc_frame_size], sample_rate)
+                for i in range(num_webrtc_frames)
+            )
+            self._last_ratio = num_speech / num_webrtc_frames
+            ratios.append(self._last_ratio)
+        return ratios
+
+    def is_speech_with_probs(self, audio_packets: List[AudioPacket]) -> Tuple[List[bool], List[float]]:
+        """Decision of each frame, with the fraction of its webrtc frames that are speech as probability"""
+        ratios = self.speech_ratios(audio_packets)
+        return [ratio >= self.speech_ratio for ratio in ratios], ratios
 
     def is_speech(self, audio_packets: Union[List[AudioPacket], AudioPacket]) -> Union[bool, List[bool]]:
         """Check if audio is speech
@@ -32,13 +97,7 @@ class WebRTCVAD(VoiceActivityDetector):
             audio_packets = [audio_packets]
             one_item = True
 
-        is_speeches = []
-        for packet in audio_packets:
-            if len(packet) < self.frame_size:
-                # partial TODO maybe add to buffer
-                break
-            audio_bytes, sample_rate = packet.bytes, packet.sample_rate
-            is_speeches.append(self.model.is_speech(audio_bytes, sample_rate))
+        is_speeches, _ = self.is_speech_with_probs(audio_packets)
 
         # if any([not is_speech for is_speech in is_speeches]):
         #     self.model = webrtcvad.Vad(self.aggressiveness)
@@ -47,6 +106,12 @@ class WebRTCVAD(VoiceActivityDetector):
             return is_speeches[0]
         return is_speeches
 
+    def reset_stream(self) -> None:
+        """Reset the model and the carried samples, not the utterance"""
+        self.model = webrtcvad.Vad(self.aggressiveness)
+        self._remainder = b""
+        self._last_ratio = 0.0
+
     def reset(self) -> None:
         super().reset()
-        self.model = webrtcvad.Vad(self.aggressiveness)
\ No newline at end of file
+        self.reset_stream()
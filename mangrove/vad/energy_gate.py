@@ -0,0 +1,113 @@
+import numpy as np
+from typing import List, Tuple
+from core import AudioPacket
+
+
+class EnergyGate:
+    """Cheap RMS/zero-crossing pre-gate labelling clearly silent frames
+
+    A frame is clearly silent if its level is below `silence_db`, or if it is
+    within `margin_db` of the adaptive noise floor and its zero-crossing rate is
+    close to the one of the background noise (quiet unvoiced speech such as
+    fricatives crosses zero at a different rate than room noise, so it still
+    goes to the model). The noise floor and noise zero-crossing rate follow the
+    frames finally judged non-speech: quickly when the room gets quieter, slowly
+    when it gets louder, and never above `max_floor_db`.
+    """
+
+    def __init__(
+        self,
+        margin_db: float = 6.0,
+        silence_db: float = -60.0,
+        max_floor_db: float = -40.0,
+        zcr_tolerance: float = 0.1,
+        rise_rate: float = 0.05,
+        fall_rate: float = 0.5,
+        warmup_frames: int = 8,
+    ):
+        """Initialize energy gate
+
+        Args:
+            margin_db (float, optional): Margin above the noise floor still gated as silence. Defaults to 6.0.
+            silence_db (float, optional): Level (dBFS) below which frames are always silent. Defaults to -60.0.
+            max_floor_db (float, optional): Highest noise floor (dBFS) the gate adapts to. Defaults to -40.0.
+            zcr_tolerance (float, optional): Maximum zero-crossing rate deviation from the noise one. Defaults to 0.1.
+            rise_rate (float, optional): Adaptation rate of the floor towards louder noise. Defaults to 0.05.
+            fall_rate (float, optional): Adaptation rate of the floor towards quieter noise. Defaults to 0.5.
+            warmup_frames (int, optional): Non-speech frames to observe before gating relative to the floor. Defaults to 8.
+        """
+        self.margin_db = margin_db
+        self.silence_db = silence_db
+        self.max_floor_db = max_floor_db
+        self.zcr_tolerance = zcr_tolerance
+        self.rise_rate = rise_rate
+        self.fall_rate = fall_rate
+        self.warmup_frames = warmup_frames
+
+        self.num_frames = 0
+        self.num_skipped = 0
+        self.reset()
+
+    def reset(self) -> None:
+        """Forget the noise floor (e.g. on a new stream), metrics are kept"""
+        self.noise_floor_db = None
+        self.noise_zcr = None
+        self._num_noise_frames = 0
+
+    @property
+    def skipped_fraction(self) -> float:
+        """Fraction of frames labelled silent without calling the model"""
+        return self.num_skipped / self.num_frames if self.num_frames else 0.0
+
+    def metrics(self) -> dict:
+        return {
+            "frames": self.num_frames,
+            "skipped": self.num_skipped,
+            "skipped_fraction": self.skipped_fraction,
+            "noise_floor_db": self.noise_floor_db,
+        }
+
+    @staticmethod
+    def features(audio_packets: List[AudioPacket]) -> Tuple[np.ndarray, np.ndarray]:
+        """Level (dBFS) and zero-crossing rate of each frame
+
+        Args:
+            audio_packets (List[AudioPacket]): frames of equal size
+
+        Returns:
+            Tuple[np.array(float), np.array(float)]: rms in dBFS and zero-crossing rate per frame
+        """
+        frames = np.stack([audio_packet.int16 for audio_packet in audio_packets]).astype(np.float32)
+        rms = np.sqrt(np.mean(np.square(frames), axis=1)) / 32768
+        rms_db = 20 * np.log10(rms + 1e-10)
+        zcr = np.mean(np.signbit(frames[:, 1:]) != np.signbit(frames[:, :-1]), axis=1)
+        return rms_db, zcr
+
+    def is_silent(self, rms_db: np.ndarray, zcr: np.ndarray) -> np.ndarray:
+        """Mask of the frames that are clearly silent"""
+        silent = rms_db < self.silence_db
+        if self._num_noise_frames >= self.warmup_frames:
+            silent |= (rms_db < self.noise_floor_db + self.margin_db) & (np.abs(zcr - self.noise_zcr) <= self.zcr_tolerance)
+        return silent
+
+    def update(self, rms_db: np.ndarray, zcr: np.ndarray, is_speech: np.ndarray, num_skipped: int) -> None:
+        """Adapt the noise estimate to the frames judged non-speech and count skipped frames
+
+        Args:
+            rms_db (np.array(float)): level of each frame
+            zcr (np.array(float)): zero-crossing rate of each frame
+            is_speech (np.array(bool)): final decision of each frame (gate or model)
+            num_skipped (int): number of those frames labelled by the gate alone
+        """
+        self.num_frames += len(rms_db)
+        self.num_skipped += num_skipped
+
+        for level, crossings in zip(rms_db[~is_speech].tolist(), zcr[~is_speech].tolist()):
+            if self.noise_floor_db is None:
+                self.noise_floor_db, self.noise_zcr = level, crossings
+            else:
+                rate = self.fall_rate if level < self.noise_floor_db else self.rise_rate
+                self.noise_floor_db += rate * (level - self.noise_floor_db)
+                self.noise_zcr += rate * (crossings - self.noise_zcr)
+            self.noise_floor_db = min(self.noise_floor_db, self.max_floor_db)
+            self._num_noise_frames += 1
@@ -1,10 +1,13 @@
-import torch
-from typing import Optional
+import numpy as np
+from typing import Iterator, List, Optional, Tuple
 from loguru import logger
 
 from core.stage import AudioToAudioStage
 from core import AudioPacket
-from .endpoints.silero import SileroVAD
+from .endpoints.base import VoiceActivityDetector
+from .energy_gate import EnergyGate
+from .endpointer import AdaptiveEndpointer
+from .compaction import UtteranceCompactor
 
 
 class VADStage(AudioToAudioStage):
@@ -16,30 +19,134 @@ class VADStage(AudioToAudioStage):
         frame_size=512 * 4,
         device=None,
         verbose=False,
+        endpoint="silero",
+        endpoint_kwargs={},
+        energy_gate=True,
+        energy_gate_kwargs={},
+        adaptive_endpointing=False,
+        endpointer_kwargs={},
+        stream_interval_ms=None,
+        compaction=False,
+        compaction_kwargs={},
     ):
-        super().__init__(frame_size=frame_size, verbose=verbose)
+        """Initialize VAD Stage
 
-        if device is None:
-            device = "cuda" if torch.cuda.is_available() else "cpu"
+        Args:
+            interrupt_threshold (int, optional): Speech (ms) after which the running response is interrupted. Defaults to 2000.
+            is_speech_threshold (float, optional): Silero speech probability threshold. Defaults to 0.85.
+            tail_silence_threshold (int, optional): Silence (ms) ending an utterance. Defaults to 500.
+            frame_size (int, optional): audio frame size. Defaults to 512*4.
+            device (str, optional): Device to use. Defaults to None.
+            verbose (bool, optional): Whether to print debug messages. Defaults to False.
+            endpoint (str, optional): VAD endpoint, "silero", "webrtc" (frames re-framed to webrtc sizes, lowest CPU)
+                or "webrtc_silero" (webrtc screening, silero confirming ambiguous frames). Defaults to "silero".
+            endpoint_kwargs (dict, optional): Extra arguments of the VAD endpoint. Defaults to {}.
+            energy_gate (bool, optional): Whether clearly silent frames skip the VAD model. Defaults to True.
+            energy_gate_kwargs (dict, optional): Arguments of the EnergyGate. Defaults to {}.
+            adaptive_endpointing (bool, optional): Whether the tail silence ending an utterance adapts to the
+                utterance and the speaker, starting from tail_silence_threshold. Defaults to False.
+            endpointer_kwargs (dict, optional): Arguments of the AdaptiveEndpointer. Defaults to {}.
+            stream_interval_ms (int, optional): If set, the utterance being spoken is forwarded in partial chunks
+                of at least this duration (for streaming STT), the end of the utterance following as a final
+                chunk. Defaults to None (whole utterances only).
+            compaction (bool, optional): Whether the silence around the speech of an utterance and its long pauses
+                are cut before it is forwarded; streamed utterances are left as is. Defaults to False.
+            compaction_kwargs (dict, optional): Arguments of the UtteranceCompactor. Defaults to {}.
+        """
+        super().__init__(frame_size=frame_size, verbose=verbose, batch_processing=True)
 
-        self._endpoint = SileroVAD(
-            is_speech_threshold=is_speech_threshold,
-            tail_silence_threshold=tail_silence_threshold,
-            frame_size=frame_size,
-            device=device,
-            verbose=verbose,
-        )
+        self._endpoint: VoiceActivityDetector
+        if endpoint == "silero":
+            from .endpoints.silero import SileroVAD
+            self._endpoint = SileroVAD(
+                is_speech_threshold=is_speech_threshold,
+                tail_silence_threshold=tail_silence_threshold,
+                frame_size=frame_size,
+                device=device,
+                verbose=verbose,
+                **endpoint_kwargs,
+            )
+        elif endpoint == "webrtc":
+            logger.info("Using WebRTC VAD Endpoint")
+            from .endpoints.webrtc import WebRTCVAD
+            self._endpoint = WebRTCVAD(
+                tail_silence_threshold=tail_silence_threshold,
+                frame_size=frame_size,
+                verbose=verbose,
+                **endpoint_kwargs,
+            )
+        elif endpoint == "webrtc_silero":
+            logger.info("Using WebRTC VAD Endpoint confirmed by Silero VAD")
+            from .endpoints.cascade import WebRTCSileroVAD
+            self._endpoint = WebRTCSileroVAD(
+                is_speech_threshold=is_speech_threshold,
+                tail_silence_threshold=tail_silence_threshold,
+                frame_size=frame_size,
+                device=device,
+                verbose=verbose,
+                **endpoint_kwargs,
+            )
+        else:
+            raise ValueError(f"Unknown Endpoint {endpoint}, available endpoints: silero, webrtc, webrtc_silero")
+
+        if adaptive_endpointing:
+            self._endpoint.endpointer = AdaptiveEndpointer(tail_silence_threshold, **endpointer_kwargs)
 
         self._interrupt_threshold = interrupt_threshold
+        self._stream_interval = stream_interval_ms
+        self._streamed_length = 0  # bytes of the current utterance already forwarded
+        self._energy_gate: Optional[EnergyGate] = EnergyGate(**energy_gate_kwargs) if energy_gate else None
+        self._compactor: Optional[UtteranceCompactor] = UtteranceCompactor(**compaction_kwargs) if compaction else None
+
+    def _is_speech(self, audio_packets: List[AudioPacket]) -> Tuple[List[bool], List[float]]:
+        """Speech decision and probability of each frame, the model only sees frames the energy gate lets through"""
+        if self._energy_gate is None:
+            return self._endpoint.is_speech_with_probs(audio_packets)
+
+        rms_db, zcr = self._energy_gate.features(audio_packets)
+        is_silent = self._energy_gate.is_silent(rms_db, zcr)
+        is_speeches = np.zeros(len(audio_packets), dtype=bool)
+        speech_probs = np.zeros(len(audio_packets), dtype=np.float32)
+        indices = np.flatnonzero(~is_silent)
+        if len(indices) > 0:
+            is_speeches[indices], speech_probs[indices] = self._endpoint.is_speech_with_probs(
+                [audio_packets[i] for i in indices]
+            )
+        self._energy_gate.update(rms_db, zcr, is_speeches, num_skipped=int(is_silent.sum()))
+        return is_speeches.tolist(), speech_probs.tolist()
+
+    def _process_batch(self, audio_packets: List[AudioPacket]) -> Iterator[Optional[AudioPacket]]:
+        if not audio_packets:
+            return
+
+        # one VAD call for every pending frame, the endpointing below stays per frame
+        # NOTE: gated frames are still fed (as silence), so head silences and tail silence timing are kept
+        is_speeches, speech_probs = self._is_speech(audio_packets)
+        for audio_packet, is_speech, speech_prob in zip(audio_packets, is_speeches, speech_probs):
+            yield self._process(audio_packet, is_speech=is_speech, speech_prob=speech_prob)
 
-    def _process(self, audio_packet: AudioPacket) -> Optional[AudioPacket]:
+    def metrics(self) -> dict:
+        """Energy gate metrics, `skipped_fraction` is the share of frames that did not reach the model,
+        with those of the endpoint (e.g. frames the cascade confirmed with Silero), of the endpointer and of the compactor"""
+        metrics = self._energy_gate.metrics() if self._energy_gate is not None else {}
+        if hasattr(self._endpoint, "metrics"):
+            metrics.update(self._endpoint.metrics())
+        if self._endpoint.endpointer is not None:
+            metrics.update(self._endpoint.endpointer.metrics())
+        if self._compactor is not None:
+            metrics.update(self._compactor.metrics())
+        return metrics
+
+    def _process(
+        self, audio_packet: AudioPacket, is_speech: Optional[bool] = None, speech_prob: Optional[float] = None
+    ) -> Optional[AudioPacket]:
         if audio_packet is None:
             return
 
         if len(audio_packet) < self.frame_size:
             raise Exception("Partial audio packet found; this should not happen")
         
-        self._endpoint.feed(audio_packet)
+        self._endpoint.feed(audio_packet, is_speech=is_speech, speech_prob=speech_prob)
 
         if self._endpoint.is_speaking(threshold=self._interrupt_threshold):
             self.schedule_forward_interrupt()
@@ -47,10 +154,26 @@ class VADStage(AudioToAudioStage):
         audio_packet_utterance = self._endpoint.get_utterance_if_any() 
         if audio_packet_utterance:
             # self.refresh()
+            if self._streamed_length > 0:
+                # only the part not streamed yet
+                audio_packet_utterance = audio_packet_utterance[self._streamed_length:]
+                self._streamed_length = 0
+            elif self._compactor is not None:
+                audio_packet_utterance = self._compactor.compact(audio_packet_utterance)
             return audio_packet_utterance
 
+        if self._stream_interval is not None:
+            audio_packet_utterance = self._endpoint.get_utterance_in_progress()
+            if audio_packet_utterance is not None:
+                chunk = audio_packet_utterance[self._streamed_length:]
+                if chunk.duration >= self._stream_interval:
+                    chunk.partial = True
+                    self._streamed_length = len(audio_packet_utterance)
+                    return chunk
+
     def reset_audio_stream(self) -> None:
         """Reset audio stream context"""
+        self._streamed_length = 0
         self._endpoint.reset()
 
     # TODO use after some detection
@@ -59,4 +182,9 @@ class VADStage(AudioToAudioStage):
         self.reset_audio_stream()
 
     def on_disconnect(self) -> None:
+        if self._energy_gate is not None:
+            logger.info(f"VAD energy gate skipped {100 * self._energy_gate.skipped_fraction:.1f}% of frames: {self.metrics()}")
+            self._energy_gate.reset()
+        elif hasattr(self._endpoint, "metrics") or self._endpoint.endpointer is not None or self._compactor is not None:
+            logger.info(f"VAD metrics: {self.metrics()}")
         self.reset_audio_stream()
@@ -1,7 +1,7 @@
 import sys
 import os, argparse
-from typing import Union, Iterator, Optional
-from flask import Flask
+from typing import Dict, Union, Iterator, Optional
+from flask import Flask, request
 from loguru import logger
 from flask_socketio import SocketIO, Namespace
 from dotenv import load_dotenv
@@ -9,15 +9,57 @@ from dotenv import load_dotenv
 from agents import BasicConversationalAgent
 from storage_manager import StorageManager, write_output
 from multiprocessing import Lock
-from core import AudioPacket, TextPacket, DataPacket
+from core import AudioPacket, TextPacket, DataPacket, StreamResampler
+from core.utils import ModelRegistry
+from core.data.wire_format import WireFormatError, negotiate_wire_format, unpack_audio_frame
 
 load_dotenv(override=True)
 
 # TODO create feedback loop (ACK), and use it for interruption!! 
 # TODO refactor/encapsualte server and make it part of the agents instead
 
+class ClientSession:
+    """Host of the pipeline of one connected client
+
+    Stages only talk to their host, so every emit goes to this session's client alone;
+    everything else is delegated to the DigitalAssistant serving it.
+    """
+
+    def __init__(self, assistant: 'DigitalAssistant', sid: str, agent: BasicConversationalAgent):
+        self.assistant = assistant
+        self.sid = sid
+        self.agent = agent
+        self.lock = Lock()
+        self.stream_resampler = StreamResampler()
+
+    def sleep(self, seconds) -> None:
+        self.assistant.sleep(seconds)
+
+    def create_event(self):
+        return self.assistant.create_event()
+
+    def start_background_task(self, target, *args, **kwargs):
+        return self.assistant.start_background_task(target, *args, **kwargs)
+
+    def emit_bot_voice(self, audio_packet: AudioPacket) -> None:
+        self.assistant.__emit__("bot_voice", audio_packet, to=self.sid)
+
+    def emit_bot_response(self, text_packet: TextPacket) -> None:
+        self.assistant.__emit__("bot_response", text_packet, to=self.sid)
+
+    def emit_stt_response(self, text_packet: TextPacket) -> None:
+        self.assistant.__emit__("stt_response", text_packet, to=self.sid)
+
+    def emit_interrupt(self, timestamp: int) -> None:
+        self.assistant.server.emit("interrupt", timestamp, namespace=self.assistant.namespace, to=self.sid)
+
+
 class DigitalAssistant(Namespace):
-    """Digital Assistant SocketIO Namespace"""
+    """Digital Assistant SocketIO Namespace
+
+    Every connected client (sid) gets its own pipeline, heavy models are loaded
+    once per process and shared through the ModelRegistry.
+    """
 
     def __init__(
         self,
@@ -28,28 +70,35 @@ class DigitalAssistant(Namespace):
         self.server: Optional[SocketIO]
         self.namespace = namespace
 
-        self.agent = BasicConversationalAgent(
-            **agent_kwargs
-        )
+        self.agent_kwargs = agent_kwargs
+        self.sessions: Dict[str, ClientSession] = {}
         self.lock = Lock()
         logger.info("Server is about to be Up and Running..")
 
     def setup(self) -> None:
         if self.server is None:
             raise RuntimeError("Server is not initialized yet")
-        self.agent.start(self)
+        # load the shared models upfront instead of on the first connection
+        BasicConversationalAgent.preload_models(**self.agent_kwargs)
+        logger.info(f"Shared models loaded: {ModelRegistry.keys()}")
 
     def sleep(self, seconds) -> None:
         if self.server is None:
             raise RuntimeError("Server is not initialized yet")
         self.server.sleep(seconds)
 
+    def create_event(self):
+        """Create an event object matching the server's async model (threads, eventlet or gevent)"""
+        if self.server is None:
+            raise RuntimeError("Server is not initialized yet")
+        return self.server.eio.create_event()
+
     def start_background_task(self, target, *args, **kwargs): # TODO find convenient generic type hinting
         if self.server is None:
             raise RuntimeError("Server is not initialized yet")
         return self.server.start_background_task(target, *args, **kwargs)
 
-    def __emit__(self, event, data: Union[Iterator[DataPacket], DataPacket]) -> None:
+    def __emit__(self, event, data: Union[Iterator[DataPacket], DataPacket], to: Optional[str] = None) -> None:
         if hasattr(data, "__next__"):
             # if data is generator
             logger.trace(f"Emitting generator {event}")
@@ -57,42 +106,57 @@ class DigitalAssistant(Namespace):
                 write_output(">", end="")
                 if hasattr(d, "to_dict"):
                     d = d.to_dict()
-                self.server.emit(event, d)
+                self.server.emit(event, d, namespace=self.namespace, to=to)
         else:
             logger.trace(f"Emitting {event}")
             if hasattr(data, "to_dict"):
                 data = data.to_dict()
-            self.server.emit(event, data)
-
-    def emit_bot_voice(self, audio_packet: AudioPacket) -> None:
-        self.__emit__("bot_voice", audio_packet)
-
-    def emit_bot_response(self, text_packet: TextPacket) -> None:
-        self.__emit__("bot_response", text_packet)
-
-    def emit_stt_response(self, text_packet: TextPacket) -> None:
-        self.__emit__("stt_response", text_packet)
-
-    def emit_interrupt(self, timestamp: int) -> None:
-        self.server.emit("interrupt", timestamp) 
+            self.server.emit(event, data, namespace=self.namespace, to=to)
 
     def on_connect(self):
-        logger.info("client connected")
+        sid = request.sid
+        logger.info(f"client {sid} connected")
         StorageManager.establish_session()
-        self.agent.on_connect()
+        session = ClientSession(self, sid, BasicConversationalAgent(**self.agent_kwargs))
+        with self.lock:
+            self.sessions[sid] = session
+        session.agent.start(session)
+        session.agent.on_connect()
 
     def on_disconnect(self):
-        logger.info("client disconnected\n")
+        sid = request.sid
+        logger.info(f"client {sid} disconnected\n")
         with self.lock:
-            self.agent.on_disconnect()
+            session = self.sessions.pop(sid, None)
+        if session is None:
+            return
+        with session.lock:
+            session.agent.stop()
+            session.agent.on_disconnect()
         StorageManager.clean_up()
 
+    def on_audio_format(self, data):
+        """Negotiate the `stream_audio` wire format, the chosen one is returned as ack"""
+        wire_format = negotiate_wire_format(data.get("formats") if isinstance(data, dict) else None)
+        logger.info(f"Client {request.sid} audio wire format: {wire_format}")
+        return {"format": wire_format}
+
     def on_stream_audio(self, audio_data):
-        with self.lock:
+        session = self.sessions.get(request.sid)
+        if session is None:
+            logger.warning(f"Dropping audio of unknown client {request.sid}")
+            return
+
+        with session.lock:
             # Feeding in audio stream
             write_output("-", end="")
-            from core import AudioPacket
-            self.agent.feed(AudioPacket(audio_data))
+            if isinstance(audio_data, (bytes, bytearray)):
+                try:
+                    audio_data = unpack_audio_frame(audio_data)
+                except WireFormatError as e:
+                    logger.error(f"Dropping audio frame: {e}")
+                    return
+            session.agent.feed(AudioPacket(audio_data, resampler=session.stream_resampler))
 
     # def on_trial(self, data):
     #     write_output(f"received trial: {data}")
@@ -119,6 +183,52 @@ if __name__ == "__main__":
         choices=["pyttsx3", "gtts", "elevenlabs", "xtts"],
         help="TTS Endpoint"
     )
+    parser.add_argument(
+        "--vad_endpoint", dest="vad_endpoint", type=str, default="silero",
+        choices=["silero", "webrtc", "webrtc_silero"],
+        help="VAD Endpoint, webrtc_silero screens frames with webrtc and confirms ambiguous ones with silero"
+    )
+    parser.add_argument(
+        "--vad_backend", dest="vad_backend", type=str, default="torch",
+        choices=["torch", "onnx"],
+        help="Silero VAD inference backend"
+    )
+    parser.add_argument(
+        "--adaptive_endpointing", dest="adaptive_endpointing", default=False, action="store_true",
+        help="Adapt the silence ending an utterance to the utterance and the speaker instead of a fixed 500 ms"
+    )
+    parser.add_argument(
+        "--utterance_compaction", dest="utterance_compaction", default=False, action="store_true",
+        help="Trim the silence around utterances and shorten their long pauses before transcription"
+    )
+    parser.add_argument(
+        "--stt_batch_window_ms", dest="stt_batch_window_ms", type=float, default=None,
+        help="Batch transcriptions of all sessions arriving within this window (ms), disabled by default"
+    )
+    parser.add_argument(
+        "--stt_streaming", dest="stt_streaming", default=False, action="store_true",
+        help="Transcribe utterances while they are spoken, emitting partial transcriptions"
+    )
+    parser.add_argument(
+        "--stt_chunking", dest="stt_chunking", default=False, action="store_true",
+        help="Split long utterances at their pauses while they are spoken and transcribe the chunks in parallel"
+    )
+    parser.add_argument(
+        "--stt_cache", dest="stt_cache", default=False, action="store_true",
+        help="Reuse the transcripts of repeated commands, matched by audio fingerprint"
+    )
+    parser.add_argument(
+        "--stt_cascade", dest="stt_cascade", default=False, action="store_true",
+        help="Transcribe short utterances with smaller whisper models, escalating unsure transcripts"
+    )
+    parser.add_argument(
+        "--keyword_spotting", dest="keyword_spotting", default=False, action="store_true",
+        help="Answer the persona's actions spoken as single keywords without STT and the bot"
+    )
+    parser.add_argument(
+        "--wake_word", dest="wake_word", type=str, default=None,
+        help="Ignore the audio until this word (a speech commands label, e.g. marvin) is spoken, disabled by default"
+    )
     parser.add_argument(
         "--port", dest="port", type=int, default=4000, help="Port number"
     )
@@ -157,6 +267,17 @@ if __name__ == "__main__":
         namespace="/",
         bot_endpoint=args.bot_endpoint,
         tts_endpoint=args.tts_endpoint,
+        stt_batch_window_ms=args.stt_batch_window_ms,
+        stt_streaming=args.stt_streaming,
+        stt_chunking=args.stt_chunking,
+        stt_cache=args.stt_cache,
+        stt_cascade=args.stt_cascade,
+        vad_endpoint=args.vad_endpoint,
+        vad_backend=args.vad_backend,
+        adaptive_endpointing=args.adaptive_endpointing,
+        utterance_compaction=args.utterance_compaction,
+        keyword_spotting=args.keyword_spotting,
+        wake_word=args.wake_word,
         device=device,
     )
     socketio.on_namespace(digital_assistant)